@@ -1,18 +1,581 @@
 import sys
-import os
-import json
-import requests
 import hashlib
 import sqlite3
+import threading
+import itertools
+import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
-                             QLineEdit, QTextEdit, QListWidget, QLabel, QStackedWidget, QFileDialog, 
+                             QLineEdit, QTextEdit, QListView, QLabel, QStackedWidget, QFileDialog, 
                              QColorDialog, QFontDialog, QInputDialog, QMessageBox, QScrollArea, QSplitter,
-                             QDialog, QDialogButtonBox, QTabWidget, QComboBox, QCheckBox)
-from PyQt6.QtGui import QIcon, QColor, QFont, QPixmap, QTextCharFormat
-from PyQt6.QtCore import Qt, QSize, QTimer
+                             QDialog, QDialogButtonBox, QTabWidget, QComboBox, QCheckBox, QProgressDialog,
+                             QListWidget, QListWidgetItem, QFrame, QStyledItemDelegate)
+from PyQt6.QtGui import QIcon, QColor, QFont, QImage, QPainter, QPalette, QPixmap, QTextCharFormat, QTextCursor
+from PyQt6.QtCore import (Qt, QSize, QMargins, QTimer, QObject, QRunnable, QThreadPool, QThread, pyqtSignal,
+                          QAbstractListModel, QModelIndex, QBuffer, QByteArray, QIODevice)
+from atmostnotes.ai import (AI_BATCH_CONCURRENCY, AI_MAX_CONCURRENT_REQUESTS, AI_REQUEST_TIMEOUT, SUGGESTIONS_PROMPT,
+                            AICache, AIRequestCancelled, GeminiClient, annotate_notes, create_embedder)
+from atmostnotes.chat import ChatSession
+from atmostnotes.diagnostics import STALL_CHECK_MS, StallDetector, format_report, recorder
+from atmostnotes.search import (build_fts_query, extends_query, parse_tag_filter, search_note_ids, tag_facets,
+                                tagged_note_ids)
+from atmostnotes.summarize import SUMMARY_PROMPT, split_chunks, summary_prompt
+from atmostnotes.store import (NoteStore, compact_revisions, decode_content, insert_note, list_revisions,
+                               notes_to_compact, reconstruct_revision, update_note)
 
-GEMINI_API_KEY = ""  # Replace with your actual API key
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent"
+AI_STREAMING = True
+AI_ERROR_PREFIX = "Error: Unable to get AI response."
+NOTE_LIST_PAGE_SIZE = 200
+SEARCH_DEBOUNCE_MS = 150
+SEARCH_NARROW_LIMIT = 5000
+AUTOSAVE_IDLE_MS = 2000
+AVATAR_SIZE = 80
+
+class AIRequestSignals(QObject):
+    chunk = pyqtSignal(int, str)
+    finished = pyqtSignal(int, str)
+
+class AIRequest(QRunnable):
+    def __init__(self, request_id, channel, prompt, timeout, fetch, cache_key=None):
+        super().__init__()
+        self.request_id = request_id
+        self.channel = channel
+        self.prompt = prompt
+        self.cache_key = cache_key
+        self.timeout = timeout
+        self.fetch = fetch
+        self.cancelled = threading.Event()
+        self.signals = AIRequestSignals()
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        try:
+            prompt = self.prompt(self.cancelled) if callable(self.prompt) else self.prompt
+        except Exception as e:
+            response = f"{AI_ERROR_PREFIX} {e}"
+        else:
+            response = self.fetch(prompt, self.timeout, self.emit_chunk if AI_STREAMING else None, self.cancelled)
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.request_id, response)
+
+    def emit_chunk(self, text):
+        # Raising here aborts the stream mid-response once the request is cancelled
+        if self.cancelled.is_set():
+            raise AIRequestCancelled()
+        self.signals.chunk.emit(self.request_id, text)
+
+class AIRequestEngine(QObject):
+    """Runs AI requests on a thread pool and hands results back to the GUI thread.
+
+    Streamed text arrives through response_chunk(request_id, channel, text) and the
+    complete text through response_ready(request_id, channel, text). A cancelled
+    request stops streaming at the next chunk and its result is dropped. Requests
+    submitted with a cache_key are answered from the cache when possible, in which
+    case response_ready is emitted before submit returns. The prompt may also be a
+    function, called on the worker thread with the request's cancelled event to
+    build the prompt text. Cancelling a request emits request_cancelled(request_id,
+    channel), after which neither of the other signals is emitted for it.
+    """
+    response_chunk = pyqtSignal(int, str, str)
+    response_ready = pyqtSignal(int, str, str)
+    request_cancelled = pyqtSignal(int, str)
+
+    def __init__(self, fetch, max_concurrent=AI_MAX_CONCURRENT_REQUESTS, cache=None, parent=None):
+        super().__init__(parent)
+        self.fetch = fetch
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_concurrent)
+        # Never retired, so the store readers of its threads are reused instead of piling up
+        self.pool.setExpiryTimeout(-1)
+        self.active = {}
+        self.ids = itertools.count(1)
+
+    def submit(self, channel, prompt, timeout=AI_REQUEST_TIMEOUT, replace=False, cache_key=None):
+        if replace:
+            self.cancel_channel(channel)
+        if self.cache and cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                request_id = next(self.ids)
+                self.response_ready.emit(request_id, channel, cached)
+                return request_id
+        request = AIRequest(next(self.ids), channel, prompt, timeout, self.fetch, cache_key)
+        request.signals.chunk.connect(self.on_chunk)
+        request.signals.finished.connect(self.on_finished)
+        self.active[request.request_id] = request
+        self.pool.start(request)
+        return request.request_id
+
+    def cancel(self, request_id):
+        request = self.active.pop(request_id, None)
+        if request:
+            request.cancelled.set()
+            self.request_cancelled.emit(request_id, request.channel)
+
+    def cancel_channel(self, channel):
+        for request_id, request in list(self.active.items()):
+            if request.channel == channel:
+                self.cancel(request_id)
+
+    def cancel_all(self):
+        for request_id in list(self.active):
+            self.cancel(request_id)
+
+    def pending(self, channel=None):
+        return sum(1 for request in self.active.values() if channel is None or request.channel == channel)
+
+    def on_chunk(self, request_id, text):
+        request = self.active.get(request_id)
+        if request and not request.cancelled.is_set():
+            self.response_chunk.emit(request_id, request.channel, text)
+
+    def on_finished(self, request_id, response):
+        request = self.active.pop(request_id, None)
+        if request and not request.cancelled.is_set():
+            if self.cache and request.cache_key and response and not response.startswith(AI_ERROR_PREFIX):
+                self.cache.put(request.cache_key, response)
+            self.response_ready.emit(request_id, request.channel, response)
+
+class AIBatchSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int, int)
+
+class AIBatchJob(QRunnable):
+    """Summarizes and tags every note of a user in the background with annotate_notes.
+
+    Emits progress(done, total) and finished(processed, skipped, failed).
+    """
+    def __init__(self, store, user_id, generate, concurrency=AI_BATCH_CONCURRENCY, timeout=AI_REQUEST_TIMEOUT,
+                 cache=None):
+        super().__init__()
+        self.store = store
+        self.user_id = user_id
+        self.generate = generate
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+        self.signals = AIBatchSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        generate = lambda prompt: self.generate(prompt, self.timeout, None, self.cancelled).replace('*', '')
+        processed, skipped, failed = annotate_notes(self.store, self.user_id, generate, self.cache, self.concurrency,
+                                                    self.signals.progress.emit, self.cancelled)
+        self.signals.finished.emit(processed, skipped, failed)
+
+class ImportSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int, int)
+    failed = pyqtSignal(str)
+
+class ImportJob(QRunnable):
+    """Imports a directory tree of notes in the background with atmostnotes.importer.
+
+    Emits progress(done, total) in files, then finished(imported, duplicates,
+    failed) or failed(message) if the notes could not be written.
+    """
+    def __init__(self, store, user_id, directory):
+        super().__init__()
+        self.store = store
+        self.user_id = user_id
+        self.directory = directory
+        self.cancelled = threading.Event()
+        self.signals = ImportSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        # The importer and its process pool are only loaded once something is imported
+        from atmostnotes.importer import import_notes
+        try:
+            result = import_notes(self.store, self.user_id, self.directory,
+                                  progress=self.signals.progress.emit, cancelled=self.cancelled)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(*result)
+
+class ExportSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+class ExportJob(QRunnable):
+    """Exports a user's notes to one archive in the background with atmostnotes.exporter.
+
+    Emits progress(done, total), then finished(exported) or failed(message).
+    """
+    def __init__(self, store, user_id, path, archive, fmt):
+        super().__init__()
+        self.store = store
+        self.user_id = user_id
+        self.path = path
+        self.archive = archive
+        self.fmt = fmt
+        self.cancelled = threading.Event()
+        self.signals = ExportSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        from atmostnotes.exporter import export_notes
+        try:
+            exported = export_notes(self.store, self.user_id, self.path, self.archive, self.fmt,
+                                    progress=self.signals.progress.emit, cancelled=self.cancelled)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(exported)
+
+class AvatarSignals(QObject):
+    loaded = pyqtSignal(int, QImage)
+
+class AvatarJob(QRunnable):
+    """Loads a user's avatar thumbnail, or stores a new picture, off the GUI thread.
+
+    Thumbnails are scaled once and cached as PNG in the avatars table; the full
+    image, in avatar_images, is only read and decoded when a thumbnail is
+    missing or a new picture is set.
+    Emits loaded(user_id, thumbnail), with a null QImage if the user has none.
+    """
+    def __init__(self, store, user_id, path=None, size=AVATAR_SIZE):
+        super().__init__()
+        self.store = store
+        self.user_id = user_id
+        self.path = path
+        self.size = size
+        self.signals = AvatarSignals()
+
+    def thumbnail(self, image_data):
+        # QImage, unlike QPixmap, may be used outside the GUI thread
+        image = QImage.fromData(image_data)
+        if image.isNull():
+            return image, None
+        image = image.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio,
+                             Qt.TransformationMode.SmoothTransformation)
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        image.save(buffer, "PNG")
+        return image, bytes(data)
+
+    def run(self):
+        if self.path:
+            try:
+                with open(self.path, "rb") as image_file:
+                    image_data = image_file.read()
+            except OSError:
+                image_data = b""
+            image, thumbnail = self.thumbnail(image_data)
+            if thumbnail:
+                self.store.write('INSERT OR REPLACE INTO avatar_images (user_id, image) VALUES (?, ?)',
+                                 (self.user_id, image_data))
+                self.store.write('INSERT OR REPLACE INTO avatars (user_id, thumbnail) VALUES (?, ?)',
+                                 (self.user_id, thumbnail))
+            self.signals.loaded.emit(self.user_id, image)
+            return
+        conn = self.store.reader()
+        row = conn.execute('SELECT thumbnail FROM avatars WHERE user_id = ?', (self.user_id,)).fetchone()
+        if row:
+            self.signals.loaded.emit(self.user_id, QImage.fromData(row[0]))
+            return
+        # Pictures moved over from the users table have no thumbnail yet
+        row = conn.execute('SELECT image FROM avatar_images WHERE user_id = ?', (self.user_id,)).fetchone()
+        image, thumbnail = self.thumbnail(row[0] if row else b"")
+        if thumbnail:
+            self.store.write('INSERT OR REPLACE INTO avatars (user_id, thumbnail) VALUES (?, ?)',
+                             (self.user_id, thumbnail))
+        self.signals.loaded.emit(self.user_id, image)
+
+class SemanticRefreshSignals(QObject):
+    finished = pyqtSignal(int)
+
+class SemanticRefreshJob(QRunnable):
+    """Brings a user's entries in the semantic index up to date in the background."""
+    def __init__(self, store, index, user_id):
+        super().__init__()
+        self.store = store
+        self.index = index
+        self.user_id = user_id
+        self.cancelled = threading.Event()
+        self.signals = SemanticRefreshSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        # Index what was saved before the job started
+        self.store.sync()
+        try:
+            embedded = self.index.refresh(self.user_id, self.cancelled)
+        except Exception:
+            embedded = 0
+        self.signals.finished.emit(embedded)
+
+class NoteListModel(QAbstractListModel):
+    """Lazily paged list of a user's notes for the sidebar QListView.
+
+    The full list is ordered by most recently updated and paged with a keyset on
+    (updated_at, id). Search results are ranked note ids fetched up front, whose
+    titles are loaded a page at a time. Rows hold (id, title) and the note id is
+    exposed under Qt.ItemDataRole.UserRole. slots maps note ids to their row
+    plus top_slot, so row_of() is a lookup and adding a note at the top does
+    not renumber every row below it.
+    """
+    def __init__(self, store, page_size=NOTE_LIST_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.page_size = page_size
+        self.user_id = None
+        self.rows = []
+        self.slots = {}
+        self.top_slot = 0
+        self.search_ids = None
+        self.cursor_key = None
+        self.exhausted = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.rows[index.row()][1]
+        if role == Qt.ItemDataRole.UserRole:
+            return self.rows[index.row()][0]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    @recorder.traced("ui.note_list.fetch_page")
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        page = self.fetch_search_page() if self.search_ids is not None else self.fetch_page()
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            for slot, (note_id, title, *_) in enumerate(page, start=self.top_slot + len(self.rows)):
+                self.slots[note_id] = slot
+                self.rows.append((note_id, title))
+            self.endInsertRows()
+
+    def fetch_page(self):
+        if self.cursor_key is None:
+            page = self.store.reader().execute('''
+                SELECT id, title, updated_at FROM notes WHERE user_id = ?
+                ORDER BY updated_at DESC, id DESC LIMIT ?
+            ''', (self.user_id, self.page_size)).fetchall()
+        else:
+            page = self.store.reader().execute('''
+                SELECT id, title, updated_at FROM notes WHERE user_id = ? AND (updated_at, id) < (?, ?)
+                ORDER BY updated_at DESC, id DESC LIMIT ?
+            ''', (self.user_id, *self.cursor_key, self.page_size)).fetchall()
+        if page:
+            self.cursor_key = (page[-1][2], page[-1][0])
+        return page
+
+    def fetch_search_page(self):
+        ids = self.search_ids[len(self.rows):len(self.rows) + self.page_size]
+        if not ids:
+            return []
+        titles = dict(self.store.reader().execute(
+            f'SELECT id, title FROM notes WHERE id IN ({",".join("?" * len(ids))})', ids).fetchall())
+        return [(note_id, titles.get(note_id, "")) for note_id in ids]
+
+    def clear(self):
+        self.beginResetModel()
+        self.user_id = None
+        self.rows = []
+        self.slots = {}
+        self.top_slot = 0
+        self.search_ids = None
+        self.cursor_key = None
+        self.exhausted = True
+        self.endResetModel()
+
+    @recorder.traced("ui.note_list.show_all")
+    def show_all(self, user_id):
+        self.beginResetModel()
+        self.user_id = user_id
+        self.rows = []
+        self.slots = {}
+        self.top_slot = 0
+        self.search_ids = None
+        self.cursor_key = None
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    @recorder.traced("ui.note_list.show_search")
+    def show_search(self, user_id, note_ids):
+        self.beginResetModel()
+        self.user_id = user_id
+        self.rows = []
+        self.slots = {}
+        self.top_slot = 0
+        self.search_ids = list(note_ids)
+        self.cursor_key = None
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def row_of(self, note_id):
+        slot = self.slots.get(note_id)
+        return -1 if slot is None else slot - self.top_slot
+
+    def note_saved(self, note_id, title):
+        row = self.row_of(note_id)
+        if self.search_ids is not None:
+            # Search results keep their rank; only the title can change in place
+            if row >= 0:
+                self.rows[row] = (note_id, title)
+                self.dataChanged.emit(self.index(row), self.index(row))
+            return
+        if row > 0:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), 0)
+            self.rows.insert(0, self.rows.pop(row))
+            # Only the rows it passed move down
+            for slot, (moved_id, _) in enumerate(self.rows[:row + 1], start=self.top_slot):
+                self.slots[moved_id] = slot
+            self.endMoveRows()
+        elif row < 0:
+            self.beginInsertRows(QModelIndex(), 0, 0)
+            self.rows.insert(0, (note_id, title))
+            self.top_slot -= 1
+            self.slots[note_id] = self.top_slot
+            self.endInsertRows()
+        self.rows[0] = (note_id, title)
+        self.dataChanged.emit(self.index(0), self.index(0))
+
+class NoteItemDelegate(QStyledItemDelegate):
+    """Pads note list rows and underlines them in the palette's highlight color.
+
+    Stands in for QListView::item stylesheet rules, so that the note list is
+    themed by its palette alone (see ThemeEngine).
+    """
+    PADDING = 5
+
+    def sizeHint(self, option, index):
+        padding = QMargins(self.PADDING, self.PADDING, self.PADDING, self.PADDING)
+        return super().sizeHint(option, index).grownBy(padding)
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        painter.save()
+        painter.setPen(option.palette.color(QPalette.ColorRole.Highlight))
+        painter.drawLine(option.rect.bottomLeft(), option.rect.bottomRight())
+        painter.restore()
+
+class Sidebar(QWidget):
+    """The sidebar panel, with a right border in the palette's highlight color.
+
+    Stands in for a QWidget#sidebar border-right stylesheet rule: the sidebar
+    holds the note list, so it is themed by its palette alone (see ThemeEngine).
+    """
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        painter = QPainter(self)
+        painter.setPen(self.palette().color(QPalette.ColorRole.Highlight))
+        rect = self.rect()
+        painter.drawLine(rect.topRight(), rect.bottomRight())
+        painter.end()
+
+class SearchWorker(QObject):
+    """Runs note searches on its own thread with its own read connection.
+
+    Requests carry a generation number; only the newest generation is executed
+    and reported, and a query still running when a newer one arrives is
+    interrupted. The connection is opened on first use and closed by close(),
+    called when the thread finishes. Once the store is closed, requests still
+    queued are dropped like superseded ones.
+    """
+    results_ready = pyqtSignal(int, str, list)
+    facets_ready = pyqtSignal(int, list)
+
+    def __init__(self, store, semantic=None):
+        super().__init__()
+        self.store = store
+        self.semantic = semantic
+        self.conn = None
+        self.latest = 0
+
+    def search(self, generation, user_id, query, candidates, tags):
+        # Without query words, lists the notes matching the tag filter
+        if self.cancelled(generation):
+            return
+        conn = self.connection()
+        try:
+            if query.strip():
+                note_ids = search_note_ids(conn, user_id, query, candidates, tags)
+            else:
+                note_ids = tagged_note_ids(conn, user_id, tags)
+        except (sqlite3.OperationalError, sqlite3.ProgrammingError):
+            # Interrupted by a newer query, or the store was closed meanwhile
+            return
+        if generation == self.latest:
+            self.results_ready.emit(generation, query, note_ids)
+            self.facets(generation, user_id, note_ids)
+
+    def semantic_search(self, generation, user_id, query, note_id, tags):
+        # With a note id, finds notes related to that note instead of to the query
+        if self.cancelled(generation) or self.semantic is None:
+            return
+        try:
+            if note_id:
+                note_ids = self.semantic.related(user_id, note_id)
+            else:
+                note_ids = self.semantic.search(user_id, query)
+            if tags:
+                tagged = set(tagged_note_ids(self.connection(), user_id, tags))
+                note_ids = [note_id for note_id in note_ids if note_id in tagged]
+        except Exception:
+            note_ids = []
+        if generation == self.latest:
+            self.results_ready.emit(generation, query, note_ids)
+            self.facets(generation, user_id, note_ids)
+
+    def facets(self, generation, user_id, note_ids):
+        # Tag counts over the listed notes, or over all of the user's notes when note_ids is None
+        if self.cancelled(generation):
+            return
+        conn = self.connection()
+        # A save that changed tags may still be queued on the writer
+        self.store.sync()
+        try:
+            facets = tag_facets(conn, user_id, note_ids)
+        except (sqlite3.OperationalError, sqlite3.ProgrammingError):
+            return
+        if generation == self.latest:
+            self.facets_ready.emit(generation, facets)
+
+    def cancelled(self, generation):
+        return generation != self.latest or self.store.closed
+
+    def connection(self):
+        # Owned rather than the store's per-thread reader, so it can be interrupted from the GUI thread
+        if self.conn is None:
+            self.conn = self.store.connect_reader()
+        return self.conn
+
+    def supersede(self, generation):
+        self.latest = generation
+        if self.conn is not None:
+            self.conn.interrupt()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
 
 class Theme:
     def __init__(self, name, background, sidebar, text, accent, button, button_text):
@@ -24,11 +587,77 @@ class Theme:
         self.button = button
         self.button_text = button_text
 
+    def colors(self):
+        return (self.background, self.sidebar, self.text, self.accent, self.button, self.button_text)
+
 class Themes:
     LIGHT = Theme("Light", "#FFFFFF", "#F0F0F0", "#333333", "#4A90E2", "#E0E0E0", "#333333")
     DARK = Theme("Dark", "#1E1E1E", "#252526", "#FFFFFF", "#007ACC", "#3C3C3C", "#FFFFFF")
     CUSTOM = Theme("Custom", "#FFFFFF", "#F0F0F0", "#333333", "#4A90E2", "#E0E0E0", "#333333")
 
+class ThemeEngine:
+    """Compiles each Theme once into a stylesheet and palettes, cached by its colors.
+
+    The window and sidebar backgrounds and the note list take their colors
+    from a palette, which only repaints. The stylesheet is set on the other
+    sections of the window, never on the note list or one of its parents: a
+    re-polished QListView lays out all of its rows again, calling into the
+    model for every one, and a widget under a stylesheet ignores its palette.
+    """
+    STYLESHEET = """
+        QWidget {{ background-color: {background}; color: {text}; }}
+        QWidget#sidebar_controls {{ background-color: {sidebar}; }}
+        QPushButton {{ background-color: {button}; color: {button_text}; border: none; padding: 10px; margin: 5px; border-radius: 5px; }}
+        QPushButton:hover {{ background-color: {accent}; }}
+        QLineEdit, QTextEdit {{ background-color: {button}; color: {text}; border: 1px solid {accent}; border-radius: 5px; padding: 5px; }}
+        QLabel {{ color: {text}; }}
+        QLabel#username_label {{ font-weight: bold; font-size: 14px; }}
+        QListView {{ background-color: {button}; border: none; }}
+        QListView::item {{ padding: 5px; border-bottom: 1px solid {accent}; }}
+        QListView::item:selected {{ background-color: {accent}; color: {button_text}; }}
+        QPushButton#save_button, QPushButton#ai_button {{ background-color: {accent}; color: {button_text}; }}
+        QTabWidget::pane {{ border: 1px solid {accent}; }}
+        QTabWidget::tab-bar {{ alignment: center; }}
+        QTabBar::tab {{ background-color: {button}; color: {button_text}; padding: 8px; }}
+        QTabBar::tab:selected {{ background-color: {accent}; }}
+        QScrollArea {{ border: none; }}
+        QComboBox {{ background-color: {button}; color: {text}; border: 1px solid {accent}; border-radius: 5px; padding: 5px; }}
+        QComboBox::drop-down {{ border: none; }}
+        QComboBox::down-arrow {{ image: url(down_arrow.png); }}
+        QComboBox QAbstractItemView {{ background-color: {background}; color: {text}; selection-background-color: {accent}; }}
+        QPushButton#toggle_button {{ background-color: transparent; color: {text}; font-size: 24px; }}
+        QPushButton#ai_toggle_button {{ background-color: {accent}; color: {button_text}; }}
+    """
+    def __init__(self):
+        self.stylesheets = {}
+        self.palettes = {}
+
+    def stylesheet(self, theme):
+        key = theme.colors()
+        if key not in self.stylesheets:
+            self.stylesheets[key] = self.STYLESHEET.format(**vars(theme))
+        return self.stylesheets[key]
+
+    def palette(self, theme, sidebar=False):
+        key = (theme.colors(), sidebar)
+        if key not in self.palettes:
+            palette = QPalette()
+            roles = {
+                QPalette.ColorRole.Window: theme.sidebar if sidebar else theme.background,
+                QPalette.ColorRole.WindowText: theme.text,
+                QPalette.ColorRole.Base: theme.button,
+                QPalette.ColorRole.AlternateBase: theme.background,
+                QPalette.ColorRole.Text: theme.text,
+                QPalette.ColorRole.Button: theme.button,
+                QPalette.ColorRole.ButtonText: theme.button_text,
+                QPalette.ColorRole.Highlight: theme.accent,
+                QPalette.ColorRole.HighlightedText: theme.button_text,
+            }
+            for role, color in roles.items():
+                palette.setColor(role, QColor(color))
+            self.palettes[key] = palette
+        return self.palettes[key]
+
 class PasswordDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -44,6 +673,12 @@ class PasswordDialog(QDialog):
         layout.addWidget(buttons)
 
 class AtmostNotes(QMainWindow):
+    search_requested = pyqtSignal(int, int, str, object, object)
+    semantic_search_requested = pyqtSignal(int, int, str, int, object)
+    facets_requested = pyqtSignal(int, int, object)
+    write_failed = pyqtSignal(str)
+    note_updated = pyqtSignal(int, int, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Atmost Notes")
@@ -51,10 +686,35 @@ class AtmostNotes(QMainWindow):
         self.current_user = None
         self.current_note_id = None
         self.current_theme = Themes.LIGHT
+        self.theme_engine = ThemeEngine()
         self.ai_enabled = True
+        self.autosave_enabled = True
+        self.note_dirty = False
+        self.loading_note = False
+        self.saved_tags = ""
+        # Pool threads each keep a store reader (see NoteStore.reader); kept alive, their number stays bounded
+        QThreadPool.globalInstance().setExpiryTimeout(-1)
         
         self.init_db()
+        self.write_failed.connect(self.show_write_error)
+        self.note_updated.connect(self.show_note_updated)
+        self.gemini = GeminiClient()
+        self.ai_engine = AIRequestEngine(self.get_ai_response, cache=self.ai_cache, parent=self)
+        self.ai_engine.response_chunk.connect(self.show_ai_chunk)
+        self.ai_engine.response_ready.connect(self.show_ai_response)
+        self.ai_engine.request_cancelled.connect(self.drop_ai_request)
+        self.ai_streams = {}
+        self.chat = None
+        self.chat_turns = {}
+        self.ai_batch = None
+        self.import_job = None
+        self.export_job = None
+        self.avatar_jobs = set()
+        self.init_semantic()
         self.init_ui()
+        self.init_search()
+        self.init_autosave()
+        self.init_diagnostics()
         self.update_styles()
     
     def init_ui(self):
@@ -62,13 +722,13 @@ class AtmostNotes(QMainWindow):
         main_layout = QHBoxLayout()
         
         # Sidebar
-        self.sidebar = QWidget()
+        self.sidebar = Sidebar()
         self.sidebar.setObjectName("sidebar")
         self.sidebar.setFixedWidth(250)
         sidebar_layout = QVBoxLayout()
         
         self.profile_pic = QLabel()
-        self.profile_pic.setFixedSize(80, 80)
+        self.profile_pic.setFixedSize(AVATAR_SIZE, AVATAR_SIZE)
         self.profile_pic.setObjectName("profile_pic")
         
         self.username_label = QLabel("Not logged in")
@@ -86,31 +746,64 @@ class AtmostNotes(QMainWindow):
         new_note_btn.clicked.connect(self.new_note)
         new_note_btn.setObjectName("sidebar_button")
         
-        search_bar = QLineEdit()
-        search_bar.setPlaceholderText("Search notes...")
-        search_bar.textChanged.connect(self.search_notes)
-        search_bar.setObjectName("search_bar")
-        
-        self.note_list = QListWidget()
-        self.note_list.itemClicked.connect(self.load_note)
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText("Search notes...")
+        self.search_bar.textChanged.connect(self.schedule_search)
+        self.search_bar.setObjectName("search_bar")
+        
+        self.semantic_check = QCheckBox("Search by meaning")
+        self.semantic_check.toggled.connect(self.toggle_semantic_search)
+        
+        self.tag_filter = QLineEdit()
+        self.tag_filter.setPlaceholderText("Filter by tags (a, b | c)")
+        self.tag_filter.textChanged.connect(self.schedule_search)
+        self.tag_filter.setObjectName("search_bar")
+        
+        # Tag counts for the listed notes; clicking one narrows the filter to it
+        self.tag_facet_list = QListWidget()
+        self.tag_facet_list.setMaximumHeight(110)
+        self.tag_facet_list.itemClicked.connect(self.add_tag_filter)
+        self.tag_facet_list.setObjectName("tag_facets")
+        
+        self.note_model = NoteListModel(self.store, parent=self)
+        self.note_list = QListView()
+        self.note_list.setModel(self.note_model)
+        self.note_list.setUniformItemSizes(True)
+        self.note_list.setFrameShape(QFrame.Shape.NoFrame)
+        self.note_list.setItemDelegate(NoteItemDelegate(self.note_list))
+        self.note_list.clicked.connect(self.load_note)
         self.note_list.setObjectName("note_list")
         
         options_btn = QPushButton("Options")
         options_btn.clicked.connect(self.show_options)
         options_btn.setObjectName("sidebar_button")
         
-        sidebar_layout.addWidget(self.profile_pic, alignment=Qt.AlignmentFlag.AlignCenter)
-        sidebar_layout.addWidget(self.username_label, alignment=Qt.AlignmentFlag.AlignCenter)
-        sidebar_layout.addWidget(login_btn)
-        sidebar_layout.addWidget(register_btn)
-        sidebar_layout.addWidget(new_note_btn)
-        sidebar_layout.addWidget(search_bar)
+        # The controls above the note list are styled as one section, apart from the list itself
+        sidebar_controls = QWidget()
+        sidebar_controls.setObjectName("sidebar_controls")
+        controls_layout = QVBoxLayout()
+        controls_layout.setContentsMargins(0, 0, 0, 0)
+        controls_layout.addWidget(self.profile_pic, alignment=Qt.AlignmentFlag.AlignCenter)
+        controls_layout.addWidget(self.username_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        controls_layout.addWidget(login_btn)
+        controls_layout.addWidget(register_btn)
+        controls_layout.addWidget(new_note_btn)
+        controls_layout.addWidget(self.search_bar)
+        controls_layout.addWidget(self.semantic_check)
+        controls_layout.addWidget(self.tag_filter)
+        controls_layout.addWidget(self.tag_facet_list)
+        sidebar_controls.setLayout(controls_layout)
+        
+        self.sidebar.setAutoFillBackground(True)
+        sidebar_layout.addWidget(sidebar_controls)
         sidebar_layout.addWidget(self.note_list)
         sidebar_layout.addWidget(options_btn)
         self.sidebar.setLayout(sidebar_layout)
         
         # Main content area
         content_widget = QWidget()
+        content_widget.setObjectName("content_area")
+        content_widget.setAttribute(Qt.WidgetAttribute.WA_StyledBackground)
         content_layout = QVBoxLayout()
         
         # Top bar
@@ -165,9 +858,18 @@ class AtmostNotes(QMainWindow):
         formatting_layout.addWidget(underline_btn)
         formatting_layout.addWidget(bullet_list_btn)
         formatting_layout.addWidget(numbered_list_btn)
+        self.related_btn = QPushButton("Related")
+        self.related_btn.clicked.connect(self.show_related_notes)
+        formatting_layout.addWidget(self.related_btn)
+        history_btn = QPushButton("History")
+        history_btn.clicked.connect(self.show_note_history)
+        formatting_layout.addWidget(history_btn)
         
         self.content_edit = QTextEdit()
         self.content_edit.setObjectName("content_edit")
+        self.content_edit.document().contentsChange.connect(self.mark_note_dirty)
+        self.title_edit.textEdited.connect(self.mark_note_dirty)
+        self.tag_edit.textEdited.connect(self.mark_note_dirty)
         
         save_btn = QPushButton("Save")
         save_btn.clicked.connect(self.save_note)
@@ -180,7 +882,26 @@ class AtmostNotes(QMainWindow):
         note_layout.addWidget(save_btn)
         note_area.setLayout(note_layout)
         
-        # AI Assistant panel
+        note_edit_widget.addWidget(note_area)
+        self.note_edit_widget = note_edit_widget
+        self.content_stack.addWidget(note_edit_widget)
+        # The AI panel and the options page are built on first use, see ensure_ai_panel and ensure_options_page
+        self.ai_panel = None
+        self.options_page = None
+        
+        content_layout.addWidget(self.content_stack)
+        content_widget.setLayout(content_layout)
+        
+        main_layout.addWidget(self.sidebar)
+        main_layout.addWidget(content_widget)
+        
+        main_widget.setLayout(main_layout)
+        self.setCentralWidget(main_widget)
+        self.styled_sections = [sidebar_controls, options_btn, content_widget]
+    
+    def ensure_ai_panel(self):
+        if self.ai_panel is not None:
+            return self.ai_panel
         ai_panel = QTabWidget()
         ai_panel.setObjectName("ai_panel")
         
@@ -197,8 +918,15 @@ class AtmostNotes(QMainWindow):
         self.ai_input.returnPressed.connect(self.send_ai_message)
         self.ai_input.setObjectName("ai_input")
         
+        self.chat_notes_check = QCheckBox("Answer from my notes")
+        self.chat_notes_check.setChecked(True)
+        self.chat_stats_label = QLabel()
+        self.chat_stats_label.setObjectName("chat_stats")
+        
         chat_layout.addWidget(self.ai_chat)
+        chat_layout.addWidget(self.chat_notes_check)
         chat_layout.addWidget(self.ai_input)
+        chat_layout.addWidget(self.chat_stats_label)
         chat_tab.setLayout(chat_layout)
         
         # Summary tab
@@ -247,14 +975,18 @@ class AtmostNotes(QMainWindow):
         ai_panel.addTab(summary_tab, "Summary")
         ai_panel.addTab(suggestions_tab, "Suggestions")
         
-        note_edit_widget.addWidget(note_area)
-        note_edit_widget.addWidget(ai_panel)
-        note_edit_widget.setStretchFactor(0, 2)
-        note_edit_widget.setStretchFactor(1, 1)
-        
-        self.content_stack.addWidget(note_edit_widget)
-        
-        # Options page
+        self.note_edit_widget.addWidget(ai_panel)
+        self.note_edit_widget.setStretchFactor(0, 2)
+        self.note_edit_widget.setStretchFactor(1, 1)
+        width = self.note_edit_widget.width()
+        self.note_edit_widget.setSizes([width * 2 // 3, width // 3])
+        ai_panel.setVisible(self.ai_enabled)
+        self.ai_panel = ai_panel
+        return ai_panel
+
+    def ensure_options_page(self):
+        if self.options_page is not None:
+            return self.options_page
         options_widget = QScrollArea()
         options_content = QWidget()
         options_layout = QVBoxLayout()
@@ -292,6 +1024,14 @@ class AtmostNotes(QMainWindow):
         import_notes_btn.clicked.connect(self.import_notes)
         import_notes_btn.setObjectName("options_button")
         
+        batch_ai_btn = QPushButton("Summarize && Tag All Notes")
+        batch_ai_btn.clicked.connect(self.start_ai_batch)
+        batch_ai_btn.setObjectName("options_button")
+        
+        autosave_check = QCheckBox("Autosave notes")
+        autosave_check.setChecked(self.autosave_enabled)
+        autosave_check.toggled.connect(self.set_autosave)
+        
         options_layout.addWidget(change_username_btn)
         options_layout.addWidget(change_password_btn)
         options_layout.addWidget(change_profile_pic_btn)
@@ -301,44 +1041,86 @@ class AtmostNotes(QMainWindow):
         options_layout.addWidget(change_font_btn)
         options_layout.addWidget(export_notes_btn)
         options_layout.addWidget(import_notes_btn)
+        options_layout.addWidget(batch_ai_btn)
+        options_layout.addWidget(autosave_check)
         options_layout.addStretch()
         options_content.setLayout(options_layout)
         options_widget.setWidget(options_content)
         options_widget.setWidgetResizable(True)
         
-        self.content_stack.addWidget(options_widget)
+        options_page = QTabWidget()
+        options_page.addTab(options_widget, "General")
+        options_page.addTab(self.build_diagnostics_tab(), "Diagnostics")
+        options_page.currentChanged.connect(self.refresh_diagnostics)
         
-        content_layout.addWidget(self.content_stack)
-        content_widget.setLayout(content_layout)
-        
-        main_layout.addWidget(self.sidebar)
-        main_layout.addWidget(content_widget)
-        
-        main_widget.setLayout(main_layout)
-        self.setCentralWidget(main_widget)
-    
+        self.content_stack.addWidget(options_page)
+        self.options_page = options_page
+        return options_page
+
+    def build_diagnostics_tab(self):
+        diagnostics_tab = QWidget()
+        diagnostics_layout = QVBoxLayout()
+        
+        self.diagnostics_check = QCheckBox("Record performance diagnostics")
+        self.diagnostics_check.setChecked(recorder.enabled)
+        self.diagnostics_check.toggled.connect(self.set_diagnostics)
+        
+        self.diagnostics_text = QTextEdit()
+        self.diagnostics_text.setReadOnly(True)
+        self.diagnostics_text.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        self.diagnostics_text.setObjectName("diagnostics_text")
+        report_font = QFont("Monospace")
+        report_font.setStyleHint(QFont.StyleHint.TypeWriter)
+        self.diagnostics_text.setFont(report_font)
+        
+        diagnostics_buttons = QHBoxLayout()
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.refresh_diagnostics)
+        refresh_btn.setObjectName("options_button")
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self.reset_diagnostics)
+        reset_btn.setObjectName("options_button")
+        export_btn = QPushButton("Export Report")
+        export_btn.clicked.connect(self.export_diagnostics)
+        export_btn.setObjectName("options_button")
+        diagnostics_buttons.addWidget(refresh_btn)
+        diagnostics_buttons.addWidget(reset_btn)
+        diagnostics_buttons.addWidget(export_btn)
+        
+        diagnostics_layout.addWidget(self.diagnostics_check)
+        diagnostics_layout.addWidget(self.diagnostics_text)
+        diagnostics_layout.addLayout(diagnostics_buttons)
+        diagnostics_tab.setLayout(diagnostics_layout)
+        return diagnostics_tab
+
     def init_db(self):
-        self.conn = sqlite3.connect('atmostnotes.db')
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notes (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER,
-                title TEXT,
-                content TEXT,
-                tags TEXT
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                username TEXT,
-                password TEXT,
-                profile_pic BLOB
-            )
-        ''')
-        self.conn.commit()
-    
+        self.store = NoteStore()
+        self.ai_cache = AICache(self.store)
+        QTimer.singleShot(0, self.compact_note_history)
+
+    def compact_note_history(self):
+        # Maintenance on the writer thread, one note at a time and only while no save is waiting;
+        # sync() does not wait for it. Notes already compacted are not looked at again.
+        def compact(lookup):
+            if not lookup.cancelled() and lookup.exception() is None:
+                for note_id in lookup.result():
+                    self.report_write_errors(self.store.submit_maintenance(compact_revisions, note_id))
+
+        if self.store.closed:
+            # The window was closed before the event loop got to this
+            return
+        self.report_write_errors(self.store.submit_maintenance(notes_to_compact)).add_done_callback(compact)
+
+    def report_write_errors(self, future):
+        # Writes finish on the store's writer thread; failures are shown back on the GUI thread
+        # Maintenance still queued when the store closes is cancelled, which is not a failure
+        future.add_done_callback(lambda done: not done.cancelled() and done.exception()
+                                 and self.write_failed.emit(str(done.exception())))
+        return future
+
+    def show_write_error(self, message):
+        QMessageBox.warning(self, "Error", f"Could not save changes: {message}")
+
     def toggle_sidebar(self):
         if self.sidebar.isVisible():
             self.sidebar.hide()
@@ -348,30 +1130,38 @@ class AtmostNotes(QMainWindow):
     def toggle_ai(self):
         self.ai_enabled = not self.ai_enabled
         self.ai_toggle_btn.setText("AI: ON" if self.ai_enabled else "AI: OFF")
+        if not self.ai_enabled:
+            self.ai_engine.cancel_all()
         self.update_ai_panel_visibility()
 
     def update_ai_panel_visibility(self):
-        note_edit_widget = self.content_stack.widget(0)
-        ai_panel = note_edit_widget.widget(1)
-        ai_panel.setVisible(self.ai_enabled)
+        if self.ai_enabled:
+            self.ensure_ai_panel().show()
+        elif self.ai_panel is not None:
+            self.ai_panel.hide()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.ai_panel is None and self.ai_enabled:
+            # Built right after the first frame, so the AI tabs never delay it
+            QTimer.singleShot(0, self.update_ai_panel_visibility)
 
     def login(self):
         username, ok = QInputDialog.getText(self, "Login", "Enter your username:")
         if ok and username:
-            self.cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            user = self.cursor.fetchone()
+            user = self.store.reader().execute('SELECT id, password FROM users WHERE username = ?', (username,)).fetchone()
             if user:
                 password, ok = QInputDialog.getText(self, "Login", "Enter your password:", QLineEdit.EchoMode.Password)
                 if ok:
                     hashed_password = hashlib.sha256(password.encode()).hexdigest()
-                    if hashed_password == user[2]:
+                    if hashed_password == user[1]:
+                        self.flush_autosave()
+                        self.clear_editor()
                         self.current_user = user[0]
                         self.username_label.setText(username)
-                        if user[3]:
-                            pixmap = QPixmap()
-                            pixmap.loadFromData(user[3])
-                            self.profile_pic.setPixmap(pixmap.scaled(80, 80, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+                        self.load_avatar()
                         self.update_note_list()
+                        self.refresh_semantic_index()
                     else:
                         QMessageBox.warning(self, "Login Failed", "Incorrect password.")
             else:
@@ -380,8 +1170,7 @@ class AtmostNotes(QMainWindow):
     def register(self):
         username, ok = QInputDialog.getText(self, "Register", "Enter a username:")
         if ok and username:
-            self.cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            if self.cursor.fetchone():
+            if self.store.reader().execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
                 QMessageBox.warning(self, "Registration Failed", "Username already exists.")
             else:
                 password_dialog = PasswordDialog(self)
@@ -391,21 +1180,17 @@ class AtmostNotes(QMainWindow):
                     
                     # Profile picture upload
                     file_name, _ = QFileDialog.getOpenFileName(self, "Select Profile Picture", "", "Image Files (*.png *.jpg *.bmp)")
-                    if file_name:
-                        with open(file_name, "rb") as image_file:
-                            image_data = image_file.read()
-                    else:
-                        image_data = None
                     
-                    self.cursor.execute('INSERT INTO users (username, password, profile_pic) VALUES (?, ?, ?)', 
-                                        (username, hashed_password, image_data))
-                    self.conn.commit()
-                    self.current_user = self.cursor.lastrowid
+                    try:
+                        self.flush_autosave()
+                        self.current_user = self.store.write('INSERT INTO users (username, password) VALUES (?, ?)',
+                                                             (username, hashed_password)).result()
+                    except sqlite3.IntegrityError:
+                        QMessageBox.warning(self, "Registration Failed", "Username already exists.")
+                        return
+                    self.clear_editor()
                     self.username_label.setText(username)
-                    if image_data:
-                        pixmap = QPixmap()
-                        pixmap.loadFromData(image_data)
-                        self.profile_pic.setPixmap(pixmap.scaled(80, 80, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+                    self.load_avatar(file_name or None)
                     self.update_note_list()
                     QMessageBox.information(self, "Registration Successful", "Your account has been created.")
 
@@ -413,76 +1198,280 @@ class AtmostNotes(QMainWindow):
         if not self.current_user:
             QMessageBox.warning(self, "Not Logged In", "Please log in to create a note.")
             return
+        self.flush_autosave()
+        self.clear_editor()
+        self.content_stack.setCurrentIndex(0)
+
+    def clear_editor(self):
+        # Called once any pending save is flushed; nothing left in the editor is saved after this
+        self.autosave_timer.stop()
+        self.loading_note = True
         self.title_edit.clear()
         self.tag_edit.clear()
         self.content_edit.clear()
+        self.loading_note = False
+        self.saved_tags = ""
+        self.note_dirty = False
         self.current_note_id = None
-        self.content_stack.setCurrentIndex(0)
+        self.cancel_note_ai_requests()
 
     def save_note(self):
         if not self.current_user:
             QMessageBox.warning(self, "Not Logged In", "Please log in to save a note.")
             return
+        self.persist_note()
+        QMessageBox.information(self, "Success", "Note saved successfully.")
+
+    @recorder.traced("ui.save_note")
+    def persist_note(self):
         title = self.title_edit.text()
         content = self.content_edit.toHtml()
         tags = self.tag_edit.text()
         
         if self.current_note_id:
-            self.cursor.execute('''
-                UPDATE notes SET title = ?, content = ?, tags = ?
-                WHERE id = ? AND user_id = ?
-            ''', (title, content, tags, self.current_note_id, self.current_user))
+            # Compression and the revision delta are computed on the store's writer thread
+            note_id, user_id = self.current_note_id, self.current_user
+
+            def updated(done):
+                # update_note() returns False when no row changed; the list then stays as it is
+                if not done.cancelled() and done.exception() is None and done.result():
+                    self.note_updated.emit(user_id, note_id, title)
+
+            self.report_write_errors(self.store.submit(update_note, note_id, user_id, title, content, tags)
+                                     ).add_done_callback(updated)
         else:
-            self.cursor.execute('''
-                INSERT INTO notes (user_id, title, content, tags)
-                VALUES (?, ?, ?, ?)
-            ''', (self.current_user, title, content, tags))
-            self.current_note_id = self.cursor.lastrowid
-        
-        self.conn.commit()
-        self.update_note_list()
-        QMessageBox.information(self, "Success", "Note saved successfully.")
+            # The new id is needed right away; in WAL mode this waits for the write, not for fsync
+            self.current_note_id = self.store.submit(insert_note, self.current_user, title, content, tags).result()
+            self.note_model.note_saved(self.current_note_id, title)
+        
+        self.note_dirty = False
+        self.last_search = None
+        if tags != self.saved_tags:
+            self.saved_tags = tags
+            self.refresh_tag_facets()
+        self.refresh_semantic_index()
+
+    def show_note_updated(self, user_id, note_id, title):
+        # A save finished on the writer thread; the user may have logged out since
+        if user_id == self.current_user:
+            self.note_model.note_saved(note_id, title)
+
+    def show_note_history(self):
+        if not self.current_note_id:
+            return
+        self.flush_autosave()
+        self.store.sync()
+        revisions = list_revisions(self.store.reader(), self.current_note_id)
+        if not revisions:
+            QMessageBox.information(self, "History", "This note has no earlier versions.")
+            return
+        labels = [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at)) for _, created_at in revisions]
+        label, ok = QInputDialog.getItem(self, "History", "Restore the version saved before:", labels, 0, False)
+        if ok:
+            # The restored body is saved as a new version, so the current one stays in the history
+            self.content_edit.setHtml(reconstruct_revision(self.store.reader(), revisions[labels.index(label)][0]))
+
+    def init_autosave(self):
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(AUTOSAVE_IDLE_MS)
+        self.autosave_timer.timeout.connect(self.flush_autosave)
 
-    def load_note(self, item):
+    def set_autosave(self, enabled):
+        self.autosave_enabled = enabled
+        if enabled and self.note_dirty:
+            self.autosave_timer.start()
+        elif not enabled:
+            self.autosave_timer.stop()
+
+    def mark_note_dirty(self, *args):
+        if self.loading_note or not self.current_user:
+            return
+        self.note_dirty = True
+        if self.autosave_enabled:
+            # Saves once typing has been idle for AUTOSAVE_IDLE_MS
+            self.autosave_timer.start()
+
+    def flush_autosave(self):
+        self.autosave_timer.stop()
+        if not (self.autosave_enabled and self.note_dirty and self.current_user):
+            return
+        if not self.current_note_id and not self.title_edit.text() and not self.content_edit.toPlainText().strip():
+            # Don't create a note until there is something in it
+            return
+        self.persist_note()
+
+    @recorder.traced("ui.load_note")
+    def load_note(self, index):
         if not self.current_user:
             return
-        title = item.text()
-        self.cursor.execute('SELECT * FROM notes WHERE user_id = ? AND title = ?', (self.current_user, title))
-        note = self.cursor.fetchone()
+        note_id = index.data(Qt.ItemDataRole.UserRole)
+        self.flush_autosave()
+        # Read our own writes: a save of this note may still be queued
+        self.store.sync()
+        note = self.store.reader().execute('SELECT title, content, tags, summary FROM notes WHERE id = ? AND user_id = ?',
+                                           (note_id, self.current_user)).fetchone()
         
         if note:
-            self.current_note_id = note[0]
-            self.title_edit.setText(note[2])
-            self.content_edit.setHtml(note[3])
-            self.tag_edit.setText(note[4])
+            if note_id != self.current_note_id:
+                self.cancel_note_ai_requests()
+            self.current_note_id = note_id
+            self.loading_note = True
+            self.title_edit.setText(note[0])
+            self.content_edit.setHtml(decode_content(note[1]))
+            self.tag_edit.setText(note[2])
+            self.saved_tags = note[2]
+            self.loading_note = False
+            self.note_dirty = False
+            if not self.ai_engine.pending("summary"):
+                self.ensure_ai_panel()
+                self.summary_text.setPlainText(note[3] or "")
             self.content_stack.setCurrentIndex(0)
 
+    def init_search(self):
+        self.search_generation = 0
+        self.last_search = None
+        self.search_tags = []
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(lambda: self.search_notes(self.search_bar.text()))
+        self.search_thread = QThread(self)
+        self.search_worker = SearchWorker(self.store, self.semantic)
+        self.search_worker.moveToThread(self.search_thread)
+        self.search_requested.connect(self.search_worker.search)
+        self.semantic_search_requested.connect(self.search_worker.semantic_search)
+        self.facets_requested.connect(self.search_worker.facets)
+        self.search_worker.results_ready.connect(self.show_search_results)
+        self.search_worker.facets_ready.connect(self.show_tag_facets)
+        # Direct, so the connection is closed on the search thread as it finishes
+        self.search_thread.finished.connect(self.search_worker.close, Qt.ConnectionType.DirectConnection)
+        self.search_thread.start()
+
+    def schedule_search(self, query):
+        # Restarting the timer on every keystroke only searches once typing pauses
+        self.search_timer.start()
+
     def search_notes(self, query):
         if not self.current_user:
             return
-        self.cursor.execute('''
-            SELECT title FROM notes
-            WHERE user_id = ? AND (title LIKE ? OR content LIKE ? OR tags LIKE ?)
-        ''', (self.current_user, f'%{query}%', f'%{query}%', f'%{query}%'))
-        results = self.cursor.fetchall()
-        
-        self.note_list.clear()
-        for result in results:
-            self.note_list.addItem(result[0])
+        self.search_timer.stop()
+        self.search_generation += 1
+        self.search_worker.supersede(self.search_generation)
+        self.search_tags = parse_tag_filter(self.tag_filter.text())
+        if self.semantic_check.isChecked() and query.strip():
+            self.semantic_search_requested.emit(self.search_generation, self.current_user, query, 0, self.search_tags)
+            return
+        if self.search_tags and not query.strip():
+            self.search_requested.emit(self.search_generation, self.current_user, query, None, self.search_tags)
+            return
+        if not build_fts_query(query):
+            self.last_search = None
+            if not query.strip():
+                self.update_note_list()
+            else:
+                self.note_model.clear()
+            return
+        candidates = None
+        if (self.last_search and extends_query(query, self.last_search[0]) and self.last_search[2] == self.search_tags
+                and len(self.last_search[1]) <= SEARCH_NARROW_LIMIT):
+            candidates = self.last_search[1]
+        self.search_requested.emit(self.search_generation, self.current_user, query, candidates, self.search_tags)
+
+    def show_search_results(self, generation, query, note_ids):
+        if generation != self.search_generation:
+            return
+        # Semantic results are ranked by similarity, so a longer query cannot be narrowed within them
+        self.last_search = None if self.semantic_check.isChecked() or not query else (query, note_ids, self.search_tags)
+        self.note_model.show_search(self.current_user, note_ids)
 
+    @recorder.traced("ui.tag_facets")
+    def show_tag_facets(self, generation, facets):
+        if generation != self.search_generation:
+            return
+        self.tag_facet_list.clear()
+        for name, count in facets:
+            item = QListWidgetItem(f"{name} ({count})")
+            item.setData(Qt.ItemDataRole.UserRole, name)
+            self.tag_facet_list.addItem(item)
+
+    def refresh_tag_facets(self):
+        if self.current_user:
+            self.facets_requested.emit(self.search_generation, self.current_user, self.note_model.search_ids)
+
+    def add_tag_filter(self, item):
+        text = self.tag_filter.text().strip().rstrip(",")
+        name = item.data(Qt.ItemDataRole.UserRole)
+        self.tag_filter.setText(f"{text}, {name}" if text else name)
+
+    def init_semantic(self):
+        self.semantic_job = None
+        self.semantic_stale = False
+        self.semantic = None
+        self.semantic_loaded = False
+
+    def ensure_semantic(self):
+        # numpy and the embedder are loaded once a user needs the index, not at startup
+        if not self.semantic_loaded:
+            self.semantic_loaded = True
+            try:
+                from atmostnotes.semantic import SemanticIndex
+                self.semantic = SemanticIndex(self.store, create_embedder(client=self.gemini))
+            except (ImportError, RuntimeError, OSError):
+                # Semantic search is optional; it needs numpy (and the chosen embedder's dependencies)
+                self.semantic_check.setEnabled(False)
+                self.related_btn.setEnabled(False)
+            self.search_worker.semantic = self.semantic
+        return self.semantic
+
+    def refresh_semantic_index(self):
+        if not self.current_user or self.ensure_semantic() is None:
+            return
+        if self.semantic_job:
+            # Runs again once the current refresh is done
+            self.semantic_stale = True
+            return
+        self.semantic_stale = False
+        self.semantic_job = SemanticRefreshJob(self.store, self.semantic, self.current_user)
+        self.semantic_job.signals.finished.connect(self.finish_semantic_refresh)
+        QThreadPool.globalInstance().start(self.semantic_job)
+
+    def finish_semantic_refresh(self, embedded):
+        self.semantic_job = None
+        if self.semantic_stale:
+            self.refresh_semantic_index()
+
+    def toggle_semantic_search(self, checked):
+        if checked:
+            self.ensure_semantic()
+        self.last_search = None
+        self.search_notes(self.search_bar.text())
+
+    def show_related_notes(self):
+        if not (self.current_user and self.current_note_id and self.ensure_semantic()):
+            return
+        self.search_timer.stop()
+        self.search_generation += 1
+        self.search_worker.supersede(self.search_generation)
+        self.semantic_search_requested.emit(self.search_generation, self.current_user, "", self.current_note_id, [])
+
+    @recorder.traced("ui.update_note_list")
     def update_note_list(self):
+        # Results of a search still in flight no longer apply
+        self.search_generation += 1
+        self.search_worker.supersede(self.search_generation)
+        self.last_search = None
         if not self.current_user:
-            self.note_list.clear()
+            self.note_model.clear()
+            self.tag_facet_list.clear()
             return
-        self.cursor.execute('SELECT title FROM notes WHERE user_id = ?', (self.current_user,))
-        notes = self.cursor.fetchall()
-        
-        self.note_list.clear()
-        for note in notes:
-            self.note_list.addItem(note[0])
+        self.store.sync()
+        self.note_model.show_all(self.current_user)
+        self.refresh_tag_facets()
 
     def show_options(self):
-        self.content_stack.setCurrentIndex(1)
+        self.content_stack.setCurrentWidget(self.ensure_options_page())
+        self.refresh_diagnostics()
 
     def change_username(self):
         if not self.current_user:
@@ -490,8 +1479,11 @@ class AtmostNotes(QMainWindow):
             return
         new_username, ok = QInputDialog.getText(self, "Change Username", "Enter new username:")
         if ok and new_username:
-            self.cursor.execute('UPDATE users SET username = ? WHERE id = ?', (new_username, self.current_user))
-            self.conn.commit()
+            try:
+                self.store.write('UPDATE users SET username = ? WHERE id = ?', (new_username, self.current_user)).result()
+            except sqlite3.IntegrityError:
+                QMessageBox.warning(self, "Error", "Username already exists.")
+                return
             self.username_label.setText(new_username)
 
     def change_password(self):
@@ -500,16 +1492,17 @@ class AtmostNotes(QMainWindow):
             return
         old_password, ok = QInputDialog.getText(self, "Change Password", "Enter current password:", QLineEdit.EchoMode.Password)
         if ok:
-            self.cursor.execute('SELECT password FROM users WHERE id = ?', (self.current_user,))
-            current_hashed_password = self.cursor.fetchone()[0]
+            self.store.sync()
+            current_hashed_password = self.store.reader().execute('SELECT password FROM users WHERE id = ?',
+                                                                  (self.current_user,)).fetchone()[0]
             if hashlib.sha256(old_password.encode()).hexdigest() == current_hashed_password:
                 new_password, ok = QInputDialog.getText(self, "Change Password", "Enter new password:", QLineEdit.EchoMode.Password)
                 if ok:
                     confirm_password, ok = QInputDialog.getText(self, "Change Password", "Confirm new password:", QLineEdit.EchoMode.Password)
                     if ok and new_password == confirm_password:
                         hashed_new_password = hashlib.sha256(new_password.encode()).hexdigest()
-                        self.cursor.execute('UPDATE users SET password = ? WHERE id = ?', (hashed_new_password, self.current_user))
-                        self.conn.commit()
+                        self.report_write_errors(self.store.write('UPDATE users SET password = ? WHERE id = ?',
+                                                                  (hashed_new_password, self.current_user)))
                         QMessageBox.information(self, "Success", "Password changed successfully.")
                     else:
                         QMessageBox.warning(self, "Error", "Passwords do not match.")
@@ -522,13 +1515,24 @@ class AtmostNotes(QMainWindow):
             return
         file_name, _ = QFileDialog.getOpenFileName(self, "Select Profile Picture", "", "Image Files (*.png *.jpg *.bmp)")
         if file_name:
-            with open(file_name, "rb") as image_file:
-                image_data = image_file.read()
-            self.cursor.execute('UPDATE users SET profile_pic = ? WHERE id = ?', (image_data, self.current_user))
-            self.conn.commit()
-            pixmap = QPixmap()
-            pixmap.loadFromData(image_data)
-            self.profile_pic.setPixmap(pixmap.scaled(80, 80, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+            self.load_avatar(file_name)
+
+    def load_avatar(self, path=None):
+        # With a path the picture is replaced; either way decoding and scaling happen on a worker thread
+        job = AvatarJob(self.store, self.current_user, path)
+        job.signals.loaded.connect(self.show_avatar)
+        # Keep the job alive until it reports back
+        self.avatar_jobs.add(job)
+        job.signals.loaded.connect(lambda *args: self.avatar_jobs.discard(job))
+        QThreadPool.globalInstance().start(job)
+
+    def show_avatar(self, user_id, image):
+        if user_id != self.current_user:
+            return
+        if image.isNull():
+            self.profile_pic.clear()
+        else:
+            self.profile_pic.setPixmap(QPixmap.fromImage(image))
 
     def change_theme(self, theme_name):
         if theme_name == "Light":
@@ -564,40 +1568,89 @@ class AtmostNotes(QMainWindow):
     def change_font(self):
         font, ok = QFontDialog.getFont()
         if ok:
+            # Fonts are inherited without restyling; the stylesheets do not depend on them
             self.setFont(font)
-            self.update_styles()
 
     def export_notes(self):
         if not self.current_user:
             QMessageBox.warning(self, "Not Logged In", "Please log in to export notes.")
             return
-        directory = QFileDialog.getExistingDirectory(self, "Select Export Directory")
-        if directory:
-            self.cursor.execute('SELECT * FROM notes WHERE user_id = ?', (self.current_user,))
-            notes = self.cursor.fetchall()
-            for note in notes:
-                with open(os.path.join(directory, f"{note[2]}.html"), "w", encoding="utf-8") as f:
-                    f.write(note[3])
-            QMessageBox.information(self, "Export Complete", "Notes exported successfully!")
+        if self.export_job:
+            return
+        formats = {
+            "Markdown files in a zip archive (*.zip)": ("zip", "markdown", ".zip"),
+            "HTML files in a zip archive (*.zip)": ("zip", "html", ".zip"),
+            "Markdown files in a tar archive (*.tar.gz)": ("tar", "markdown", ".tar.gz"),
+            "HTML files in a tar archive (*.tar.gz)": ("tar", "html", ".tar.gz"),
+            "JSON Lines (*.jsonl)": ("jsonl", "html", ".jsonl"),
+        }
+        path, selected = QFileDialog.getSaveFileName(self, "Export Notes", "notes.zip", ";;".join(formats))
+        if path:
+            archive, fmt, extension = formats.get(selected, ("zip", "markdown", ".zip"))
+            if not path.endswith(extension):
+                path += extension
+            self.export_job = ExportJob(self.store, self.current_user, path, archive, fmt)
+            self.export_progress = QProgressDialog("Exporting notes...", "Cancel", 0, 0, self)
+            self.export_progress.setMinimumDuration(500)
+            self.export_progress.canceled.connect(self.export_job.cancel)
+            self.export_job.signals.progress.connect(self.show_export_progress)
+            self.export_job.signals.finished.connect(self.finish_export)
+            self.export_job.signals.failed.connect(self.fail_export)
+            self.store.sync()
+            QThreadPool.globalInstance().start(self.export_job)
+
+    def show_export_progress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+
+    def finish_export(self, exported):
+        cancelled = self.export_job.cancelled.is_set()
+        self.export_job = None
+        self.export_progress.close()
+        if not cancelled:
+            QMessageBox.information(self, "Export Complete", f"Exported {exported} notes.")
+
+    def fail_export(self, message):
+        self.export_job = None
+        self.export_progress.close()
+        QMessageBox.warning(self, "Export Failed", f"Could not export notes: {message}")
 
     def import_notes(self):
         if not self.current_user:
             QMessageBox.warning(self, "Not Logged In", "Please log in to import notes.")
             return
+        if self.import_job:
+            return
         directory = QFileDialog.getExistingDirectory(self, "Select Import Directory")
         if directory:
-            for filename in os.listdir(directory):
-                if filename.endswith(".html"):
-                    with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
-                        content = f.read()
-                        title = os.path.splitext(filename)[0]
-                        self.cursor.execute('''
-                            INSERT INTO notes (user_id, title, content, tags)
-                            VALUES (?, ?, ?, ?)
-                        ''', (self.current_user, title, content, ""))
-            self.conn.commit()
-            self.update_note_list()
-            QMessageBox.information(self, "Import Complete", "Notes imported successfully!")
+            self.import_job = ImportJob(self.store, self.current_user, directory)
+            self.import_progress = QProgressDialog("Importing notes...", "Cancel", 0, 0, self)
+            self.import_progress.setMinimumDuration(500)
+            self.import_progress.canceled.connect(self.import_job.cancel)
+            self.import_job.signals.progress.connect(self.show_import_progress)
+            self.import_job.signals.finished.connect(self.finish_import)
+            self.import_job.signals.failed.connect(self.fail_import)
+            QThreadPool.globalInstance().start(self.import_job)
+
+    def show_import_progress(self, done, total):
+        self.import_progress.setMaximum(total)
+        self.import_progress.setValue(done)
+
+    def finish_import(self, imported, duplicates, failed):
+        self.import_job = None
+        self.import_progress.close()
+        self.update_note_list()
+        self.refresh_semantic_index()
+        message = f"Imported {imported} notes, skipped {duplicates} duplicates."
+        if failed:
+            message += f" {failed} files could not be read."
+        QMessageBox.information(self, "Import Complete", message)
+
+    def fail_import(self, message):
+        self.import_job = None
+        self.import_progress.close()
+        self.update_note_list()
+        self.show_write_error(message)
 
     def format_text(self, format_type):
         cursor = self.content_edit.textCursor()
@@ -652,12 +1705,33 @@ class AtmostNotes(QMainWindow):
         if not self.ai_enabled:
             return
         user_message = self.ai_input.text()
+        if not user_message.strip():
+            return
         self.ai_chat.append(f"You: {user_message}")
         self.ai_input.clear()
 
-        # Get AI response
-        ai_response = self.get_ai_response(user_message)
-        self.ai_chat.append(f"AI: {ai_response}")
+        if not (self.current_user and self.chat_notes_check.isChecked()):
+            self.ai_engine.submit("chat", user_message)
+            return
+        if self.chat is None or self.chat.user_id != self.current_user:
+            self.chat = ChatSession(self.store, self.current_user, self.ensure_semantic())
+        build_prompt, stats = self.chat.prepare(user_message)
+        request_id = self.ai_engine.submit("chat", build_prompt)
+        self.chat_turns[request_id] = (self.chat, user_message, stats)
+
+    def record_chat_turn(self, request_id, response):
+        chat, user_message, stats = self.chat_turns.pop(request_id)
+        if chat is not self.chat or not response or response.startswith(AI_ERROR_PREFIX):
+            return
+        chat.record(user_message, response, stats)
+        self.chat_stats_label.setText(
+            f"Sent ~{stats['prompt_tokens']} tokens: {stats['notes']} notes in ~{stats['context_tokens']}, "
+            f"history ~{stats['history_tokens']}. This chat: ~{chat.tokens_sent()} tokens")
+        fold_prompt = chat.fold_prompt()
+        if fold_prompt:
+            # Older turns are summarized in the background; the next prompt carries them verbatim until then
+            request_id = self.ai_engine.submit("chat_history", fold_prompt)
+            self.chat_turns[request_id] = (chat, None, None)
 
     def summarize_note(self):
         if not self.ai_enabled:
@@ -667,9 +1741,18 @@ class AtmostNotes(QMainWindow):
             return
         
         note_content = self.content_edit.toPlainText()
-        prompt = f"Please summarize the following note:\n\n{note_content}"
-        summary = self.get_ai_response(prompt)
-        self.summary_text.setPlainText(summary)
+        parts = len(split_chunks(note_content))
+        if parts <= 1:
+            prompt = SUMMARY_PROMPT.format(note=note_content)
+            self.ai_output("summary").setPlainText("Summarizing...")
+        else:
+            # Parts are summarized on the worker thread; only the final combining answer streams in
+            def prompt(cancelled):
+                generate = lambda text: self.gemini.generate(text, AI_REQUEST_TIMEOUT, None, cancelled).replace('*', '')
+                return summary_prompt(note_content, generate, self.ai_cache, cancelled=cancelled)
+            self.ai_output("summary").setPlainText(f"Summarizing {parts} parts...")
+        self.ai_engine.submit("summary", prompt, replace=True,
+                              cache_key=AICache.key(SUMMARY_PROMPT, note_content))
 
     def get_suggestions(self):
         if not self.ai_enabled:
@@ -679,26 +1762,116 @@ class AtmostNotes(QMainWindow):
             return
         
         note_content = self.content_edit.toPlainText()
-        prompt = f"Based on the following note, please provide suggestions for improvement or expansion:\n\n{note_content}"
-        suggestions = self.get_ai_response(prompt)
-        self.suggestions_text.setPlainText(suggestions)
+        prompt = SUGGESTIONS_PROMPT.format(note=note_content)
+        self.ai_output("suggestions").setPlainText("Getting suggestions...")
+        self.ai_engine.submit("suggestions", prompt, replace=True,
+                              cache_key=AICache.key(SUGGESTIONS_PROMPT, note_content))
+
+    def cancel_note_ai_requests(self):
+        # Summaries and suggestions belong to the open note; drop them once it changes
+        for channel in ("summary", "suggestions"):
+            if self.ai_engine.pending(channel):
+                self.ai_engine.cancel_channel(channel)
+                self.ai_output(channel).clear()
+
+    def ai_output(self, channel):
+        self.ensure_ai_panel()
+        return {"chat": self.ai_chat, "summary": self.summary_text, "suggestions": self.suggestions_text}[channel]
+
+    def show_ai_chunk(self, request_id, channel, text):
+        if channel == "chat_history":
+            return
+        stream = self.ai_streams.get(request_id)
+        if stream is None:
+            for stale in [rid for rid in self.ai_streams if rid not in self.ai_engine.active]:
+                del self.ai_streams[stale]
+            text_edit = self.ai_output(channel)
+            if channel == "chat":
+                text_edit.append("AI: ")
+            else:
+                text_edit.clear()
+            stream = self.ai_streams[request_id] = {"block": text_edit.document().lastBlock(), "text": ""}
+        # Each response writes at the end of its own block, so concurrent chat replies never interleave
+        cursor = QTextCursor(stream["block"])
+        cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock)
+        cursor.insertText(text)
+        stream["block"] = cursor.block()
+        stream["text"] += text
+
+    def show_ai_response(self, request_id, channel, response):
+        if channel == "chat_history":
+            chat = self.chat_turns.pop(request_id)[0]
+            chat.fold(None if response.startswith(AI_ERROR_PREFIX) else response)
+            return
+        if request_id in self.chat_turns:
+            self.record_chat_turn(request_id, response)
+        stream = self.ai_streams.pop(request_id, None)
+        if stream is not None:
+            # The stream may have been cut short by an error; show whatever did not arrive as chunks
+            streamed = stream["text"]
+            rest = response[len(streamed):] if response.startswith(streamed) else f"\n{response}"
+            if rest:
+                cursor = QTextCursor(stream["block"])
+                cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock)
+                cursor.insertText(rest)
+        elif channel == "chat":
+            self.ai_chat.append(f"AI: {response}")
+        else:
+            self.ai_output(channel).setPlainText(response)
+
+    def drop_ai_request(self, request_id, channel):
+        turn = self.chat_turns.pop(request_id, None)
+        if turn is not None and channel == "chat_history":
+            # The summary will not come; the turns it would have covered go back into the history
+            turn[0].unfold()
+        self.ai_streams.pop(request_id, None)
+
+    def start_ai_batch(self):
+        if not self.current_user:
+            QMessageBox.warning(self, "Not Logged In", "Please log in to process notes.")
+            return
+        if not self.ai_enabled:
+            QMessageBox.warning(self, "AI Disabled", "Turn AI on to process notes.")
+            return
+        if self.ai_batch:
+            return
+        self.ai_batch = AIBatchJob(self.store, self.current_user, self.gemini.generate, cache=self.ai_cache)
+        self.ai_batch_progress = QProgressDialog("Summarizing and tagging notes...", "Cancel", 0, 0, self)
+        self.ai_batch_progress.setMinimumDuration(0)
+        self.ai_batch_progress.canceled.connect(self.ai_batch.cancel)
+        self.ai_batch.signals.progress.connect(self.show_ai_batch_progress)
+        self.ai_batch.signals.finished.connect(self.finish_ai_batch)
+        self.ai_engine.pool.start(self.ai_batch)
+
+    def show_ai_batch_progress(self, done, total):
+        self.ai_batch_progress.setMaximum(total)
+        self.ai_batch_progress.setValue(done)
+
+    def finish_ai_batch(self, processed, skipped, failed):
+        self.ai_batch = None
+        self.ai_batch_progress.close()
+        QMessageBox.information(self, "AI Processing Complete",
+                                f"Processed {processed} notes, skipped {skipped} unchanged, {failed} failed.")
+
+    @recorder.traced("ai.response")
+    def get_ai_response(self, prompt, timeout=AI_REQUEST_TIMEOUT, on_chunk=None, cancelled=None):
+        # Runs on AIRequestEngine worker threads, so it must not touch any widgets.
+        # With on_chunk the response is streamed and each cleaned chunk is passed to it as it arrives.
+        # Asterisks are stripped one character at a time, so a "**" split across chunks is still removed.
+        def cleaned_chunk(text):
+            text = text.replace('*', '')
+            if text:
+                on_chunk(text)
 
-    def get_ai_response(self, prompt):
-        headers = {
-            'Content-Type': 'application/json',
-        }
-        data = {
-            "contents": [{"parts": [{"text": prompt}]}]
-        }
         try:
-            response = requests.post(f'{GEMINI_API_URL}?key={GEMINI_API_KEY}', headers=headers, json=data)
-            response_json = response.json()
-            ai_response = response_json['candidates'][0]['content']['parts'][0]['text']
+            ai_response = self.gemini.generate(prompt, timeout, cleaned_chunk if on_chunk else None, cancelled)
             # Remove asterisks from the response
-            cleaned_response = ai_response.replace('*', '')
-            return cleaned_response
+            return ai_response.replace('*', '')
+        except AIRequestCancelled:
+            return ""
         except Exception as e:
-            return f"Error: Unable to get AI response. {str(e)}"
+            # GeminiError included: its message says what failed and after how many retries
+            return f"{AI_ERROR_PREFIX} {e}"
 
     def copy_text(self, text_edit):
         text_edit.selectAll()
@@ -708,34 +1881,72 @@ class AtmostNotes(QMainWindow):
         text_edit.setTextCursor(cursor)
         QMessageBox.information(self, "Copied", "Text copied to clipboard.")
 
+    def init_diagnostics(self):
+        # Heartbeats for the stall detector; the timer only runs while diagnostics are recorded
+        self.stall_detector = StallDetector(recorder)
+        self.stall_timer = QTimer(self)
+        self.stall_timer.setInterval(STALL_CHECK_MS)
+        self.stall_timer.timeout.connect(self.stall_detector.beat)
+        self.set_diagnostics(recorder.enabled)
+
+    def set_diagnostics(self, enabled):
+        recorder.enabled = enabled
+        if enabled:
+            self.stall_detector.start()
+            self.stall_timer.start()
+        else:
+            self.stall_timer.stop()
+            self.stall_detector.stop()
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        if self.options_page is not None:
+            self.diagnostics_text.setPlainText(format_report(recorder.snapshot()))
+
+    def reset_diagnostics(self):
+        recorder.reset()
+        self.refresh_diagnostics()
+
+    def export_diagnostics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Diagnostics", "atmost-diagnostics.json",
+                                              "JSON files (*.json)")
+        if path:
+            try:
+                recorder.export(path)
+            except OSError as e:
+                QMessageBox.warning(self, "Error", f"Could not export diagnostics: {e}")
+
     def update_styles(self):
-        self.setStyleSheet(f"""
-            QMainWindow, QWidget {{ background-color: {self.current_theme.background}; color: {self.current_theme.text}; }}
-            QWidget#sidebar {{ background-color: {self.current_theme.sidebar}; border-right: 1px solid {self.current_theme.accent}; }}
-            QPushButton {{ background-color: {self.current_theme.button}; color: {self.current_theme.button_text}; border: none; padding: 10px; margin: 5px; border-radius: 5px; }}
-            QPushButton:hover {{ background-color: {self.current_theme.accent}; }}
-            QLineEdit, QTextEdit {{ background-color: {self.current_theme.button}; color: {self.current_theme.text}; border: 1px solid {self.current_theme.accent}; border-radius: 5px; padding: 5px; }}
-            QLabel {{ color: {self.current_theme.text}; }}
-            QLabel#username_label {{ font-weight: bold; font-size: 14px; }}
-            QListWidget {{ background-color: {self.current_theme.button}; border: none; }}
-            QListWidget::item {{ padding: 5px; border-bottom: 1px solid {self.current_theme.accent}; }}
-            QListWidget::item:selected {{ background-color: {self.current_theme.accent}; color: {self.current_theme.button_text}; }}
-            QPushButton#save_button, QPushButton#ai_button {{ background-color: {self.current_theme.accent}; color: {self.current_theme.button_text}; }}
-            QTabWidget::pane {{ border: 1px solid {self.current_theme.accent}; }}
-            QTabWidget::tab-bar {{ alignment: center; }}
-            QTabBar::tab {{ background-color: {self.current_theme.button}; color: {self.current_theme.button_text}; padding: 8px; }}
-            QTabBar::tab:selected {{ background-color: {self.current_theme.accent}; }}
-            QScrollArea {{ border: none; }}
-            QComboBox {{ background-color: {self.current_theme.button}; color: {self.current_theme.text}; border: 1px solid {self.current_theme.accent}; border-radius: 5px; padding: 5px; }}
-            QComboBox::drop-down {{ border: none; }}
-            QComboBox::down-arrow {{ image: url(down_arrow.png); }}
-            QComboBox QAbstractItemView {{ background-color: {self.current_theme.background}; color: {self.current_theme.text}; selection-background-color: {self.current_theme.accent}; }}
-            QPushButton#toggle_button {{ background-color: transparent; color: {self.current_theme.text}; font-size: 24px; }}
-            QPushButton#ai_toggle_button {{ background-color: {self.current_theme.accent}; color: {self.current_theme.button_text}; }}
-        """)
+        # Palettes repaint in place; stylesheets re-polish, so they are only set where they changed
+        self.setPalette(self.theme_engine.palette(self.current_theme))
+        self.sidebar.setPalette(self.theme_engine.palette(self.current_theme, sidebar=True))
+        stylesheet = self.theme_engine.stylesheet(self.current_theme)
+        for section in self.styled_sections:
+            if section.styleSheet() != stylesheet:
+                section.setStyleSheet(stylesheet)
 
     def closeEvent(self, event):
-        self.conn.close()
+        self.flush_autosave()
+        self.stall_timer.stop()
+        self.stall_detector.stop()
+        self.ai_engine.cancel_all()
+        if self.ai_batch:
+            self.ai_batch.cancel()
+        if self.import_job:
+            self.import_job.cancel()
+        if self.export_job:
+            self.export_job.cancel()
+        if self.semantic_job:
+            self.semantic_job.cancel()
+        self.ai_engine.pool.waitForDone(1000)
+        QThreadPool.globalInstance().waitForDone(5000)
+        self.search_worker.supersede(self.search_generation + 1)
+        self.search_thread.quit()
+        self.search_thread.wait()
+        self.gemini.close()
+        if self.semantic:
+            self.semantic.close()
+        self.store.close()
         event.accept()
 
 if __name__ == '__main__':
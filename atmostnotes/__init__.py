@@ -0,0 +1,41 @@
+"""GUI-independent core of Atmost Notes.
+
+The names below are imported from their submodules on first use, so
+importing the package (or running its command line, python -m atmostnotes)
+does not pay for numpy, requests or the process pools until they are needed.
+PyQt6 is never imported.
+"""
+import importlib
+
+EXPORTS = {
+    "DB_PATH": "store",
+    "NoteStore": "store",
+    "compact_revisions": "store",
+    "decode_content": "store",
+    "encode_content": "store",
+    "html_to_text": "store",
+    "list_revisions": "store",
+    "reconstruct_revision": "store",
+    "search_note_ids": "search",
+    "Diagnostics": "diagnostics",
+    "StallDetector": "diagnostics",
+    "recorder": "diagnostics",
+    "import_notes": "importer",
+    "export_notes": "exporter",
+    "html_to_markdown": "exporter",
+    "HashingEmbedder": "semantic",
+    "SemanticIndex": "semantic",
+    "ChatSession": "chat",
+    "split_chunks": "summarize",
+    "summarize_text": "summarize",
+    "AICache": "ai",
+    "GeminiClient": "ai",
+    "annotate_notes": "ai",
+}
+
+__all__ = list(EXPORTS)
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{EXPORTS[name]}", __name__), name)
@@ -0,0 +1,384 @@
+"""Gemini client, persistent response cache and batch note annotation; no GUI code."""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .chat import estimate_tokens
+from .summarize import SUMMARY_CHUNK_TOKENS, summarize_text
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")  # Replace with your actual API key
+GEMINI_API_URL = os.environ.get("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent")
+GEMINI_STREAM_URL = os.environ.get("GEMINI_STREAM_URL", GEMINI_API_URL.replace(":generateContent", ":streamGenerateContent"))
+GEMINI_EMBED_URL = os.environ.get("GEMINI_EMBED_URL", "https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:batchEmbedContents")
+GEMINI_EMBED_DIM = 768
+GEMINI_EMBED_BATCH = 100
+# "hashing" (local, default), "gemini", or "sentence-transformers[:model]"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "hashing")
+AI_REQUEST_TIMEOUT = 60
+AI_MAX_CONCURRENT_REQUESTS = 4
+AI_MAX_RETRIES = 3
+AI_BACKOFF_BASE = 1.0
+AI_BACKOFF_MAX = 30.0
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 15))
+AI_BATCH_CONCURRENCY = 3
+AI_CACHE_TTL = 30 * 24 * 60 * 60
+AI_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+SUGGESTIONS_PROMPT = "Based on the following note, please provide suggestions for improvement or expansion:\n\n{note}"
+TAGS_PROMPT = "Suggest up to 5 short tags for the following note. Reply with the tags only, separated by commas:\n\n{note}"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def parse_tags(text, limit=5):
+    tags = []
+    for tag in re.split(r"[,\n]", text):
+        tag = tag.strip().strip("#*-•").strip()
+        if tag and tag.lower() not in (t.lower() for t in tags):
+            tags.append(tag)
+    return tags[:limit]
+
+class AIRequestCancelled(Exception):
+    pass
+
+class GeminiError(Exception):
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return f"{self.message} (HTTP {self.status})" if self.status else self.message
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cancelled=None):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if cancelled is not None:
+                if cancelled.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+class SessionHandle:
+    # Held only by a thread's threading.local, so it is freed when the thread ends
+    def __init__(self, session):
+        self.session = session
+
+def retire_session(sessions, retired, lock, session):
+    # Runs while the thread's state is torn down; the session is closed later, from a live thread
+    with lock:
+        if session in sessions:
+            sessions.remove(session)
+            retired.append(session)
+
+class GeminiClient:
+    """Thread-safe Gemini client; each thread has its own keep-alive session.
+
+    requests does not promise that a Session can be shared between threads, so
+    every thread making requests gets one, closed once the thread ends.
+    Requests are paced by a token bucket sized to the API quota, and 429/5xx
+    responses or connection failures are retried with exponential backoff and
+    full jitter (honouring Retry-After). Failures are raised as GeminiError.
+    requests is imported on first use, keeping it out of the startup path.
+    """
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_key=GEMINI_API_KEY, api_url=GEMINI_API_URL, stream_url=GEMINI_STREAM_URL,
+                 embed_url=GEMINI_EMBED_URL, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE, max_retries=AI_MAX_RETRIES,
+                 backoff_base=AI_BACKOFF_BASE, backoff_max=AI_BACKOFF_MAX, pool_size=AI_MAX_CONCURRENT_REQUESTS):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.stream_url = stream_url
+        self.embed_url = embed_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0, pool_size)
+        self.local = threading.local()
+        self.sessions = []
+        self.retired_sessions = []
+        self.sessions_lock = threading.Lock()
+
+    def get_session(self):
+        # Created on a thread's first request, so a client that is never used never imports requests
+        handle = getattr(self.local, "handle", None)
+        if handle is None:
+            self.close_retired_sessions()
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json'})
+            # A thread makes one request at a time; one kept-alive connection per host is enough
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=1)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            with self.sessions_lock:
+                self.sessions.append(session)
+            handle = self.local.handle = SessionHandle(session)
+            weakref.finalize(handle, retire_session, self.sessions, self.retired_sessions, self.sessions_lock, session)
+        return handle.session
+
+    def close_retired_sessions(self):
+        with self.sessions_lock:
+            retired = self.retired_sessions[:]
+            self.retired_sessions.clear()
+        for session in retired:
+            session.close()
+
+    def close(self):
+        with self.sessions_lock:
+            sessions = self.sessions[:]
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+        self.close_retired_sessions()
+
+    def generate(self, prompt, timeout=AI_REQUEST_TIMEOUT, on_chunk=None, cancelled=None):
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        if on_chunk is None:
+            with self.post(self.api_url, {'key': self.api_key}, data, timeout, False, cancelled) as response:
+                return self.extract_text(response.json())
+        chunks = []
+        with self.post(self.stream_url, {'alt': 'sse', 'key': self.api_key}, data, timeout, True, cancelled) as response:
+            # Lines are decoded here: without a charset in the content type, requests would assume ISO-8859-1
+            for line in response.iter_lines(chunk_size=None):
+                line = line.decode("utf-8")
+                if not line.startswith("data:"):
+                    continue
+                text = self.extract_text(json.loads(line[len("data:"):]), required=False)
+                if text:
+                    chunks.append(text)
+                    on_chunk(text)
+        if not chunks:
+            raise GeminiError("Gemini returned an empty response")
+        return "".join(chunks)
+
+    def embed(self, texts, timeout=AI_REQUEST_TIMEOUT, cancelled=None):
+        model = "models/" + self.embed_url.rsplit("/", 1)[-1].split(":")[0]
+        vectors = []
+        for start in range(0, len(texts), GEMINI_EMBED_BATCH):
+            data = {"requests": [{"model": model, "content": {"parts": [{"text": text}]}}
+                                 for text in texts[start:start + GEMINI_EMBED_BATCH]]}
+            with self.post(self.embed_url, {'key': self.api_key}, data, timeout, False, cancelled) as response:
+                vectors.extend(embedding['values'] for embedding in response.json()['embeddings'])
+        return vectors
+
+    def extract_text(self, response_json, required=True):
+        candidates = response_json.get('candidates') or [{}]
+        parts = candidates[0].get('content', {}).get('parts', [])
+        text = "".join(part.get('text', '') for part in parts)
+        if required and not text:
+            reason = candidates[0].get('finishReason') or response_json.get('promptFeedback', {}).get('blockReason')
+            raise GeminiError(f"Gemini returned no text ({reason})" if reason else "Gemini returned no text")
+        return text
+
+    def post(self, url, params, data, timeout, stream, cancelled=None):
+        session = self.get_session()
+        import requests
+        for attempt in range(self.max_retries + 1):
+            if not self.rate_limiter.acquire(cancelled):
+                raise AIRequestCancelled()
+            try:
+                response = session.post(url, params=params, json=data, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = GeminiError(f"Connection to Gemini failed: {e}", retryable=True)
+            else:
+                if response.ok:
+                    return response
+                error = self.response_error(response)
+                response.close()
+                if not error.retryable:
+                    raise error
+            if attempt == self.max_retries:
+                if attempt:
+                    error.message += f" after {attempt} retries"
+                raise error
+            delay = error.retry_after or random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise AIRequestCancelled()
+            else:
+                time.sleep(delay)
+
+    def response_error(self, response):
+        try:
+            message = response.json()['error']['message']
+        except (ValueError, KeyError, TypeError):
+            message = response.reason or "Request failed"
+        retry_after = response.headers.get('Retry-After')
+        try:
+            retry_after = min(self.backoff_max, float(retry_after)) if retry_after else None
+        except ValueError:
+            retry_after = None
+        if response.status_code == 429:
+            message = f"Rate limited by Gemini: {message}"
+        return GeminiError(message, response.status_code, response.status_code in self.RETRYABLE_STATUS, retry_after)
+
+class GeminiEmbedder:
+    """Embeds note text with the Gemini embeddings API, for SemanticIndex."""
+    def __init__(self, client, dim=GEMINI_EMBED_DIM):
+        self.client = client
+        self.dim = dim
+        self.name = f"gemini:{client.embed_url}"
+
+    def embed(self, texts):
+        return self.client.embed(list(texts))
+
+class AICache:
+    """Persistent cache of AI responses keyed by prompt template, model and note text.
+
+    Entries expire after ttl seconds and the least recently used ones are evicted
+    once the stored responses exceed max_bytes.
+    """
+    def __init__(self, store, ttl=AI_CACHE_TTL, max_bytes=AI_CACHE_MAX_BYTES):
+        self.store = store
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(template, text, model_url=None):
+        material = "\0".join((template, model_url or GEMINI_API_URL, text))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        row = self.store.reader().execute('SELECT response, created_at FROM ai_cache WHERE key = ?', (key,)).fetchone()
+        if row and row[1] >= now - self.ttl:
+            self.hits += 1
+            self.store.write('UPDATE ai_cache SET last_used = ? WHERE key = ?', (now, key))
+            return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key, response):
+        return self.store.submit(self.store_response, key, response, time.time())
+
+    def store_response(self, conn, key, response, now):
+        conn.execute('''
+            INSERT OR REPLACE INTO ai_cache (key, response, size, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, response, len(response.encode()), now, now))
+        self.evict(conn, now)
+
+    def evict(self, conn, now=None):
+        now = time.time() if now is None else now
+        conn.execute('DELETE FROM ai_cache WHERE created_at < ?', (now - self.ttl,))
+        # Keep the most recently used entries whose running size still fits under the cap
+        conn.execute('''
+            DELETE FROM ai_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running FROM ai_cache
+                ) WHERE running > ?
+            )
+        ''', (self.max_bytes,))
+
+    def clear(self):
+        return self.store.write('DELETE FROM ai_cache')
+
+    def stats(self):
+        entries, size = self.store.reader().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_cache').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+def create_embedder(backend=EMBEDDING_BACKEND, client=None):
+    """Return the SemanticIndex embedder for a backend name; see EMBEDDING_BACKEND."""
+    from .semantic import HashingEmbedder, SentenceTransformerEmbedder
+    if backend == "gemini":
+        return GeminiEmbedder(client or GeminiClient())
+    if backend.startswith("sentence-transformers"):
+        return SentenceTransformerEmbedder(*backend.split(":", 1)[1:])
+    return HashingEmbedder()
+
+def annotate_note(text, generate, cache=None, concurrency=AI_BATCH_CONCURRENCY, cancelled=None):
+    """Return the summary and tags of a note's plain text, asking generate(prompt)."""
+    summary = summarize_text(text, generate, cache, concurrency=concurrency, cancelled=cancelled)
+    # A long note is tagged from its summary, which is known to fit in a prompt
+    tags = generate(TAGS_PROMPT.format(note=text if estimate_tokens(text) <= SUMMARY_CHUNK_TOKENS else summary))
+    return summary, parse_tags(tags)
+
+def annotate_notes(store, user_id, generate, cache=None, concurrency=AI_BATCH_CONCURRENCY,
+                   progress=None, cancelled=None):
+    """Summarize and tag every note of a user, concurrently, with generate(prompt).
+
+    Results are committed note by note together with a hash of the note's plain
+    text, so an interrupted run resumes where it stopped and unchanged notes are
+    skipped on the next run. progress(done, total) is called as notes finish.
+    Returns (processed, skipped, failed).
+    """
+    conn = store.reader()
+    pending = []
+    skipped = 0
+    for note_id, text, ai_hash in conn.execute(
+            'SELECT id, html_to_text(content), ai_hash FROM notes WHERE user_id = ?', (user_id,)):
+        if ai_hash == content_hash(text):
+            skipped += 1
+        else:
+            pending.append(note_id)
+    total = len(pending)
+    processed = failed = 0
+    if progress:
+        progress(0, total)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        queue = iter(pending)
+        running = {}
+        while not (cancelled and cancelled.is_set()):
+            # Only a bounded number of notes is read and in flight at any time
+            while len(running) < concurrency:
+                note_id = next(queue, None)
+                if note_id is None:
+                    break
+                row = conn.execute('SELECT html_to_text(content) FROM notes WHERE id = ?', (note_id,)).fetchone()
+                if row is None:
+                    total -= 1
+                    continue
+                running[executor.submit(annotate_note, row[0], generate, cache, concurrency, cancelled)] = (note_id, content_hash(row[0]))
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                note_id, text_hash = running.pop(future)
+                try:
+                    summary, tags = future.result()
+                except Exception:
+                    failed += 1
+                else:
+                    store.write('UPDATE notes SET summary = ?, ai_tags = ?, ai_hash = ? WHERE id = ?',
+                                (summary, ", ".join(tags), text_hash, note_id))
+                    processed += 1
+                if progress:
+                    progress(processed + failed, total)
+        for future in running:
+            future.cancel()
+    store.sync()
+    return processed, skipped, failed
@@ -0,0 +1,183 @@
+"""Chat over a user's notes: retrieval, prompt packing under a token budget, and rolling history."""
+import re
+
+CHAT_TOP_K = 5
+CHAT_CONTEXT_TOKENS = 1500
+CHAT_HISTORY_TOKENS = 600
+# Gemini averages about four characters per token on English text
+CHARS_PER_TOKEN = 4
+
+CHAT_PROMPT = """You are an assistant for the user's personal notes. Use the notes below when they are relevant to the question, and say so when they do not contain the answer.
+
+{history}Notes:
+{context}
+
+User: {message}
+Assistant:"""
+
+CHAT_SUMMARY_PROMPT = """Summarize this conversation between a user and an assistant in at most five sentences. Keep facts, names, decisions and open questions. Build on the existing summary if there is one.
+
+Existing summary:
+{summary}
+
+Conversation:
+{turns}"""
+
+STOPWORDS = set("""a an and are as at be but by can could did do does for from had has have how i in is it its
+me my of on or our should so than that the their them then there these they this to was we were what when
+where which who why will with would you your about into over any all some""".split())
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def query_terms(message):
+    return [word for word in dict.fromkeys(re.findall(r"\w+", message.lower()))
+            if len(word) > 2 and word not in STOPWORDS]
+
+def retrieve_note_ids(conn, user_id, message, semantic=None, k=CHAT_TOP_K):
+    """Return up to k ids of the user's notes most relevant to a chat message.
+
+    Full-text matches (any of the message's significant words, ranked by bm25)
+    are interleaved with semantic matches when a SemanticIndex is given.
+    """
+    terms = query_terms(message)
+    ranked = []
+    if terms:
+        match = " OR ".join(f'"{term}"*' for term in terms)
+        ranked.append([row[0] for row in conn.execute('''
+            SELECT notes.id FROM notes_fts
+            JOIN notes ON notes.id = notes_fts.rowid
+            WHERE notes_fts MATCH ? AND notes.user_id = ?
+            ORDER BY bm25(notes_fts, 10.0, 1.0, 5.0) LIMIT ?
+        ''', (match, user_id, k))])
+    if semantic is not None:
+        ranked.append(semantic.search(user_id, message, k))
+    note_ids = []
+    for position in range(k):
+        for ids in ranked:
+            if position < len(ids) and ids[position] not in note_ids:
+                note_ids.append(ids[position])
+    return note_ids[:k]
+
+def excerpt(text, terms, budget):
+    """Return the paragraphs of text that best match terms, in order, within budget tokens."""
+    if estimate_tokens(text) <= budget:
+        return text
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    def score(index):
+        words = re.findall(r"\w+", paragraphs[index].lower())
+        return -sum(1 for word in words if any(word.startswith(term) for term in terms)), index
+    chosen, used = [], 0
+    for index in sorted(range(len(paragraphs)), key=score):
+        cost = estimate_tokens(paragraphs[index]) + 1
+        if used + cost > budget:
+            if not chosen:
+                # Even the best paragraph is too long; keep its beginning
+                paragraphs[index] = paragraphs[index][:budget * CHARS_PER_TOKEN]
+                chosen.append(index)
+            break
+        chosen.append(index)
+        used += cost
+    parts = []
+    for previous, index in zip([None] + sorted(chosen), sorted(chosen)):
+        if previous is not None and index != previous + 1:
+            parts.append("…")
+        parts.append(paragraphs[index])
+    return "\n".join(parts)
+
+class ChatSession:
+    """Conversation state for retrieval-augmented chat with one user's notes.
+
+    Each turn's prompt holds excerpts of the top-k relevant notes, packed into
+    context_tokens, and the conversation so far: recent turns verbatim and older
+    ones folded into a model-written summary, within about history_tokens.
+    prepare() is called on the GUI thread and returns a function that builds
+    the prompt on a worker thread, filling in a stats dict with the estimated
+    tokens sent.
+    """
+    def __init__(self, store, user_id, semantic=None, top_k=CHAT_TOP_K,
+                 context_tokens=CHAT_CONTEXT_TOKENS, history_tokens=CHAT_HISTORY_TOKENS):
+        self.store = store
+        self.user_id = user_id
+        self.semantic = semantic
+        self.top_k = top_k
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.turns = []
+        self.folding = []
+        self.summary = ""
+        self.stats = []
+        self.summary_tokens = 0
+
+    def history(self, turns, summary):
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}\n")
+        for question, answer in turns:
+            parts.append(f"User: {question}\nAssistant: {answer}\n")
+        return "\n".join(parts) + "\n" if parts else ""
+
+    def prepare(self, message):
+        # Snapshot the history now; the prompt itself is built on the worker thread
+        history = self.history(self.folding + self.turns, self.summary)
+        stats = {}
+
+        def build(cancelled=None):
+            conn = self.store.reader()
+            terms = query_terms(message)
+            note_ids = retrieve_note_ids(conn, self.user_id, message, self.semantic, self.top_k)
+            sections, used = [], 0
+            for note_id in note_ids:
+                row = conn.execute('SELECT title, html_to_text(content) FROM notes WHERE id = ?', (note_id,)).fetchone()
+                if row is None:
+                    continue
+                # Split what is left of the budget evenly over the notes still to come
+                share = (self.context_tokens - used) // (len(note_ids) - len(sections))
+                if share < 20:
+                    break
+                section = f"## {row[0] or 'Untitled'}\n{excerpt(row[1], terms, share)}"
+                sections.append(section)
+                used += estimate_tokens(section)
+            context = "\n\n".join(sections) or "(no matching notes)"
+            prompt = CHAT_PROMPT.format(history=history, context=context, message=message)
+            stats.update(notes=len(sections), context_tokens=estimate_tokens(context),
+                         history_tokens=estimate_tokens(history), prompt_tokens=estimate_tokens(prompt))
+            return prompt
+
+        return build, stats
+
+    def record(self, message, reply, stats):
+        self.turns.append((message, reply))
+        stats["reply_tokens"] = estimate_tokens(reply)
+        self.stats.append(stats)
+
+    def fold_prompt(self):
+        """Move the oldest turns out of the verbatim history once it is over budget.
+
+        Returns a prompt asking for an updated summary, or None if the history
+        still fits or a summary is already being written.
+        """
+        if self.folding or estimate_tokens(self.history(self.turns, "")) <= self.history_tokens:
+            return None
+        while len(self.turns) > 1 and estimate_tokens(self.history(self.turns, "")) > self.history_tokens // 2:
+            self.folding.append(self.turns.pop(0))
+        if not self.folding:
+            return None
+        prompt = CHAT_SUMMARY_PROMPT.format(summary=self.summary or "(none)",
+                                            turns=self.history(self.folding, ""))
+        self.summary_tokens += estimate_tokens(prompt)
+        return prompt
+
+    def fold(self, summary):
+        # Without a summary (the request failed) the folded turns are simply dropped
+        if summary:
+            self.summary = summary.strip()
+        self.folding = []
+
+    def unfold(self):
+        # The summary request was cancelled: the turns are kept verbatim and folded again later
+        self.turns = self.folding + self.turns
+        self.folding = []
+
+    def tokens_sent(self):
+        return sum(stats.get("prompt_tokens", 0) for stats in self.stats) + self.summary_tokens
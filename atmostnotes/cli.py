@@ -0,0 +1,136 @@
+"""Command line access to a notes database, without the GUI.
+
+    python -m atmostnotes --user alice search "project plan"
+    python -m atmostnotes --user alice export notes.zip
+    python -m atmostnotes --user alice import ~/Documents/notes
+    python -m atmostnotes --user alice summarize
+
+Anyone who can read the database file can read the notes in it, so no
+password is asked for. Each command imports only what it needs, keeping
+cold start short for cron and batch jobs.
+"""
+import argparse
+import json
+import signal
+import sys
+import threading
+
+from .diagnostics import recorder
+from .store import DB_PATH, NoteStore
+
+def show_progress(label):
+    if not sys.stderr.isatty():
+        return None
+    def progress(done, total):
+        sys.stderr.write(f"\r{label} {done}/{total}")
+        if done == total:
+            sys.stderr.write("\n")
+    return progress
+
+def interruptible():
+    # Ctrl-C stops the command at the next note instead of killing it half way through a write
+    cancelled = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: cancelled.set())
+    return cancelled
+
+def archive_type(path):
+    if path.endswith((".tar", ".tar.gz", ".tgz")):
+        return "tar"
+    if path.endswith(".jsonl"):
+        return "jsonl"
+    return "zip"
+
+def search(store, user_id, args):
+    if args.semantic:
+        from .ai import create_embedder
+        from .semantic import SemanticIndex
+        index = SemanticIndex(store, create_embedder())
+        index.refresh(user_id)
+        note_ids = index.search(user_id, args.query, args.limit)
+        index.close()
+    else:
+        from .search import search_note_ids
+        note_ids = search_note_ids(store.reader(), user_id, args.query)[:args.limit]
+    conn = store.reader()
+    for note_id in note_ids:
+        title, updated_at = conn.execute('SELECT title, updated_at FROM notes WHERE id = ?', (note_id,)).fetchone()
+        if args.json:
+            print(json.dumps({"id": note_id, "title": title, "updated_at": updated_at}, ensure_ascii=False))
+        else:
+            print(f"{note_id}\t{title or 'Untitled'}")
+    return 0
+
+def export(store, user_id, args):
+    from .exporter import EXPORT_WORKERS, export_notes
+    exported = export_notes(store, user_id, args.path, args.archive or archive_type(args.path), args.format,
+                            args.workers or EXPORT_WORKERS, show_progress("Exporting"), interruptible())
+    print(f"Exported {exported} notes to {args.path}", file=sys.stderr)
+    return 0
+
+def import_(store, user_id, args):
+    from .importer import IMPORT_WORKERS, import_notes
+    imported, duplicates, failed = import_notes(store, user_id, args.directory, args.workers or IMPORT_WORKERS,
+                                                progress=show_progress("Importing"), cancelled=interruptible())
+    print(f"Imported {imported} notes, skipped {duplicates} duplicates, {failed} files failed", file=sys.stderr)
+    return 1 if failed else 0
+
+def summarize(store, user_id, args):
+    from .ai import AI_BATCH_CONCURRENCY, GEMINI_API_KEY, AICache, GeminiClient, annotate_notes
+    if not GEMINI_API_KEY:
+        print("Set GEMINI_API_KEY to summarize notes", file=sys.stderr)
+        return 2
+    client = GeminiClient()
+    cancelled = interruptible()
+    generate = lambda prompt: client.generate(prompt, cancelled=cancelled).replace('*', '')
+    generate = recorder.traced("ai.response")(generate)
+    processed, skipped, failed = annotate_notes(store, user_id, generate, AICache(store),
+                                                args.concurrency or AI_BATCH_CONCURRENCY,
+                                                show_progress("Summarizing"), cancelled)
+    client.close()
+    print(f"Processed {processed} notes, skipped {skipped} unchanged, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="atmostnotes", description="Work with Atmost Notes without the GUI.")
+    parser.add_argument("--db", default=DB_PATH, help=f"notes database (default: {DB_PATH})")
+    parser.add_argument("--user", required=True, help="username whose notes to use")
+    parser.add_argument("--diagnostics", metavar="PATH", help="time queries and AI calls and write a report here")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("search", help="list notes matching a query, best first")
+    command.add_argument("query")
+    command.add_argument("--limit", type=int, default=20)
+    command.add_argument("--semantic", action="store_true", help="search by meaning instead of words")
+    command.add_argument("--json", action="store_true", help="print one JSON object per note")
+    command.set_defaults(run=search)
+
+    command = commands.add_parser("export", help="export every note to a zip, tar or JSON Lines archive")
+    command.add_argument("path")
+    command.add_argument("--archive", choices=("zip", "tar", "jsonl"), help="default: from the file extension")
+    command.add_argument("--format", choices=("markdown", "html"), default="markdown")
+    command.add_argument("--workers", type=int)
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("import", help="import HTML, Markdown, text and ENEX files from a directory tree")
+    command.add_argument("directory")
+    command.add_argument("--workers", type=int)
+    command.set_defaults(run=import_)
+
+    command = commands.add_parser("summarize", help="summarize and tag new or changed notes with Gemini")
+    command.add_argument("--concurrency", type=int)
+    command.set_defaults(run=summarize)
+
+    args = parser.parse_args(argv)
+    if args.diagnostics:
+        recorder.enabled = True
+    store = NoteStore(args.db)
+    try:
+        row = store.reader().execute('SELECT id FROM users WHERE username = ?', (args.user,)).fetchone()
+        if row is None:
+            print(f"No such user: {args.user}", file=sys.stderr)
+            return 2
+        return args.run(store, row[0], args)
+    finally:
+        store.close()
+        if args.diagnostics:
+            recorder.export(args.diagnostics)
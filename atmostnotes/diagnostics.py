@@ -0,0 +1,243 @@
+"""Performance diagnostics: latency histograms, a slow-query log and an event-loop stall detector.
+
+Everything is recorded into the module's recorder, which starts disabled
+unless ATMOST_DIAGNOSTICS is set. While disabled, an instrumented call costs
+one attribute check; nothing is timed or stored. No GUI code: the GUI drives
+StallDetector.beat() from a timer on its own thread.
+"""
+import bisect
+import contextlib
+import functools
+import json
+import os
+import platform
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+DIAGNOSTICS_ENABLED = os.environ.get("ATMOST_DIAGNOSTICS", "") not in ("", "0")
+# Upper bounds of the histogram buckets; the last bucket holds everything slower
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_QUERY_MS = 50
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_MAX_CHARS = 2000
+STALL_CHECK_MS = 100
+STALL_THRESHOLD_MS = 250
+STALL_LOG_SIZE = 50
+
+class Histogram:
+    """Counts of latencies per HISTOGRAM_BOUNDS_MS bucket, with their total and maximum."""
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        # The upper bound of the bucket holding the percentile, so an estimate that is never too low
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p90_ms": round(self.percentile(0.9), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "histogram": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+class Diagnostics:
+    """Thread-safe store of operation latencies, slow SQL statements and event-loop stalls.
+
+    Operations are named by area, e.g. "sql.select", "ai.response" or
+    "ui.note_list". Check enabled before timing anything; timed() and traced()
+    do so themselves.
+    """
+    def __init__(self, enabled=DIAGNOSTICS_ENABLED, slow_query_ms=SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.histograms = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            self.stalls = deque(maxlen=STALL_LOG_SIZE)
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds * 1000)
+
+    def record_query(self, sql, seconds):
+        kind = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else "empty"
+        self.record(f"sql.{kind}", seconds)
+        if seconds * 1000 >= self.slow_query_ms:
+            # Only the statement: parameters can hold note text
+            text = " ".join(sql.split())[:SLOW_QUERY_MAX_CHARS]
+            with self.lock:
+                self.slow_queries.append({"at": time.time(), "ms": round(seconds * 1000, 3),
+                                          "thread": threading.current_thread().name, "sql": text})
+
+    def record_stall(self, seconds, stack=None):
+        self.record("ui.event_loop_stall", seconds)
+        with self.lock:
+            self.stalls.append({"at": time.time() - seconds, "ms": round(seconds * 1000, 3), "stack": stack or []})
+
+    def timed(self, name):
+        """Context manager recording how long its block takes under name."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self.timer(name)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def traced(self, name):
+        """Decorator recording every call of a function under name."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self.lock:
+            operations = {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+            slow_queries = sorted(self.slow_queries, key=lambda query: query["ms"], reverse=True)
+            stalls = list(self.stalls)
+        return {
+            "enabled": self.enabled,
+            "started_at": self.started_at,
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "slow_query_ms": self.slow_query_ms,
+            "operations": operations,
+            "slow_queries": slow_queries,
+            "stalls": stalls,
+        }
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(self.snapshot(), report_file, indent=2)
+            report_file.write("\n")
+
+def format_report(snapshot, slow_queries=20, stalls=10):
+    """Return a diagnostics snapshot as plain text, for display."""
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["started_at"]))
+    lines = [f"Recording: {'on' if snapshot['enabled'] else 'off'}, since {started}", ""]
+    operations = snapshot["operations"]
+    if operations:
+        width = max(len(name) for name in operations)
+        lines.append(f"{'operation':<{width}}  {'count':>8}  {'mean ms':>9}  {'p50 ms':>9}  {'p90 ms':>9}  "
+                     f"{'p99 ms':>9}  {'max ms':>9}")
+        for name, stats in operations.items():
+            lines.append(f"{name:<{width}}  {stats['count']:>8}  {stats['mean_ms']:>9.2f}  {stats['p50_ms']:>9.2f}  "
+                         f"{stats['p90_ms']:>9.2f}  {stats['p99_ms']:>9.2f}  {stats['max_ms']:>9.2f}")
+    else:
+        lines.append("No operations recorded.")
+    lines += ["", f"Slowest queries (over {snapshot['slow_query_ms']} ms):"]
+    for query in snapshot["slow_queries"][:slow_queries]:
+        lines.append(f"  {query['ms']:9.2f} ms  [{query['thread']}]  {query['sql']}")
+    if not snapshot["slow_queries"]:
+        lines.append("  none")
+    lines += ["", "Event loop stalls:"]
+    for stall in snapshot["stalls"][-stalls:]:
+        at = time.strftime("%H:%M:%S", time.localtime(stall["at"]))
+        lines.append(f"  {at}  {stall['ms']:9.2f} ms")
+        # The innermost frames show what the GUI thread was busy with
+        lines += ["      " + line for frame in stall["stack"][-3:] for line in frame.rstrip().splitlines()]
+    if not snapshot["stalls"]:
+        lines.append("  none")
+    return "\n".join(lines)
+
+class StallDetector:
+    """Detects stalls of the GUI event loop and what it was stuck in.
+
+    The GUI calls beat() from a timer firing every interval_ms. A watcher thread
+    notices when beats stop for threshold_ms longer than that and captures the
+    stack of the GUI thread while it is still busy; the next beat records the
+    stall, with its full length, in the recorder.
+    """
+    def __init__(self, recorder, interval_ms=STALL_CHECK_MS, threshold_ms=STALL_THRESHOLD_MS, thread_id=None):
+        self.recorder = recorder
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.last_beat = time.perf_counter()
+        self.stack = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.last_beat = time.perf_counter()
+        self.stack = None
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.watch, name="Stall detector", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def beat(self):
+        now = time.perf_counter()
+        with self.lock:
+            late = now - self.last_beat - self.interval
+            stack, self.stack = self.stack, None
+            self.last_beat = now
+        if late >= self.threshold:
+            self.recorder.record_stall(late, stack)
+
+    def watch(self):
+        while not self.stopping.wait(self.interval):
+            with self.lock:
+                if self.stack is not None or time.perf_counter() - self.last_beat < self.interval + self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.thread_id)
+                self.stack = traceback.format_stack(frame) if frame else []
+
+recorder = Diagnostics()
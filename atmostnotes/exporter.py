@@ -0,0 +1,313 @@
+"""Streaming export of a user's notes to a zip, tar or JSON Lines archive."""
+import io
+import json
+import multiprocessing
+import os
+import re
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+from .store import decode_content
+
+EXPORT_ARCHIVES = ("zip", "tar", "jsonl")
+EXPORT_FORMATS = ("markdown", "html")
+EXPORT_WORKERS = os.cpu_count() or 1
+EXPORT_CHUNK_NOTES = 64
+EXPORT_NAME_LENGTH = 100
+
+class MarkdownRenderer(HTMLParser):
+    """Converts note HTML, including the inline styles Qt writes for bold and italic, to Markdown."""
+    SKIP_TAGS = {"head", "style", "script", "title"}
+    BLOCK_TAGS = {"p", "div", "tr", "dt", "dd"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.line = []
+        self.line_started = False
+        self.prefix = ""
+        self.tight = False
+        self.lists = []
+        self.closers = []
+        self.links = []
+        self.quote = 0
+        self.skip_depth = 0
+        self.heading = False
+        self.pre = None
+
+    def start_block(self, prefix="", tight=False):
+        self.end_block()
+        self.prefix = "> " * self.quote + prefix
+        self.tight = tight
+
+    def end_block(self):
+        text = "".join(self.line).strip()
+        if text:
+            self.blocks.append((self.prefix + text, self.tight))
+        self.line = []
+        self.line_started = False
+        self.prefix = "> " * self.quote
+        self.tight = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif self.pre is not None:
+            return
+        elif tag in self.BLOCK_TAGS:
+            self.start_block(tight=bool(self.lists))
+        elif re.fullmatch(r"h[1-6]", tag):
+            self.start_block("#" * int(tag[1]) + " ")
+            self.heading = True
+        elif tag in ("ul", "ol"):
+            self.end_block()
+            self.lists.append([tag, 0])
+        elif tag == "li":
+            if not self.lists:
+                self.lists.append(["ul", 0])
+            self.lists[-1][1] += 1
+            indent = "   " * (len(self.lists) - 1)
+            # A blank line before a list's first item keeps it from running into the block above
+            tight = self.lists[-1][1] > 1 or len(self.lists) > 1
+            if self.lists[-1][0] == "ol":
+                self.start_block(f"{indent}{self.lists[-1][1]}. ", tight)
+            else:
+                self.start_block(f"{indent}- ", tight)
+        elif tag == "blockquote":
+            self.end_block()
+            self.quote += 1
+            self.prefix = "> " * self.quote
+        elif tag == "pre":
+            self.end_block()
+            self.pre = []
+        elif tag == "br":
+            self.line.append("  \n" + " " * len(self.prefix))
+        elif tag == "hr":
+            self.end_block()
+            self.blocks.append(("---", False))
+        elif tag == "img":
+            self.line.append(f"![{attrs.get('alt') or ''}]({attrs.get('src') or ''})")
+        elif tag == "a":
+            self.line.append("[")
+            self.links.append(attrs.get("href") or "")
+        elif tag in ("b", "strong", "i", "em", "code", "span"):
+            style = attrs.get("style") or ""
+            marker = ""
+            if tag == "code":
+                marker = "`"
+            elif not self.heading:
+                if tag in ("b", "strong") or re.search(r"font-weight:\s*(bold|[6-9]00)", style):
+                    marker += "**"
+                if tag in ("i", "em") or re.search(r"font-style:\s*italic", style):
+                    marker += "*"
+            self.closers.append((marker, len("".join(self.line))))
+            self.line.append(marker)
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == "pre" and self.pre is not None:
+            code = "".join(self.pre).strip("\n")
+            self.pre = None
+            if self.blocks and self.blocks[-1][1] == "pre":
+                # Qt writes a code block as one <pre> per line
+                code = self.blocks.pop()[0][4:-4] + "\n" + code
+            self.blocks.append(("```\n" + code + "\n```", "pre"))
+        elif self.pre is not None:
+            return
+        elif tag in self.BLOCK_TAGS or tag == "li":
+            self.end_block()
+        elif re.fullmatch(r"h[1-6]", tag):
+            self.end_block()
+            self.heading = False
+        elif tag in ("ul", "ol"):
+            self.end_block()
+            if self.lists:
+                self.lists.pop()
+        elif tag == "blockquote":
+            self.end_block()
+            self.quote = max(0, self.quote - 1)
+            self.prefix = "> " * self.quote
+        elif tag == "a" and self.links:
+            self.line.append(f"]({self.links.pop()})")
+        elif tag in ("b", "strong", "i", "em", "code", "span") and self.closers:
+            marker, start = self.closers.pop()
+            text = "".join(self.line)
+            if not marker or start >= len(text):
+                return
+            if not text[start + len(marker):].strip():
+                # Nothing was emphasized; drop the opening marker
+                self.line = [text[:start] + text[start + len(marker):]]
+                return
+            # Markdown emphasis cannot end in whitespace, so move it outside the marker
+            stripped = text.rstrip()
+            self.line = [stripped, marker[::-1], text[len(stripped):]]
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.pre is not None:
+            self.pre.append(data)
+            return
+        text = re.sub(r"\s+", " ", data)
+        if not self.line_started:
+            text = text.lstrip()
+            self.line_started = bool(text)
+        self.line.append(re.sub(r"([\\`*_\[\]])", r"\\\1", text))
+
+    def markdown(self):
+        self.end_block()
+        parts = []
+        for index, (text, tight) in enumerate(self.blocks):
+            if index:
+                parts.append("\n" if tight is True else "\n\n")
+            parts.append(text)
+        return "".join(parts) + "\n"
+
+def html_to_markdown(html):
+    renderer = MarkdownRenderer()
+    renderer.feed(html)
+    renderer.close()
+    return renderer.markdown()
+
+def render_notes(rows, fmt):
+    """Decode and render a chunk of (title, content, tags, updated_at) rows; runs in the worker processes."""
+    rendered = []
+    for title, content, tags, updated_at in rows:
+        body = decode_content(content)
+        if fmt == "markdown":
+            body = html_to_markdown(body)
+        rendered.append((title or "", tags or "", updated_at, body))
+    return rendered
+
+def safe_filename(title):
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", title).strip(" .")[:EXPORT_NAME_LENGTH].strip(" .")
+    if not name:
+        return "Untitled"
+    # Reserved device names on Windows, with or without an extension
+    if re.fullmatch(r"(con|prn|aux|nul|com\d|lpt\d)(\..*)?", name, re.I):
+        name = "_" + name
+    return name
+
+class ArchiveWriter:
+    """Writes rendered notes to a zip, tar.gz or JSON Lines file under unique, sanitized names."""
+    def __init__(self, path, archive, fmt):
+        self.archive = archive
+        self.extension = ".md" if fmt == "markdown" else ".html"
+        self.names = set()
+        self.suffixes = {}
+        if archive == "zip":
+            self.file = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        elif archive == "tar":
+            self.file = tarfile.open(path, "w:gz")
+        elif archive == "jsonl":
+            self.file = open(path, "w", encoding="utf-8")
+        else:
+            raise ValueError(f"Unknown archive type: {archive}")
+
+    def unique_name(self, title):
+        base = safe_filename(title)
+        # Compared case-insensitively, since the archive may be unpacked on a case-insensitive file system
+        key = base.lower()
+        name, number = base, self.suffixes.get(key, 1)
+        if number > 1:
+            name = f"{base} ({number})"
+        while (name + self.extension).lower() in self.names:
+            number += 1
+            name = f"{base} ({number})"
+        self.suffixes[key] = number + 1
+        self.names.add((name + self.extension).lower())
+        return name + self.extension
+
+    def add(self, title, tags, updated_at, body):
+        if self.archive == "jsonl":
+            self.file.write(json.dumps({"title": title, "tags": tags, "updated_at": updated_at, "content": body},
+                                       ensure_ascii=False) + "\n")
+            return
+        name = self.unique_name(title)
+        data = body.encode("utf-8")
+        modified = updated_at or time.time()
+        if self.archive == "zip":
+            info = zipfile.ZipInfo(name, time.localtime(max(modified, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self.file.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = modified
+            self.file.addfile(info, io.BytesIO(data))
+            # TarFile keeps every member it wrote; none are needed again when writing
+            self.file.members.clear()
+
+    def close(self):
+        self.file.close()
+
+def export_notes(store, user_id, path, archive="zip", fmt="markdown", workers=EXPORT_WORKERS,
+                 progress=None, cancelled=None):
+    """Export every note of a user to a single archive at path.
+
+    Notes are streamed from the database in id order and rendered in chunks, a
+    bounded number at a time, so no note is held longer than it takes to write
+    it. Only a name per note (and, for zip, its directory entry) is kept until
+    the end. Markdown rendering runs in worker processes. The archive is
+    written next to path and only moved into place once complete; a cancelled
+    export leaves nothing behind. progress(done, total) is called as notes are
+    written. Returns the number of notes exported.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    conn = store.reader()
+    total = conn.execute('SELECT COUNT(*) FROM notes WHERE user_id = ?', (user_id,)).fetchone()[0]
+    cursor = conn.execute('SELECT title, content, tags, updated_at FROM notes WHERE user_id = ? ORDER BY id',
+                          (user_id,))
+    chunks = iter(lambda: cursor.fetchmany(EXPORT_CHUNK_NOTES), [])
+    partial = path + ".part"
+    writer = ArchiveWriter(partial, archive, fmt)
+    done = 0
+    if progress:
+        progress(0, total)
+    try:
+        if workers <= 1 or fmt != "markdown":
+            for chunk in chunks:
+                if cancelled and cancelled.is_set():
+                    break
+                for note in render_notes(chunk, fmt):
+                    writer.add(*note)
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+        else:
+            # Spawned rather than forked: the calling process runs threads (the store's writer, Qt)
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                running = []
+                while not (cancelled and cancelled.is_set()):
+                    while len(running) < workers * 2:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        running.append(executor.submit(render_notes, chunk, fmt))
+                    if not running:
+                        break
+                    # Notes are written in database order, so wait for the oldest chunk
+                    for note in running.pop(0).result():
+                        writer.add(*note)
+                        done += 1
+                    if progress:
+                        progress(done, total)
+                for future in running:
+                    future.cancel()
+    except BaseException:
+        writer.close()
+        os.remove(partial)
+        raise
+    cursor.close()
+    writer.close()
+    if cancelled and cancelled.is_set():
+        os.remove(partial)
+        return done
+    os.replace(partial, path)
+    return done
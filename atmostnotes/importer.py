@@ -0,0 +1,274 @@
+"""Bulk import of HTML, Markdown, plain text and Evernote (ENEX) files into a NoteStore."""
+import calendar
+import html
+import multiprocessing
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .store import encode_content, note_hash
+
+IMPORT_EXTENSIONS = {".html", ".htm", ".md", ".markdown", ".txt", ".enex"}
+IMPORT_WORKERS = os.cpu_count() or 1
+IMPORT_CHUNK_FILES = 64
+IMPORT_BATCH_SIZE = 1000
+
+def iter_import_files(root):
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMPORT_EXTENSIONS:
+                yield os.path.join(directory, filename)
+
+def text_to_html(text):
+    paragraphs = [p for p in re.split(r"\n\s*\n", text.strip()) if p]
+    return "<html><body>" + "".join(
+        "<p>" + html.escape(p).replace("\n", "<br>") + "</p>" for p in paragraphs) + "</body></html>"
+
+def markdown_inline(text):
+    text = html.escape(text)
+    text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
+    text = re.sub(r"\*\*(.+?)\*\*|__(.+?)__", lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = re.sub(r"(?<![\w*])\*(?!\s)(.+?)\*|(?<!\w)_(?!\s)(.+?)_(?!\w)", lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    return re.sub(r"\[([^\]]+)\]\(([^)\s]+)\)", r'<a href="\2">\1</a>', text)
+
+def markdown_to_html(text):
+    # Covers the block syntax notes commonly use: headings, lists, code fences, quotes and paragraphs
+    parts = []
+    paragraph = []
+    list_tag = None
+    code = None
+    def close_blocks():
+        nonlocal list_tag
+        if paragraph:
+            parts.append("<p>" + "<br>".join(markdown_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+        if list_tag:
+            parts.append(f"</{list_tag}>")
+            list_tag = None
+    for line in text.splitlines():
+        if code is not None:
+            if line.strip().startswith("```"):
+                parts.append("<pre>" + html.escape("\n".join(code)) + "</pre>")
+                code = None
+            else:
+                code.append(line)
+            continue
+        stripped = line.strip()
+        heading = re.match(r"(#{1,6})\s+(.*?)\s*#*$", stripped)
+        item = re.match(r"([-*+]|\d+[.)])\s+(.*)", stripped)
+        if stripped.startswith("```"):
+            close_blocks()
+            code = []
+        elif not stripped:
+            close_blocks()
+        elif heading:
+            close_blocks()
+            level = len(heading.group(1))
+            parts.append(f"<h{level}>{markdown_inline(heading.group(2))}</h{level}>")
+        elif item:
+            tag = "ul" if item.group(1) in "-*+" else "ol"
+            if paragraph or list_tag != tag:
+                close_blocks()
+                parts.append(f"<{tag}>")
+                list_tag = tag
+            parts.append(f"<li>{markdown_inline(item.group(2))}</li>")
+        elif stripped.startswith(">"):
+            close_blocks()
+            parts.append(f"<blockquote>{markdown_inline(stripped.lstrip('> '))}</blockquote>")
+        else:
+            if list_tag:
+                close_blocks()
+            paragraph.append(stripped)
+    if code is not None:
+        parts.append("<pre>" + html.escape("\n".join(code)) + "</pre>")
+    close_blocks()
+    return "<html><body>" + "".join(parts) + "</body></html>"
+
+def enml_to_html(enml):
+    enml = re.sub(r"<\?xml[^>]*\?>|<!DOCTYPE[^>]*>", "", enml)
+    enml = re.sub(r"<en-todo\s+checked=\"true\"\s*/>", "☑ ", enml)
+    enml = re.sub(r"<en-todo[^>]*/>", "☐ ", enml)
+    # Attachments are not imported
+    enml = re.sub(r"<en-media[^>]*/>|<en-media[^>]*>.*?</en-media>", "", enml, flags=re.S)
+    enml = re.sub(r"<en-note([^>]*)>", r"<body\1>", enml).replace("</en-note>", "</body>")
+    return "<html>" + enml.strip() + "</html>"
+
+def enex_time(value, default):
+    try:
+        return calendar.timegm(time.strptime(value, "%Y%m%dT%H%M%SZ"))
+    except (TypeError, ValueError):
+        return default
+
+def parse_enex(path):
+    """Yield (title, html, tags, updated_at) for each note of an ENEX export as it is read.
+
+    Exports can hold thousands of notes with embedded attachments. Attachments
+    are dropped as soon as they are parsed and each note once it is yielded, so
+    memory use does not grow with the size of the file.
+    """
+    default = os.path.getmtime(path)
+    root = None
+    for event, element in ElementTree.iterparse(path, events=("start", "end")):
+        if root is None:
+            root = element
+        elif event != "end":
+            continue
+        elif element.tag == "resource":
+            element.clear()
+        elif element.tag == "note":
+            title = element.findtext("title") or ""
+            tags = ", ".join(tag.text for tag in element.findall("tag") if tag.text)
+            updated = enex_time(element.findtext("updated") or element.findtext("created"), default)
+            yield title, enml_to_html(element.findtext("content") or ""), tags, updated
+            element.clear()
+            # The cleared note is still a child of the root; drop it too
+            root.clear()
+
+def note_row(title, body, tags, updated_at):
+    return title, encode_content(body), tags, updated_at, note_hash(title, body)
+
+def parse_file(path):
+    """Return (title, html, tags, updated_at) for the note in an HTML, Markdown or text file."""
+    extension = os.path.splitext(path)[1].lower()
+    title = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if extension in (".md", ".markdown"):
+        body = markdown_to_html(text)
+    elif extension == ".txt":
+        body = text_to_html(text)
+    else:
+        body = text
+    return title, body, "", os.path.getmtime(path)
+
+def parse_files(paths):
+    """Parse a chunk of files into rows ready to insert; runs in the worker processes.
+
+    Returns (rows, failed) where each row is (title, compressed content, tags,
+    updated_at, content hash).
+    """
+    rows = []
+    failed = 0
+    for path in paths:
+        try:
+            rows.append(note_row(*parse_file(path)))
+        except (OSError, UnicodeError):
+            failed += 1
+    return rows, failed
+
+def file_chunks(paths, size=IMPORT_CHUNK_FILES):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_notes(store, user_id, root, workers=IMPORT_WORKERS, batch_size=IMPORT_BATCH_SIZE,
+                 progress=None, cancelled=None):
+    """Import every supported file under root for a user.
+
+    HTML, Markdown and text files are parsed in a pool of worker processes, a
+    bounded number of chunks at a time. ENEX exports, which can be large on
+    their own, are then streamed note by note in this process. Notes are
+    inserted in batches of batch_size rows with one executemany per batch.
+    Notes whose title and text match an existing note of the user, or one
+    imported earlier in the same run, are skipped. progress(done, total)
+    is called with the number of files handled. Returns (imported, duplicates,
+    failed), failed counting files that could not be read or parsed.
+    """
+    paths = list(iter_import_files(root))
+    enex_paths = [path for path in paths if path.lower().endswith(".enex")]
+    total = len(paths)
+    seen = {row[0] for row in store.reader().execute(
+        'SELECT content_hash FROM notes WHERE user_id = ? AND content_hash IS NOT NULL', (user_id,))}
+    imported = duplicates = failed = done = 0
+    batch = []
+    writes = []
+
+    def flush():
+        nonlocal imported
+        if batch:
+            writes.append(store.write_many('''
+                INSERT INTO notes (user_id, title, content, tags, updated_at, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', list(batch)))
+            batch.clear()
+        # Keep parsing while the previous batch is written, but never queue more than that
+        while len(writes) > 1:
+            imported += writes.pop(0).result()
+
+    def add(row):
+        nonlocal duplicates
+        if row[4] in seen:
+            duplicates += 1
+            return
+        seen.add(row[4])
+        batch.append((user_id,) + row)
+        if len(batch) >= batch_size:
+            flush()
+
+    def collect(rows, chunk_failed, files):
+        nonlocal failed, done
+        failed += chunk_failed
+        for row in rows:
+            add(row)
+        done += files
+        if progress:
+            progress(done, total)
+
+    def stream_enex(path):
+        nonlocal failed
+        try:
+            for note in parse_enex(path):
+                if cancelled and cancelled.is_set():
+                    break
+                add(note_row(*note))
+        except (OSError, ElementTree.ParseError, UnicodeError):
+            # Notes read before the error are kept
+            failed += 1
+        collect([], 0, 1)
+
+    if progress:
+        progress(0, total)
+    chunks = file_chunks(path for path in paths if not path.lower().endswith(".enex"))
+    if workers <= 1:
+        for chunk in chunks:
+            if cancelled and cancelled.is_set():
+                break
+            collect(*parse_files(chunk), len(chunk))
+    else:
+        # Spawned rather than forked: the calling process runs threads (the store's writer, Qt)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            running = {}
+            while not (cancelled and cancelled.is_set()):
+                while len(running) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    running[executor.submit(parse_files, chunk)] = len(chunk)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    files = running.pop(future)
+                    try:
+                        rows, chunk_failed = future.result()
+                    except Exception:
+                        rows, chunk_failed = [], files
+                    collect(rows, chunk_failed, files)
+            for future in running:
+                future.cancel()
+    for path in enex_paths:
+        if cancelled and cancelled.is_set():
+            break
+        stream_enex(path)
+    flush()
+    for write in writes:
+        imported += write.result()
+    return imported, duplicates, failed
@@ -0,0 +1,100 @@
+"""Full-text search and tag filtering over a user's notes."""
+import json
+import re
+
+from .store import tag_list
+
+TAG_FACET_LIMIT = 30
+TAG_FACET_SCAN_MIN = 50000
+
+def build_fts_query(query):
+    # Every word becomes a quoted prefix term, so "meet" matches "meeting" and FTS syntax is never interpreted
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+def parse_tag_filter(text):
+    """Parse a tag filter such as "work, urgent | today" into groups of tag names.
+
+    Commas separate groups that must all match; "|" separates tags of which any
+    may match. Tags are matched case-insensitively.
+    """
+    groups = []
+    for group in text.split(","):
+        names = json.loads(tag_list(group.replace("|", ",")))
+        if names:
+            groups.append(names)
+    return groups
+
+def tag_filter_sql(user_id, groups):
+    """Return SQL selecting the ids of notes matching tag groups (see parse_tag_filter), and its parameters."""
+    parts, params = [], []
+    for names in groups:
+        parts.append(f'''
+            SELECT note_id FROM note_tags
+            WHERE tag_id IN (SELECT id FROM tags WHERE user_id = ? AND name IN ({",".join("?" * len(names))}))
+        ''')
+        params += [user_id, *names]
+    return " INTERSECT ".join(parts), params
+
+def search_note_ids(conn, user_id, query, candidates=None, tags=None):
+    """Return the ids of a user's notes matching query, best match first.
+
+    When candidates is given (the ids matched by a query this one extends), only
+    those notes are considered. tags, groups from parse_tag_filter, further
+    limits the result to notes with those tags.
+    """
+    match = build_fts_query(query)
+    if not match:
+        return []
+    # Title hits rank above tag hits, which rank above body hits
+    sql = '''
+        SELECT notes.id FROM notes_fts
+        JOIN notes ON notes.id = notes_fts.rowid
+        WHERE notes_fts MATCH ? AND notes.user_id = ?
+    '''
+    params = [match, user_id]
+    if candidates is not None:
+        sql += ' AND notes_fts.rowid IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(candidates))
+    if tags:
+        filter_sql, filter_params = tag_filter_sql(user_id, tags)
+        sql += f' AND notes.id IN ({filter_sql})'
+        params += filter_params
+    return [row[0] for row in conn.execute(sql + ' ORDER BY bm25(notes_fts, 10.0, 1.0, 5.0)', params)]
+
+def tagged_note_ids(conn, user_id, tags):
+    """Return the ids of a user's notes matching tag groups, most recently updated first."""
+    filter_sql, params = tag_filter_sql(user_id, tags)
+    rows = conn.execute(f'SELECT id FROM notes WHERE id IN ({filter_sql}) ORDER BY updated_at DESC, id DESC', params)
+    return [row[0] for row in rows]
+
+def tag_facets(conn, user_id, note_ids=None, limit=TAG_FACET_LIMIT):
+    """Return (tag, count) for the most used tags among note_ids, or among all of a user's notes."""
+    if note_ids is None:
+        # Counting each tag's range of the (tag_id, note_id) index needs no temporary GROUP BY tree
+        rows = conn.execute('''
+            SELECT name, count FROM (
+                SELECT name, (SELECT COUNT(*) FROM note_tags WHERE tag_id = tags.id) AS count
+                FROM tags WHERE user_id = ?
+            ) WHERE count > 0 ORDER BY count DESC, name LIMIT ?
+        ''', (user_id, limit))
+    elif len(note_ids) < TAG_FACET_SCAN_MIN:
+        rows = conn.execute('''
+            SELECT tags.name, COUNT(*) FROM note_tags JOIN tags ON tags.id = note_tags.tag_id
+            WHERE note_tags.note_id IN (SELECT value FROM json_each(?))
+            GROUP BY tags.id ORDER BY COUNT(*) DESC, tags.name LIMIT ?
+        ''', (json.dumps(note_ids), limit))
+    else:
+        # For a large share of the notes, scanning the tag index in order beats looking up every note
+        rows = conn.execute('''
+            SELECT tags.name, counts.count FROM (
+                SELECT tag_id, COUNT(*) AS count FROM note_tags INDEXED BY note_tags_tag
+                WHERE note_id IN (SELECT value FROM json_each(?)) GROUP BY tag_id
+            ) AS counts JOIN tags ON tags.id = counts.tag_id
+            ORDER BY counts.count DESC, tags.name LIMIT ?
+        ''', (json.dumps(note_ids), limit))
+    return rows.fetchall()
+
+def extends_query(query, previous):
+    # Every note matching query also matched previous: its words only grew or were added
+    return bool(build_fts_query(previous)) and query.startswith(previous)
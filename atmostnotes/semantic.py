@@ -0,0 +1,248 @@
+"""Semantic search over notes: pluggable text embedders and a memory-mapped vector index.
+
+numpy is optional; without it semantic search is unavailable and
+SemanticIndex raises RuntimeError.
+"""
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EMBEDDING_DIM = 256
+EMBEDDING_BATCH_SIZE = 256
+SEMANTIC_TOP_K = 50
+SEMANTIC_MIN_SCORE = 0.05
+
+@lru_cache(maxsize=1 << 16)
+def feature_bucket(feature, dim):
+    h = zlib.crc32(feature.encode())
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+class HashingEmbedder:
+    """Local embedder needing no model: signed feature hashing of words and word pairs.
+
+    It captures shared vocabulary rather than meaning, but is fast,
+    deterministic and works offline.
+    """
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            words = re.findall(r"\w+", text.lower())
+            features = Counter(words)
+            features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+            vector = [0.0] * self.dim
+            for feature, count in features.items():
+                bucket, sign = feature_bucket(feature, self.dim)
+                vector[bucket] += sign * (1.0 + math.log(count))
+            vectors.append(vector)
+        return vectors
+
+class SentenceTransformerEmbedder:
+    """Local neural embedder; needs the optional sentence-transformers package."""
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers:{model_name}"
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), batch_size=32)
+
+class SemanticIndex:
+    """Note embeddings in a float32 matrix memory-mapped from path, one row per note.
+
+    The note each row belongs to is recorded in the note_embeddings table
+    together with the note's content_hash, so refresh() only embeds notes that
+    are new or changed since they were last indexed. After a user's first
+    refresh, later ones only look at notes updated or added since the one
+    before. Rows of deleted notes are freed on the next refresh and reused.
+    Rows are L2-normalized, so a matrix-vector product gives cosine
+    similarities. The file is rebuilt when the embedder changes. Safe to use
+    from several threads.
+    """
+    def __init__(self, store, embedder, path=None):
+        if numpy is None:
+            raise RuntimeError("Semantic search needs numpy")
+        self.store = store
+        self.embedder = embedder
+        self.path = path or store.path + ".vectors"
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.dim = embedder.dim
+        self.rows = {}
+        self.free = []
+        # user id -> (updated_at, id) of the newest notes seen by the user's last refresh
+        self.refreshed = {}
+        self.owners = numpy.zeros(0, dtype=numpy.int64)
+        self.ids = numpy.zeros(0, dtype=numpy.int64)
+        self.count = 0
+        self.matrix = None
+        meta = {"model": embedder.name, "dim": self.dim}
+        mapping = store.reader().execute('''
+            SELECT e.note_id, e.row, n.user_id FROM note_embeddings e JOIN notes n ON n.id = e.note_id
+        ''').fetchall()
+        try:
+            with open(self.path + ".json") as f:
+                valid = json.load(f) == meta
+            rows = os.path.getsize(self.path) // (4 * self.dim)
+            valid = valid and all(row < rows for _, row, _ in mapping)
+        except (OSError, ValueError):
+            valid = False
+        if not valid:
+            # New embedder, or the vector file is missing or cut short: index everything again
+            store.write('DELETE FROM note_embeddings')
+            store.write('DELETE FROM deleted_embeddings').result()
+            mapping, rows = [], 0
+            open(self.path, "wb").close()
+            with open(self.path + ".json", "w") as f:
+                json.dump(meta, f)
+        self.resize(max(rows, 1024))
+        for note_id, row, user_id in mapping:
+            self.rows[note_id] = row
+            self.ids[row] = note_id
+            self.owners[row] = user_id
+            self.count = max(self.count, row + 1)
+        self.free = sorted(set(range(self.count)) - set(self.rows.values()), reverse=True)
+        self.drop_deleted()
+
+    def resize(self, capacity):
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.path, "r+b") as f:
+            f.truncate(capacity * 4 * self.dim)
+        self.matrix = numpy.memmap(self.path, dtype=numpy.float32, mode="r+", shape=(capacity, self.dim))
+        ids = numpy.full(capacity, -1, dtype=numpy.int64)
+        owners = numpy.full(capacity, -1, dtype=numpy.int64)
+        ids[:len(self.ids)] = self.ids
+        owners[:len(self.owners)] = self.owners
+        self.ids, self.owners = ids, owners
+
+    def vectors(self, texts):
+        matrix = numpy.asarray(self.embedder.embed(texts), dtype=numpy.float32).reshape(len(texts), self.dim)
+        norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / numpy.maximum(norms, 1e-12)
+
+    def add(self, entries, vectors):
+        """Store vectors for (note_id, user_id, content_hash) entries."""
+        with self.lock:
+            rows = []
+            for note_id, user_id, _ in entries:
+                row = self.rows.get(note_id)
+                if row is None and self.free:
+                    row = self.rows[note_id] = self.free.pop()
+                elif row is None:
+                    row = self.rows[note_id] = self.count
+                    self.count += 1
+                    if row >= len(self.matrix):
+                        self.resize(len(self.matrix) * 2)
+                self.ids[row] = note_id
+                self.owners[row] = user_id
+                rows.append(row)
+            self.matrix[rows] = vectors
+        return self.store.write_many('INSERT OR REPLACE INTO note_embeddings (note_id, row, content_hash) VALUES (?, ?, ?)',
+                                     [(note_id, row, content_hash) for (note_id, _, content_hash), row in zip(entries, rows)])
+
+    def drop_deleted(self):
+        """Free the rows that deleted notes used, as logged by the notes delete trigger."""
+        logged = [row for (row,) in self.store.reader().execute('SELECT row FROM deleted_embeddings')]
+        if not logged:
+            return
+        with self.lock:
+            for row in logged:
+                # Rows past the end or already free were never loaded, e.g. logged before the index was opened
+                if row < len(self.ids) and self.ids[row] != -1:
+                    self.rows.pop(int(self.ids[row]), None)
+                    self.ids[row] = -1
+                    self.owners[row] = -1
+                    self.free.append(row)
+        # Queued ahead of any write that reuses one of the rows
+        self.store.write_many('DELETE FROM deleted_embeddings WHERE row = ?', [(row,) for row in logged])
+
+    def refresh(self, user_id, cancelled=None):
+        """Embed every note of a user that is new or changed; returns the number embedded."""
+        with self.refresh_lock:
+            # Only one refresh runs at a time, so a note is never embedded twice concurrently
+            self.drop_deleted()
+            reader = self.store.reader()
+            # Read before the notes, so a note saved in between is looked at again next time
+            newest = reader.execute('''
+                SELECT (SELECT max(updated_at) FROM notes WHERE user_id = ?), (SELECT max(id) FROM notes)
+            ''', (user_id,)).fetchone()
+            since = self.refreshed.get(user_id)
+            if since is None:
+                cursor = reader.execute('''
+                    SELECT n.id, n.content_hash, coalesce(n.title, '') || char(10) || html_to_text(n.content)
+                    FROM notes n LEFT JOIN note_embeddings e ON e.note_id = n.id
+                    WHERE n.user_id = ? AND (e.note_id IS NULL OR e.content_hash IS NOT n.content_hash)
+                ''', (user_id,))
+            else:
+                # Saves stamp updated_at with the time of the write; imports keep the file's time but get new ids.
+                # NOT INDEXED keeps the id range on the primary key rather than a walk of the user's index entries
+                cursor = reader.execute('''
+                    SELECT n.id, n.content_hash, coalesce(n.title, '') || char(10) || html_to_text(n.content)
+                    FROM notes n LEFT JOIN note_embeddings e ON e.note_id = n.id
+                    WHERE n.id IN (
+                        SELECT id FROM notes WHERE user_id = ? AND updated_at >= ?
+                        UNION SELECT id FROM notes NOT INDEXED WHERE id > ? AND user_id = ?
+                    ) AND (e.note_id IS NULL OR e.content_hash IS NOT n.content_hash)
+                ''', (user_id, since[0], since[1], user_id))
+            done = 0
+            write = None
+            while not (cancelled and cancelled.is_set()):
+                batch = cursor.fetchmany(EMBEDDING_BATCH_SIZE)
+                if not batch:
+                    break
+                vectors = self.vectors([text for _, _, text in batch])
+                write = self.add([(note_id, user_id, content_hash) for note_id, content_hash, _ in batch], vectors)
+                done += len(batch)
+            if write is not None:
+                write.result()
+            with self.lock:
+                self.matrix.flush()
+            if not (cancelled and cancelled.is_set()) and None not in newest:
+                self.refreshed[user_id] = newest
+            return done
+
+    def search(self, user_id, query, k=SEMANTIC_TOP_K):
+        """Return ids of the user's notes most similar to a query text, best first."""
+        return self.nearest(user_id, self.vectors([query])[0], k)
+
+    def related(self, user_id, note_id, k=SEMANTIC_TOP_K):
+        """Return ids of the user's notes most similar to an indexed note, best first."""
+        with self.lock:
+            row = self.rows.get(note_id)
+            if row is None:
+                return []
+            vector = numpy.array(self.matrix[row])
+        return [i for i in self.nearest(user_id, vector, k + 1) if i != note_id][:k]
+
+    def nearest(self, user_id, vector, k):
+        with self.lock:
+            if not self.count:
+                return []
+            scores = self.matrix[:self.count] @ vector
+            scores[self.owners[:self.count] != user_id] = -numpy.inf
+            k = min(k, self.count)
+            top = numpy.argpartition(-scores, k - 1)[:k]
+            top = top[numpy.argsort(-scores[top])]
+            return [int(self.ids[row]) for row in top if scores[row] >= SEMANTIC_MIN_SCORE]
+
+    def close(self):
+        with self.lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+                self.matrix = None
@@ -0,0 +1,651 @@
+"""SQLite storage for Atmost Notes: schema, migrations and the NoteStore."""
+import difflib
+import hashlib
+import itertools
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from html import unescape
+
+from .diagnostics import recorder
+
+DB_PATH = 'atmostnotes.db'
+STORE_CACHE_KIB = 32 * 1024
+STORE_GROUP_COMMIT_LIMIT = 256
+CONTENT_COMPRESSION_LEVEL = 6
+# Writer queue priorities: writes before maintenance; stopping comes after the writes queued before it
+WRITE_PRIORITY = 0
+MAINTENANCE_PRIORITY = 1
+REVISION_KEYFRAME_INTERVAL = 64
+REVISION_KEEP_RECENT = 100
+REVISION_COMPACT_AGE = 7 * 24 * 3600
+REVISION_COMPACT_BUCKET = 24 * 3600
+
+# Tags are stripped with regular expressions rather than html.parser, which is about ten times
+# slower; the search index triggers run this on every write and the importer on every file
+SKIPPED_HTML = re.compile(r"<(head|style|script|title)\b[^>]*>.*?</\1\s*>|<!--.*?-->", re.S | re.I)
+BLOCK_TAGS = re.compile(r"</?(?:p|br|div|li|ul|ol|tr|td|th|table|pre|hr|h[1-6]|blockquote)\b[^>]*>", re.I)
+ANY_TAG = re.compile(r"<[^>]*>")
+
+def encode_content(html):
+    # Note bodies are stored as zlib-compressed HTML; Qt's markup compresses very well
+    return zlib.compress(html.encode(), CONTENT_COMPRESSION_LEVEL)
+
+def decode_content(value):
+    # Notes written before compression hold plain HTML text
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+def make_delta(source, target):
+    """Return a compressed delta that rebuilds target from source, line by line."""
+    source_lines = source.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, source_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode(), CONTENT_COMPRESSION_LEVEL)
+
+def apply_delta(source, delta):
+    source_lines = source.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta)):
+        parts.append("".join(source_lines[op[0]:op[1]]) if isinstance(op, list) else op)
+    return "".join(parts)
+
+def html_to_text(html):
+    # Registered as an SQLite function so the FTS triggers index the visible text, not Qt's markup
+    html = decode_content(html)
+    if not html:
+        return ""
+    text = ANY_TAG.sub("", BLOCK_TAGS.sub("\n", SKIPPED_HTML.sub("", html)))
+    return re.sub(r"\n\s*\n+", "\n", unescape(text)).strip()
+
+def tag_list(tags):
+    # Registered as an SQLite function: the note_tags triggers split the comma-separated notes.tags with it.
+    # Returns the distinct tags, case-insensitively, as a JSON array for json_each.
+    names = {}
+    for tag in (tags or "").split(","):
+        tag = " ".join(tag.split()).lstrip("#")
+        if tag:
+            names.setdefault(tag.lower(), tag)
+    return json.dumps(list(names.values()))
+
+def note_hash(title, html):
+    # Identifies a note by what it shows, so the same note imported from HTML or Markdown twice is found
+    return hashlib.sha256(f"{title}\0{html_to_text(html)}".encode()).hexdigest()
+
+class TimedConnection(sqlite3.Connection):
+    # Times statements for the diagnostics recorder while it is enabled. A SELECT is timed up to its
+    # first row; for the queries the app runs that is most of the work (sorting, FTS matching, counting).
+    def execute(self, sql, parameters=()):
+        if not recorder.enabled:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            recorder.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        if not recorder.enabled:
+            return super().executemany(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            recorder.record_query(sql, time.perf_counter() - started)
+
+def connect_db(path=DB_PATH, check_same_thread=True):
+    # Every connection needs html_to_text and tag_list, since the search index and tag triggers call them.
+    # Transactions are explicit (isolation_level=None); NoteStore's writer is the only one that opens them.
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=check_same_thread,
+                           factory=TimedConnection)
+    conn.create_function("html_to_text", 1, html_to_text, deterministic=True)
+    conn.create_function("tag_list", 1, tag_list, deterministic=True)
+    # In WAL mode NORMAL only syncs at checkpoints, so commits never wait for fsync
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = {-STORE_CACHE_KIB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def create_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            title TEXT,
+            content TEXT,
+            tags TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            password TEXT,
+            profile_pic BLOB
+        )
+    ''')
+
+
+def migrate_ai_columns(cursor):
+    cursor.execute('PRAGMA table_info(notes)')
+    columns = {row[1] for row in cursor.fetchall()}
+    for column in ("summary", "ai_tags", "ai_hash"):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE notes ADD COLUMN {column} TEXT')
+
+def migrate_search_index(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'")
+    exists = cursor.fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            title, body, tags,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts (rowid, title, body, tags)
+            VALUES (new.id, new.title, html_to_text(new.content), new.tags);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            DELETE FROM notes_fts WHERE rowid = old.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF title, content, tags ON notes BEGIN
+            UPDATE notes_fts SET title = new.title, body = html_to_text(new.content), tags = new.tags
+            WHERE rowid = new.id;
+        END
+    ''')
+    if not exists:
+        # Index notes written before the search index existed
+        cursor.execute('''
+            INSERT INTO notes_fts (rowid, title, body, tags)
+            SELECT id, title, html_to_text(content), tags FROM notes
+        ''')
+
+def migrate_lookup_indexes(cursor):
+    cursor.execute('ALTER TABLE notes ADD COLUMN updated_at REAL')
+    cursor.execute('UPDATE notes SET updated_at = ?', (time.time(),))
+    cursor.execute('CREATE INDEX IF NOT EXISTS notes_user_title ON notes (user_id, title)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS notes_user_updated ON notes (user_id, updated_at)')
+    # Older versions let change_username create duplicates; keep the oldest account's name as is
+    cursor.execute('''
+        UPDATE users SET username = username || ' (' || id || ')'
+        WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY username)
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)')
+
+def migrate_ai_cache(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT,
+            size INTEGER,
+            created_at REAL,
+            last_used REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ai_cache_last_used ON ai_cache (last_used)')
+
+def migrate_note_revisions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_revisions (
+            id INTEGER PRIMARY KEY,
+            note_id INTEGER NOT NULL,
+            created_at REAL,
+            delta BLOB
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS note_revisions_note ON note_revisions (note_id, id)')
+
+def migrate_revision_keyframes(cursor):
+    # A keyframe revision holds its whole compressed body in delta instead of a diff
+    cursor.execute('ALTER TABLE note_revisions ADD COLUMN keyframe INTEGER NOT NULL DEFAULT 0')
+
+def migrate_content_hash(cursor):
+    cursor.execute('ALTER TABLE notes ADD COLUMN content_hash TEXT')
+    rows = cursor.execute('SELECT id, title, content FROM notes').fetchall()
+    cursor.executemany('UPDATE notes SET content_hash = ? WHERE id = ?',
+                       ((note_hash(title or "", content), note_id) for note_id, title, content in rows))
+    cursor.execute('CREATE INDEX IF NOT EXISTS notes_user_hash ON notes (user_id, content_hash)')
+
+def migrate_avatars(cursor):
+    # Profile pictures move out of users, so reading a user row never pulls in a multi-megabyte image.
+    # Thumbnails get their own table: updating a row rewrites all of it, including a large BLOB.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS avatar_images (
+            user_id INTEGER PRIMARY KEY,
+            image BLOB
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS avatars (
+            user_id INTEGER PRIMARY KEY,
+            thumbnail BLOB
+        )
+    ''')
+    cursor.execute('INSERT INTO avatar_images (user_id, image) SELECT id, profile_pic FROM users WHERE profile_pic IS NOT NULL')
+    cursor.execute('UPDATE users SET profile_pic = NULL WHERE profile_pic IS NOT NULL')
+
+def migrate_note_embeddings(cursor):
+    # Maps notes to rows of the semantic index's vector file (see atmostnotes.semantic)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_embeddings (
+            note_id INTEGER PRIMARY KEY,
+            row INTEGER NOT NULL,
+            content_hash TEXT
+        )
+    ''')
+
+def migrate_tags(cursor):
+    # notes.tags stays the text shown in the editor; triggers keep this normalized copy of it in step,
+    # so filtering by a tag is an index lookup instead of a LIKE scan that also matches inside other tags.
+    # Tag ids are looked up with a subquery: as a join, SQLite may loop over tags and call tag_list per row
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL COLLATE NOCASE,
+            UNIQUE (user_id, name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS note_tags (
+            note_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (note_id, tag_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag_id, note_id)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS note_tags_insert AFTER INSERT ON notes WHEN new.tags != '' BEGIN
+            INSERT OR IGNORE INTO tags (user_id, name) SELECT new.user_id, value FROM json_each(tag_list(new.tags));
+            INSERT OR IGNORE INTO note_tags (note_id, tag_id)
+            SELECT new.id, (SELECT id FROM tags WHERE user_id = new.user_id AND name = value)
+            FROM json_each(tag_list(new.tags));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS note_tags_update AFTER UPDATE OF tags ON notes WHEN old.tags IS NOT new.tags BEGIN
+            DELETE FROM note_tags WHERE note_id = old.id;
+            INSERT OR IGNORE INTO tags (user_id, name) SELECT new.user_id, value FROM json_each(tag_list(new.tags));
+            INSERT OR IGNORE INTO note_tags (note_id, tag_id)
+            SELECT new.id, (SELECT id FROM tags WHERE user_id = new.user_id AND name = value)
+            FROM json_each(tag_list(new.tags));
+            DELETE FROM tags WHERE user_id = old.user_id AND name IN (SELECT value FROM json_each(tag_list(old.tags)))
+                AND NOT EXISTS (SELECT 1 FROM note_tags WHERE tag_id = tags.id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS note_tags_delete AFTER DELETE ON notes BEGIN
+            DELETE FROM note_tags WHERE note_id = old.id;
+            DELETE FROM tags WHERE user_id = old.user_id AND name IN (SELECT value FROM json_each(tag_list(old.tags)))
+                AND NOT EXISTS (SELECT 1 FROM note_tags WHERE tag_id = tags.id);
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO tags (user_id, name)
+        SELECT notes.user_id, value FROM notes, json_each(tag_list(notes.tags)) WHERE notes.tags != ''
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO note_tags (note_id, tag_id)
+        SELECT notes.id, (SELECT id FROM tags WHERE user_id = notes.user_id AND name = value)
+        FROM notes, json_each(tag_list(notes.tags)) WHERE notes.tags != ''
+    ''')
+
+def migrate_embedding_cleanup(cursor):
+    # Deleting a note drops its note_embeddings entry and logs the vector row it used,
+    # for the semantic index to clear and reuse on its next refresh
+    cursor.execute('CREATE TABLE IF NOT EXISTS deleted_embeddings (row INTEGER PRIMARY KEY)')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS note_embeddings_delete AFTER DELETE ON notes BEGIN
+            INSERT OR IGNORE INTO deleted_embeddings (row) SELECT row FROM note_embeddings WHERE note_id = old.id;
+            DELETE FROM note_embeddings WHERE note_id = old.id;
+        END
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO deleted_embeddings (row)
+        SELECT row FROM note_embeddings WHERE note_id NOT IN (SELECT id FROM notes)
+    ''')
+    cursor.execute('DELETE FROM note_embeddings WHERE note_id NOT IN (SELECT id FROM notes)')
+
+def migrate_export_index(cursor):
+    # Serves WHERE user_id = ? ORDER BY id, so an export streams notes instead of sorting every body first
+    cursor.execute('CREATE INDEX IF NOT EXISTS notes_user_id ON notes (user_id, id)')
+
+# Append only: a database at user_version N has had the first N migrations applied
+SCHEMA_MIGRATIONS = [
+    migrate_ai_columns,
+    migrate_search_index,
+    migrate_lookup_indexes,
+    migrate_ai_cache,
+    migrate_note_revisions,
+    migrate_revision_keyframes,
+    migrate_content_hash,
+    migrate_avatars,
+    migrate_note_embeddings,
+    migrate_tags,
+    migrate_embedding_cleanup,
+    migrate_export_index,
+]
+
+def migrate_schema(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number}')
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def insert_note(conn, user_id, title, html, tags, now=None):
+    return conn.execute('''
+        INSERT INTO notes (user_id, title, content, tags, updated_at, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, title, encode_content(html), tags, time.time() if now is None else now,
+          note_hash(title, html))).lastrowid
+
+def update_note(conn, note_id, user_id, title, html, tags, now=None):
+    """Store a new version of a note, appending the previous body to note_revisions as a delta.
+
+    Each revision holds a reverse delta that rebuilds the body it replaced from
+    the body that replaced it. Every REVISION_KEYFRAME_INTERVAL revisions the
+    whole body is stored instead, so reconstructing any revision applies at
+    most that many deltas. Returns False when nothing changed.
+    """
+    row = conn.execute('SELECT title, content, tags FROM notes WHERE id = ? AND user_id = ?',
+                       (note_id, user_id)).fetchone()
+    if row is None:
+        return False
+    now = time.time() if now is None else now
+    previous = decode_content(row[1])
+    if previous != html:
+        since_keyframe = conn.execute('''
+            SELECT COUNT(*) FROM note_revisions WHERE note_id = ? AND id > COALESCE(
+                (SELECT MAX(id) FROM note_revisions WHERE note_id = ? AND keyframe), 0)
+        ''', (note_id, note_id)).fetchone()[0]
+        if since_keyframe + 1 >= REVISION_KEYFRAME_INTERVAL:
+            conn.execute('INSERT INTO note_revisions (note_id, created_at, delta, keyframe) VALUES (?, ?, ?, 1)',
+                         (note_id, now, encode_content(previous)))
+        else:
+            conn.execute('INSERT INTO note_revisions (note_id, created_at, delta) VALUES (?, ?, ?)',
+                         (note_id, now, make_delta(html, previous)))
+        conn.execute('UPDATE notes SET title = ?, content = ?, tags = ?, updated_at = ?, content_hash = ? WHERE id = ?',
+                     (title, encode_content(html), tags, now, note_hash(title, html), note_id))
+    elif (row[0], row[2]) != (title, tags):
+        conn.execute('UPDATE notes SET title = ?, tags = ?, updated_at = ?, content_hash = ? WHERE id = ?',
+                     (title, tags, now, note_hash(title, html), note_id))
+    else:
+        return False
+    return True
+
+def list_revisions(conn, note_id):
+    """Return (revision id, created_at) pairs for a note, newest first."""
+    return conn.execute('SELECT id, created_at FROM note_revisions WHERE note_id = ? ORDER BY id DESC',
+                        (note_id,)).fetchall()
+
+def reconstruct_revision(conn, revision_id):
+    """Return the body a note had before the save that created revision_id, or None if there is no such revision."""
+    row = conn.execute('SELECT note_id FROM note_revisions WHERE id = ?', (revision_id,)).fetchone()
+    if row is None:
+        return None
+    note_id = row[0]
+    # Start from the nearest keyframe at or after the revision, or from the current body
+    start = conn.execute('''
+        SELECT id, delta FROM note_revisions WHERE note_id = ? AND id >= ? AND keyframe
+        ORDER BY id LIMIT 1
+    ''', (note_id, revision_id)).fetchone()
+    if start is None:
+        html = decode_content(conn.execute('SELECT content FROM notes WHERE id = ?', (note_id,)).fetchone()[0])
+        end = None
+    else:
+        html = decode_content(start[1])
+        end = start[0]
+    deltas = conn.execute('''
+        SELECT delta FROM note_revisions WHERE note_id = ? AND id >= ? AND (? IS NULL OR id < ?)
+        ORDER BY id DESC
+    ''', (note_id, revision_id, end, end))
+    for (delta,) in deltas:
+        html = apply_delta(html, delta)
+    return html
+
+def compact_revisions(conn, note_id, now=None, keep_recent=REVISION_KEEP_RECENT,
+                      min_age=REVISION_COMPACT_AGE, bucket=REVISION_COMPACT_BUCKET):
+    """Thin a note's old revisions down to the newest one per bucket of seconds.
+
+    The newest keep_recent revisions and those younger than min_age are kept.
+    Deltas next to removed revisions are rebuilt so the chain stays intact.
+    Returns the number of revisions removed.
+    """
+    now = time.time() if now is None else now
+    row = conn.execute('SELECT content FROM notes WHERE id = ?', (note_id,)).fetchone()
+    if row is None:
+        return 0
+    newer = kept_newer = decode_content(row[0])
+    removed = since_keyframe = 0
+    gap = False
+    seen_buckets = set()
+    revisions = conn.execute('''
+        SELECT id, created_at, delta, keyframe FROM note_revisions WHERE note_id = ? ORDER BY id DESC
+    ''', (note_id,)).fetchall()
+    for position, (revision_id, created_at, delta, keyframe) in enumerate(revisions):
+        html = decode_content(delta) if keyframe else apply_delta(newer, delta)
+        newer = html
+        old = position >= keep_recent and created_at < now - min_age
+        if old and created_at // bucket in seen_buckets:
+            conn.execute('DELETE FROM note_revisions WHERE id = ?', (revision_id,))
+            removed += 1
+            gap = True
+            continue
+        seen_buckets.add(created_at // bucket)
+        if keyframe:
+            since_keyframe = 0
+        elif since_keyframe + 1 >= REVISION_KEYFRAME_INTERVAL:
+            conn.execute('UPDATE note_revisions SET delta = ?, keyframe = 1 WHERE id = ?',
+                         (encode_content(html), revision_id))
+            since_keyframe = 0
+        else:
+            if gap:
+                # This delta was against the body of the revision just removed
+                conn.execute('UPDATE note_revisions SET delta = ? WHERE id = ?',
+                             (make_delta(kept_newer, html), revision_id))
+            since_keyframe += 1
+        kept_newer = html
+        gap = False
+    return removed
+
+def notes_to_compact(conn, now=None, keep_recent=REVISION_KEEP_RECENT,
+                     min_age=REVISION_COMPACT_AGE, bucket=REVISION_COMPACT_BUCKET):
+    """Return the ids of the notes compact_revisions() would remove revisions from, without decoding any.
+
+    Those with an old revision, past the newest keep_recent, that has a newer
+    revision in its bucket. Notes already compacted are not returned again.
+    """
+    now = time.time() if now is None else now
+    return [note_id for (note_id,) in conn.execute('''
+        SELECT DISTINCT note_id FROM (
+            SELECT note_id, created_at,
+                   row_number() OVER (PARTITION BY note_id ORDER BY id DESC) AS position,
+                   row_number() OVER (PARTITION BY note_id, CAST(created_at / ? AS INTEGER) ORDER BY id DESC) AS in_bucket
+            FROM note_revisions
+            WHERE note_id IN (SELECT note_id FROM note_revisions WHERE created_at < ?)
+        ) WHERE position > ? AND in_bucket > 1 AND created_at < ?
+    ''', (bucket, now - min_age, keep_recent, now - min_age))]
+
+class NoteStore:
+    """Owns every SQLite connection of the app.
+
+    The database runs in WAL mode, so readers never wait for the writer. Each
+    thread reads through its own connection from reader(), kept for as long as
+    the thread runs. A Python thread's reader is closed once the thread has
+    ended; threads started by Qt keep theirs until close(), and the app's pool
+    threads are never retired, so their number stays bounded. Code that must
+    hold a connection beyond one call opens its own with connect_reader(). All
+    writes are queued to a single writer thread, which runs whatever is waiting
+    (up to group_commit_limit writes) in one transaction and commits once.
+    Every write runs in its own savepoint, so a failing write does not undo the
+    others committed with it. Write methods return a concurrent.futures.Future.
+    Maintenance from submit_maintenance() runs only while no write is waiting,
+    in a transaction of its own, and sync() does not wait for it.
+    """
+    def __init__(self, path=DB_PATH, group_commit_limit=STORE_GROUP_COMMIT_LIMIT):
+        self.path = path
+        self.group_commit_limit = group_commit_limit
+        # Thread id -> (thread, connection); the id, unlike a threading.local, lasts as long as the OS thread
+        self.readers = {}
+        self.readers_lock = threading.Lock()
+        # (priority, sequence, task) entries; the sequence keeps each priority first in, first out
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.submitted = 0
+        self.completed = 0
+        self.closed = False
+        self.progress = threading.Condition()
+        self.writer = connect_db(path, check_same_thread=False)
+        self.writer.execute('PRAGMA journal_mode = WAL')
+        create_schema(self.writer)
+        migrate_schema(self.writer)
+        self.writer_thread = threading.Thread(target=self.write_loop, name="NoteStore writer", daemon=True)
+        self.writer_thread.start()
+
+    def connect_reader(self):
+        """Open a read-only connection owned by the caller, who closes it."""
+        conn = connect_db(self.path, check_same_thread=False)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def reader(self):
+        # Qt runs each Python call on its threads under a short-lived thread state, which would drop a
+        # threading.local between calls; the thread object and id stay the same (a dummy thread for Qt's)
+        thread = threading.current_thread()
+        entry = self.readers.get(thread.ident)
+        if entry is not None and entry[0] is thread:
+            return entry[1]
+        conn = self.connect_reader()
+        with self.readers_lock:
+            ended = [ident for ident, (owner, _) in self.readers.items()
+                     if ident == thread.ident or not owner.is_alive()]
+            retired = [self.readers.pop(ident)[1] for ident in ended]
+            self.readers[thread.ident] = (thread, conn)
+        # Only connections of threads that have ended, so none is in use
+        for old in retired:
+            old.close()
+        return conn
+
+    def submit(self, fn, *args):
+        """Run fn(conn, *args) on the writer thread; the future resolves to its result."""
+        return self.enqueue(WRITE_PRIORITY, fn, args)
+
+    def submit_maintenance(self, fn, *args):
+        """Like submit(), for work no one waits on; it is cancelled if still queued at close()."""
+        return self.enqueue(MAINTENANCE_PRIORITY, fn, args)
+
+    def enqueue(self, priority, fn, args):
+        future = Future()
+        with self.progress:
+            if self.closed:
+                future.set_exception(sqlite3.ProgrammingError("NoteStore is closed"))
+                return future
+            if priority == WRITE_PRIORITY:
+                self.submitted += 1
+            self.queue.put((priority, next(self.sequence), (future, fn, args)))
+        return future
+
+    def write(self, sql, params=()):
+        return self.submit(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def write_many(self, sql, rows):
+        return self.submit(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def sync(self, timeout=None):
+        # Wait until every write submitted so far is committed (or failed)
+        with self.progress:
+            target = self.submitted
+            return self.progress.wait_for(lambda: self.completed >= target, timeout)
+
+    def write_loop(self):
+        while True:
+            priority, _, task = self.queue.get()
+            if task is None:
+                break
+            batch = [task]
+            # Writes are grouped; maintenance runs on its own, so no write commits later for it
+            while priority == WRITE_PRIORITY and len(batch) < self.group_commit_limit:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry[0] != WRITE_PRIORITY or entry[2] is None:
+                    self.queue.put(entry)
+                    break
+                batch.append(entry[2])
+            with recorder.timed("store.write_batch" if priority == WRITE_PRIORITY else "store.maintenance"):
+                self.run_batch(batch, counted=priority == WRITE_PRIORITY)
+        # Only maintenance can be left behind the stop entry
+        while not self.queue.empty():
+            self.queue.get_nowait()[2][0].cancel()
+
+    def run_batch(self, batch, counted=True):
+        results = []
+        try:
+            self.writer.execute('BEGIN IMMEDIATE')
+            for future, fn, args in batch:
+                self.writer.execute('SAVEPOINT write')
+                try:
+                    result = fn(self.writer, *args)
+                except Exception as e:
+                    self.writer.execute('ROLLBACK TO write')
+                    self.writer.execute('RELEASE write')
+                    results.append((future, None, e))
+                else:
+                    self.writer.execute('RELEASE write')
+                    results.append((future, result, None))
+            self.writer.execute('COMMIT')
+        except sqlite3.Error as e:
+            if self.writer.in_transaction:
+                self.writer.execute('ROLLBACK')
+            results = [(future, None, e) for future, _, _ in batch]
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        if counted:
+            with self.progress:
+                self.completed += len(batch)
+                self.progress.notify_all()
+
+    def close(self):
+        with self.progress:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put((WRITE_PRIORITY, next(self.sequence), None))
+        self.writer_thread.join()
+        self.writer.close()
+        with self.readers_lock:
+            for _, conn in self.readers.values():
+                conn.close()
+            self.readers.clear()
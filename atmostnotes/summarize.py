@@ -0,0 +1,138 @@
+"""Map-reduce summarization of notes too long for a single prompt."""
+import hashlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .chat import CHARS_PER_TOKEN, estimate_tokens
+
+SUMMARY_CHUNK_TOKENS = 2000
+SUMMARY_CONCURRENCY = 4
+SUMMARY_WORKERS = 8
+
+SUMMARY_PROMPT = "Please summarize the following note:\n\n{note}"
+CHUNK_SUMMARY_PROMPT = ("Summarize this part of a longer note. Keep names, numbers, decisions and action items:"
+                        "\n\n{chunk}")
+COMBINE_SUMMARY_PROMPT = ("The following are summaries of consecutive parts of one note. "
+                          "Combine them into a single summary of the whole note:\n\n{summaries}")
+
+class SummaryCancelled(Exception):
+    pass
+
+generate_pool = None
+generate_pool_lock = threading.Lock()
+
+def shared_generate_pool():
+    # One long-lived pool runs the generate calls of every summary, however many notes are summarized at once
+    global generate_pool
+    with generate_pool_lock:
+        if generate_pool is None:
+            generate_pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summarize")
+        return generate_pool
+
+def generate_all(generate, prompts, concurrency=SUMMARY_CONCURRENCY, cancelled=None):
+    """Return generate(prompt).strip() for each prompt, running at most concurrency at a time."""
+    pool = shared_generate_pool()
+    results = [None] * len(prompts)
+    pending = iter(enumerate(prompts))
+    running = {}
+    try:
+        while True:
+            if cancelled and cancelled.is_set():
+                raise SummaryCancelled()
+            while len(running) < concurrency:
+                item = next(pending, None)
+                if item is None:
+                    break
+                running[pool.submit(generate, item[1])] = item[0]
+            if not running:
+                return results
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result().strip()
+    finally:
+        for future in running:
+            future.cancel()
+
+def is_boundary(item, cost, target):
+    # Cuts depend only on the item itself, so an edit moves at most the boundaries next to it;
+    # the chance grows with the item's size, giving groups of about target tokens on average
+    digest = hashlib.blake2b(item.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < cost / target * 2 ** 64
+
+def group(items, max_tokens):
+    """Split items into runs of at most max_tokens at content-defined boundaries."""
+    groups, current, size = [], [], 0
+    for item in items:
+        cost = estimate_tokens(item) + 1
+        if current and size + cost > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += cost
+        if size >= max_tokens // 8 and is_boundary(item, cost, max_tokens // 2):
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+def split_chunks(text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """Split text into chunks of at most max_tokens, at paragraph boundaries where possible."""
+    pieces = []
+    limit = max_tokens * CHARS_PER_TOKEN - CHARS_PER_TOKEN
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        while len(paragraph) > limit:
+            # Cut an overlong paragraph after a sentence, or failing that a word
+            end = paragraph.rfind(". ", limit // 2, limit) + 1 or paragraph.rfind(" ", 0, limit) + 1 or limit
+            pieces.append(paragraph[:end].strip())
+            paragraph = paragraph[end:].strip()
+        if paragraph:
+            pieces.append(paragraph)
+    return ["\n".join(chunk) for chunk in group(pieces, max_tokens)]
+
+def summary_prompt(text, generate, cache=None, max_tokens=SUMMARY_CHUNK_TOKENS,
+                   concurrency=SUMMARY_CONCURRENCY, cancelled=None):
+    """Return the prompt whose answer is the summary of text.
+
+    A note that fits in one chunk gets the plain summary prompt. A longer one
+    is split into chunks that are summarized concurrently with
+    generate(prompt), then the chunk summaries are combined in groups, level
+    by level, until one group is left; the prompt combining that last group is
+    returned, so the caller can stream the final answer. With a cache (an
+    AICache) every chunk and group summary is stored under a hash of its
+    input, so after an edit only the chunks that changed, and the groups
+    above them, are summarized again. The cache is read on the calling thread
+    and only the generate calls run on a shared pool, at most concurrency at a
+    time. generate raises on failure; nothing is cached for a failed call.
+    """
+    chunks = split_chunks(text, max_tokens)
+    if len(chunks) <= 1:
+        return SUMMARY_PROMPT.format(note=text)
+
+    def summarize(template, field, values):
+        # Cached summaries are looked up here, on the caller's thread; only misses go to the pool
+        keys = [cache.key(template, value) for value in values] if cache else [None] * len(values)
+        summaries = [cache.get(key) if key else None for key in keys]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        prompts = [template.format(**{field: values[i]}) for i in missing]
+        for i, summary in zip(missing, generate_all(generate, prompts, concurrency, cancelled)):
+            summaries[i] = summary
+            if keys[i] and summary:
+                cache.put(keys[i], summary)
+        return summaries
+
+    level = summarize(CHUNK_SUMMARY_PROMPT, "chunk", chunks)
+    while True:
+        groups = group(level, max_tokens)
+        if len(groups) == len(level):
+            # Every summary came out as its own group; combine them in pairs so the levels shrink
+            groups = [level[i:i + 2] for i in range(0, len(level), 2)]
+        if len(groups) == 1:
+            return COMBINE_SUMMARY_PROMPT.format(summaries="\n\n".join(groups[0]))
+        level = summarize(COMBINE_SUMMARY_PROMPT, "summaries", ["\n\n".join(summaries) for summaries in groups])
+
+def summarize_text(text, generate, cache=None, max_tokens=SUMMARY_CHUNK_TOKENS,
+                   concurrency=SUMMARY_CONCURRENCY, cancelled=None):
+    """Summarize text of any length with generate(prompt); see summary_prompt()."""
+    return generate(summary_prompt(text, generate, cache, max_tokens, concurrency, cancelled)).strip()
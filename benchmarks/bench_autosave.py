@@ -0,0 +1,74 @@
+"""Bytes written per edit when saving a note, before and after delta persistence.
+
+Builds a rich-text note in a QTextDocument, applies a series of small edits and
+saves after each one through the store, comparing the full-HTML rewrite the
+save used to do with the compressed body plus the revision delta now appended.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_autosave.py --edits 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, ROOT)
+    from PyQt6.QtGui import QGuiApplication, QTextCursor, QTextDocument
+    from atmostnotes.store import NoteStore, insert_note, update_note
+
+    app = QGuiApplication(sys.argv)
+    rng = random.Random(0)
+    document = QTextDocument()
+    cursor = QTextCursor(document)
+    for _ in range(args.paragraphs):
+        cursor.insertText(" ".join(rng.choices(WORDS, k=rng.randint(10, 60))) + "\n")
+
+    store = NoteStore(os.path.join(tempfile.mkdtemp(prefix="atmost-bench-"), "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    note_id = store.submit(insert_note, user_id, "Bench", document.toHtml(), "").result()
+
+    full_html, stored = [], []
+    for _ in range(args.edits):
+        # Type a word somewhere in the note, like a user revising a paragraph
+        cursor.setPosition(rng.randrange(document.characterCount()))
+        cursor.insertText(rng.choice(WORDS) + " ")
+        html = document.toHtml()
+        store.submit(update_note, note_id, user_id, "Bench", html, "").result()
+        full_html.append(len(html.encode("utf-8")))
+        body, delta = store.reader().execute('''
+            SELECT length(n.content), length(r.delta) FROM notes n
+            JOIN note_revisions r ON r.note_id = n.id
+            WHERE n.id = ? ORDER BY r.id DESC LIMIT 1
+        ''', (note_id,)).fetchone()
+        stored.append({"body": body, "delta": delta})
+    store.close()
+
+    print(json.dumps({
+        "paragraphs": args.paragraphs,
+        "edits": args.edits,
+        "full_html_bytes_per_edit": round(statistics.mean(full_html)),
+        "compressed_body_bytes_per_edit": round(statistics.mean(s["body"] for s in stored)),
+        "delta_bytes_per_edit": round(statistics.mean(s["delta"] for s in stored)),
+        "history_bytes_full_html": sum(full_html),
+        "history_bytes_deltas": sum(s["delta"] for s in stored),
+    }, indent=2))
+    del app
+
+
+if __name__ == "__main__":
+    main()
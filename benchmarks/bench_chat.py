@@ -0,0 +1,83 @@
+"""Tokens sent per turn and prompt build time of chat over a generated note database.
+
+Generates notes as bench_search.py does and holds a conversation with a
+stand-in model that answers every question with a fixed-length reply, so
+no network is needed. For each turn it reports the estimated prompt tokens
+(retrieved note context plus history) next to what sending the same notes
+whole with the full transcript would cost.
+
+    python benchmarks/bench_chat.py --notes 20000 --turns 30
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = ["What did the meeting agenda say about the budget?", "Summarize the project plan and its review",
+             "Which client invoice is still open?", "Any travel ideas or recipes?", "What is on the roadmap for the next sprint?"]
+REPLY = "Based on your notes, " + "the answer mentions several details from the notes. " * 12
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_search import generate_notes
+    from atmostnotes.chat import ChatSession, estimate_tokens, retrieve_note_ids
+    from atmostnotes.store import NoteStore
+
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    store = NoteStore(os.path.join(workdir, "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    generate_notes(store, user_id, args.notes)
+    chat = ChatSession(store, user_id)
+    conn = store.reader()
+
+    turns, build_times, transcript = [], [], ""
+    for turn in range(args.turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        build, stats = chat.prepare(question)
+        started = time.perf_counter()
+        build()
+        build_times.append(time.perf_counter() - started)
+        chat.record(question, REPLY, stats)
+        fold_prompt = chat.fold_prompt()
+        if fold_prompt:
+            chat.fold("A summary of the earlier conversation. " * 8)
+
+        whole_notes = sum(estimate_tokens(conn.execute('SELECT html_to_text(content) FROM notes WHERE id = ?',
+                                                       (note_id,)).fetchone()[0])
+                          for note_id in retrieve_note_ids(conn, user_id, question, k=chat.top_k))
+        naive = whole_notes + estimate_tokens(transcript + question)
+        transcript += f"User: {question}\nAssistant: {REPLY}\n"
+        turns.append({"prompt_tokens": stats["prompt_tokens"], "context_tokens": stats["context_tokens"],
+                      "history_tokens": stats["history_tokens"], "whole_notes_full_history_tokens": naive})
+    store.close()
+
+    build_times.sort()
+    print(json.dumps({
+        "notes": args.notes,
+        "turns": args.turns,
+        "tokens_per_turn": {"mean": round(statistics.mean(t["prompt_tokens"] for t in turns)),
+                            "max": max(t["prompt_tokens"] for t in turns),
+                            "last": turns[-1]["prompt_tokens"]},
+        "whole_notes_full_history_per_turn": {"mean": round(statistics.mean(t["whole_notes_full_history_tokens"] for t in turns)),
+                                              "last": turns[-1]["whole_notes_full_history_tokens"]},
+        "total_tokens_sent": chat.tokens_sent(),
+        "build_ms": {"p50": round(statistics.median(build_times) * 1000, 2),
+                     "p95": round(build_times[int(len(build_times) * 0.95) - 1] * 1000, 2)},
+        "turns_detail": turns[:3] + turns[-3:],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Cost of the performance instrumentation, disabled and enabled.
+
+Times a cheap indexed SELECT through a plain sqlite3 connection and through
+the store's TimedConnection with the diagnostics recorder off and on, and an
+empty function with and without recorder.traced(). The "off" figures are
+what every user pays; they should be within noise of the plain ones.
+
+    python benchmarks/bench_diagnostics.py --calls 200000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_call_us(fn, calls, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best / calls * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.diagnostics import recorder
+    from atmostnotes.store import TimedConnection
+
+    path = os.path.join(tempfile.mkdtemp(prefix="atmost-bench-"), "bench.db")
+    plain = sqlite3.connect(path, isolation_level=None)
+    plain.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT)')
+    plain.executemany('INSERT INTO notes (title) VALUES (?)', ((f"Note {i}",) for i in range(1000)))
+    timed = sqlite3.connect(path, isolation_level=None, factory=TimedConnection)
+    sql = 'SELECT title FROM notes WHERE id = ?'
+
+    def noop():
+        return None
+
+    traced = recorder.traced("bench.noop")(noop)
+    results = {}
+    recorder.enabled = False
+    results["execute_plain_us"] = per_call_us(lambda: plain.execute(sql, (500,)).fetchone(), args.calls, args.repeat)
+    results["execute_off_us"] = per_call_us(lambda: timed.execute(sql, (500,)).fetchone(), args.calls, args.repeat)
+    results["call_plain_us"] = per_call_us(noop, args.calls, args.repeat)
+    results["call_traced_off_us"] = per_call_us(traced, args.calls, args.repeat)
+    recorder.enabled = True
+    results["execute_on_us"] = per_call_us(lambda: timed.execute(sql, (500,)).fetchone(), args.calls, args.repeat)
+    results["call_traced_on_us"] = per_call_us(traced, args.calls, args.repeat)
+    plain.close()
+    timed.close()
+    print(json.dumps({"calls": args.calls, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Time and memory of exporting every note to an archive, for growing note counts.
+
+Fills a database with generated Qt-style HTML notes (with duplicate and
+unsafe titles), exports it to each archive type and reports notes per second.
+With --memory it instead runs each export in a fresh process and reports
+its peak RSS, SQLite's memory included, and that of the largest rendering
+worker. Both should stay flat as the number of notes grows.
+
+    python benchmarks/bench_export.py --notes 5000 20000 [--memory]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+TITLES = ["Meeting notes", "Plan/Budget", "Ideas: 2024", "todo", "TODO", "", "con"]
+
+
+def note_html(rng):
+    paragraphs = []
+    for _ in range(rng.randint(5, 40)):
+        words = rng.choices(WORDS, k=rng.randint(10, 60))
+        words[0] = f'<span style=" font-weight:700;">{words[0]}</span>'
+        paragraphs.append('<p style=" margin-top:0px; margin-bottom:0px;">' + " ".join(words) + "</p>")
+    return "<html><head><style>p { white-space: pre-wrap; }</style></head><body>" + "\n".join(paragraphs) + "</body></html>"
+
+
+def export_rss(db_path, user_id, path, archive, fmt, workers):
+    # Runs in a fresh process, so ru_maxrss is the peak of this export alone
+    sys.path.insert(0, ROOT)
+    from atmostnotes.exporter import export_notes
+    from atmostnotes.store import NoteStore
+
+    store = NoteStore(db_path)
+    exported = export_notes(store, user_id, path, archive, fmt, workers=workers)
+    store.close()
+    # ru_maxrss is in KiB on Linux
+    return (exported, round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--memory", action="store_true", help="report peak RSS instead of timing")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.exporter import EXPORT_WORKERS, export_notes
+    from atmostnotes.store import NoteStore, encode_content
+
+    workers = args.workers or EXPORT_WORKERS
+    rng = random.Random(0)
+    results = []
+    for count in args.notes:
+        workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+        store = NoteStore(os.path.join(workdir, "bench.db"))
+        user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+        store.write_many('INSERT INTO notes (user_id, title, content, tags, updated_at) VALUES (?, ?, ?, ?, ?)',
+                         ((user_id, rng.choice(TITLES), encode_content(note_html(rng)), "", float(i))
+                          for i in range(count))).result()
+        for archive, fmt, extension in (("zip", "markdown", ".zip"), ("tar", "markdown", ".tar.gz"),
+                                        ("jsonl", "html", ".jsonl")):
+            path = os.path.join(workdir, "export" + extension)
+            if args.memory:
+                # Not a multiprocessing.Pool: its daemonic processes cannot start the rendering workers
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    exported, rss, workers_rss = executor.submit(export_rss, store.path, user_id, path, archive, fmt,
+                                                                 workers).result()
+                result = {"notes": exported, "archive": archive, "format": fmt,
+                          "peak_rss_mib": rss, "workers_peak_rss_mib": workers_rss}
+            else:
+                started = time.perf_counter()
+                exported = export_notes(store, user_id, path, archive, fmt, workers=workers)
+                seconds = time.perf_counter() - started
+                result = {"notes": exported, "archive": archive, "format": fmt,
+                          "seconds": round(seconds, 2), "notes_per_second": round(exported / seconds)}
+            result["archive_mib"] = round(os.path.getsize(path) / 2 ** 20, 2)
+            results.append(result)
+        store.close()
+    print(json.dumps({"workers": workers, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
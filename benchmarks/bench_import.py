@@ -0,0 +1,102 @@
+"""Throughput of the bulk importer on a generated directory tree of note files.
+
+Writes a nested tree of HTML, Markdown and plain text files plus one ENEX
+export, then imports it into a fresh database and reports files per second
+next to the time it takes just to read every file, which is the floor the
+import is measured against. A second import of the same tree shows the cost
+of skipping duplicates.
+
+    python benchmarks/bench_import.py --files 100000 --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+
+
+def sentence(rng, low=8, high=40):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def write_tree(root, count, enex_notes, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        directory = os.path.join(root, f"d{i % 50}", f"e{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        kind = i % 3
+        body = [sentence(rng) for _ in range(rng.randint(3, 12))]
+        if kind == 0:
+            path, text = f"note{i}.html", "<html><body>" + "".join(f"<p>{p}</p>" for p in body) + "</body></html>"
+        elif kind == 1:
+            path, text = f"note{i}.md", f"# Note {i}\n\n" + "\n\n".join(f"- **{p[:10]}** {p}" for p in body)
+        else:
+            path, text = f"note{i}.txt", "\n\n".join(body)
+        with open(os.path.join(directory, path), "w", encoding="utf-8") as f:
+            f.write(text)
+    with open(os.path.join(root, "export.enex"), "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<en-export>\n')
+        for i in range(enex_notes):
+            f.write(f"<note><title>Evernote {i}</title><content><![CDATA[<en-note><div>{sentence(rng)}</div></en-note>]]>"
+                    f"</content><updated>20240101T120000Z</updated><tag>enex</tag></note>\n")
+        f.write("</en-export>\n")
+
+
+def read_all(root):
+    size = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            with open(os.path.join(directory, filename), "rb") as f:
+                size += len(f.read())
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--enex-notes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.importer import IMPORT_WORKERS, import_notes
+    from atmostnotes.store import NoteStore
+
+    workers = args.workers or IMPORT_WORKERS
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    tree = os.path.join(workdir, "tree")
+    write_tree(tree, args.files, args.enex_notes)
+
+    started = time.perf_counter()
+    size = read_all(tree)
+    read_seconds = time.perf_counter() - started
+
+    store = NoteStore(os.path.join(workdir, "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    runs = {}
+    for run in ("first", "reimport"):
+        started = time.perf_counter()
+        imported, duplicates, failed = import_notes(store, user_id, tree, workers=workers)
+        seconds = time.perf_counter() - started
+        runs[run] = {"imported": imported, "duplicates": duplicates, "failed": failed,
+                     "seconds": round(seconds, 2), "files_per_second": round((args.files + 1) / seconds)}
+    store.close()
+
+    print(json.dumps({
+        "files": args.files + 1,
+        "bytes": size,
+        "workers": workers,
+        "read_only_seconds": round(read_seconds, 2),
+        "runs": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Time to restyle the GUI on theme and font changes, with a long note list.
+
+Opens the window offscreen on a temporary database, logs in a user with
+--notes notes and pages the whole list into the sidebar, then times
+switching between the light and dark themes, applying a new custom theme
+(a stylesheet cache miss) and changing the font. Each change is timed on
+its own and together with the repaint it causes. For comparison it also
+times setting the same stylesheet on the whole window, as update_styles
+did before themes were compiled and applied by section.
+
+    python benchmarks/bench_restyle.py --notes 10000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.chdir(tempfile.mkdtemp(prefix="atmost-bench-"))
+    sys.path.insert(0, ROOT)
+    from PyQt6.QtGui import QFont
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    spec = importlib.util.spec_from_file_location("atmost_notes", os.path.join(ROOT, "Atmost-Notes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    window = module.AtmostNotes()
+    store = window.store
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    store.write_many('INSERT INTO notes (user_id, title, content, tags, updated_at) VALUES (?, ?, ?, ?, ?)',
+                     ((user_id, f"Note {i}", "<p>text</p>", "", float(i)) for i in range(args.notes))).result()
+    window.current_user = user_id
+    window.show()
+    window.update_note_list()
+    while window.note_model.canFetchMore():
+        window.note_model.fetchMore()
+    window.show_options()
+    window.content_stack.setCurrentIndex(0)
+    for _ in range(20):
+        app.processEvents()
+
+    def timed(change):
+        alone, painted = [], []
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            change(i)
+            changed = time.perf_counter()
+            app.processEvents()
+            window.grab()
+            alone.append((changed - started) * 1000)
+            painted.append((time.perf_counter() - started) * 1000)
+        return {"change_ms": round(statistics.median(alone), 2), "with_repaint_ms": round(statistics.median(painted), 2)}
+
+    def custom_theme(i):
+        # A color never used before, so every switch compiles a new stylesheet and palette
+        module.Themes.CUSTOM = module.Theme("Custom", f"#{i:06X}", "#F0F0F0", "#333333", "#4A90E2", "#E0E0E0", "#333333")
+        window.change_theme("Custom")
+
+    fonts = [QFont(window.font().family(), size) for size in (10, 11)]
+    results = {
+        "theme_switch": timed(lambda i: window.change_theme("Dark" if i % 2 else "Light")),
+        "new_custom_theme": timed(custom_theme),
+        "font_change": timed(lambda i: window.setFont(fonts[i % 2])),
+    }
+    engine = window.theme_engine
+    results["whole_window_stylesheet"] = timed(
+        lambda i: window.setStyleSheet(engine.stylesheet(module.Themes.DARK if i % 2 else module.Themes.LIGHT)))
+    window.close()
+    print(json.dumps({"notes": window.note_model.rowCount(), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
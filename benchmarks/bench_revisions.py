@@ -0,0 +1,81 @@
+"""Storage overhead and reconstruction time of the note revision history.
+
+Saves a long series of small edits to one large note, then reports how many
+bytes the revisions take relative to the note itself and how long the
+slowest revision takes to rebuild, before and after compaction.
+
+    python benchmarks/bench_revisions.py --edits 1000 --size 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+
+
+def paragraph(rng):
+    return "<p>" + " ".join(rng.choices(WORDS, k=rng.randint(10, 60))) + "</p>\n"
+
+
+def history_stats(conn, note_id):
+    from atmostnotes.store import list_revisions, reconstruct_revision
+    revisions = list_revisions(conn, note_id)
+    slowest = 0.0
+    for revision_id, _ in revisions:
+        started = time.perf_counter()
+        reconstruct_revision(conn, revision_id)
+        slowest = max(slowest, time.perf_counter() - started)
+    size = conn.execute('SELECT SUM(length(delta)) FROM note_revisions WHERE note_id = ?', (note_id,)).fetchone()[0]
+    return {"revisions": len(revisions), "bytes": size, "slowest_reconstruct_ms": round(slowest * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--edits", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=100000, help="approximate note size in bytes")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.store import NoteStore, compact_revisions, insert_note, update_note
+
+    rng = random.Random(0)
+    paragraphs = []
+    while sum(map(len, paragraphs)) < args.size:
+        paragraphs.append(paragraph(rng))
+
+    store = NoteStore(os.path.join(tempfile.mkdtemp(prefix="atmost-bench-"), "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    # Edits are spread over the past 30 days, so compaction has old revisions to thin
+    start = time.time() - 30 * 24 * 3600
+    note_id = store.submit(insert_note, user_id, "Bench", "".join(paragraphs), "", start).result()
+    for i in range(args.edits):
+        paragraphs[rng.randrange(len(paragraphs))] = paragraph(rng)
+        now = start + (i + 1) * 30 * 24 * 3600 / args.edits
+        store.submit(update_note, note_id, user_id, "Bench", "".join(paragraphs), "", now)
+    store.sync()
+
+    conn = store.reader()
+    note_size = len("".join(paragraphs).encode())
+    before = history_stats(conn, note_id)
+    removed = store.submit(compact_revisions, note_id).result()
+    after = history_stats(conn, note_id)
+    store.close()
+
+    print(json.dumps({
+        "note_bytes": note_size,
+        "edits": args.edits,
+        "before_compaction": dict(before, overhead_x_note=round(before["bytes"] / note_size, 2)),
+        "compaction_removed": removed,
+        "after_compaction": dict(after, overhead_x_note=round(after["bytes"] / note_size, 2)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Keystroke-to-results latency of the sidebar search on a generated note database.
+
+Types each query one character at a time into the search bar of a real
+AtmostNotes window and measures the time from the last keystroke until the
+results are shown, next to the cost of running one synchronous query per
+keystroke on the GUI thread as the search used to do.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_search.py --notes 100000
+"""
+import argparse
+import itertools
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+QUERIES = ["meeting", "project plan", "budget review", "roadmap", "zzz"]
+
+
+def load_app():
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("atmost_notes", os.path.join(ROOT, "Atmost-Notes.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["atmost_notes"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def vocabulary(rng, size=20000):
+    # Zipf-weighted vocabulary, so common query words match a realistic fraction of notes
+    syllables = "ka lo mi ne ru ta se vo pi da ge hu zo ber lin tor mas kel".split()
+    words = list(WORDS) + ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+    rng.shuffle(words)
+    return words, list(itertools.accumulate(1.0 / rank for rank in range(1, len(words) + 1)))
+
+
+def generate_notes(store, user_id, count, seed=0):
+    rng = random.Random(seed)
+    words, cum_weights = vocabulary(rng)
+    def rows():
+        for i in range(count):
+            body = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(20, 300)))
+            title = " ".join(rng.choices(words, cum_weights=cum_weights, k=3)).capitalize()
+            yield (user_id, title, f"<html><body><p>{body}</p></body></html>", rng.choice(WORDS), float(i))
+    store.write_many('INSERT INTO notes (user_id, title, content, tags, updated_at) VALUES (?, ?, ?, ?, ?)', rows()).result()
+
+
+def spin(app, seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--keystroke-interval", type=float, default=0.08, help="seconds between keystrokes")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    module = load_app()
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication(sys.argv)
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    os.chdir(workdir)
+    window = module.AtmostNotes()
+    window.current_user = window.store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    started = time.perf_counter()
+    generate_notes(window.store, window.current_user, args.notes)
+    print(f"generated {args.notes} notes in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    window.update_note_list()
+
+    results = {}
+    for query in QUERIES:
+        blocked = []
+        for length in range(1, len(query) + 1):
+            started = time.perf_counter()
+            window.search_bar.setText(query[:length])
+            blocked.append(time.perf_counter() - started)
+            spin(app, args.keystroke_interval)
+        last_keystroke = time.perf_counter() - args.keystroke_interval
+        while not (window.last_search and window.last_search[0] == query):
+            app.processEvents()
+            time.sleep(0.0005)
+        latency = time.perf_counter() - last_keystroke
+
+        synchronous = []
+        for length in range(1, len(query) + 1):
+            started = time.perf_counter()
+            module.search_note_ids(window.store.reader(), window.current_user, query[:length])
+            synchronous.append(time.perf_counter() - started)
+
+        results[query] = {
+            "matches": len(window.last_search[1]),
+            "keystroke_to_results_ms": round(latency * 1000, 1),
+            "max_gui_block_per_keystroke_ms": round(max(blocked) * 1000, 2),
+            "synchronous_per_keystroke_ms": round(statistics.median(synchronous) * 1000, 1),
+            "synchronous_total_ms": round(sum(synchronous) * 1000, 1),
+        }
+
+    window.close()
+    print(json.dumps({"notes": args.notes, "debounce_ms": module.SEARCH_DEBOUNCE_MS, "queries": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Query latency of semantic search over a generated note database.
+
+Generates notes as bench_search.py does, embeds them all with the local
+hashing embedder, then times top-k searches by query text and by related
+note, and the refresh after a single note changes.
+
+    python benchmarks/bench_semantic.py --notes 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = ["meeting agenda", "project plan budget", "travel recipe", "roadmap feedback sprint", "client invoice"]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {"p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_search import generate_notes
+    from atmostnotes.semantic import HashingEmbedder, SemanticIndex
+    from atmostnotes.store import NoteStore
+
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    store = NoteStore(os.path.join(workdir, "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    generate_notes(store, user_id, args.notes)
+    index = SemanticIndex(store, HashingEmbedder())
+
+    started = time.perf_counter()
+    embedded = index.refresh(user_id)
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(0)
+    note_ids = [row[0] for row in store.reader().execute('SELECT id FROM notes')]
+    by_query, related = [], []
+    for i in range(args.queries):
+        started = time.perf_counter()
+        index.search(user_id, QUERIES[i % len(QUERIES)])
+        by_query.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        index.related(user_id, rng.choice(note_ids))
+        related.append(time.perf_counter() - started)
+
+    # An edit re-embeds only the changed note
+    store.write("UPDATE notes SET title = 'changed', content_hash = 'changed' WHERE id = ?", (note_ids[0],)).result()
+    started = time.perf_counter()
+    reembedded = index.refresh(user_id)
+    update_seconds = time.perf_counter() - started
+    index.close()
+    store.close()
+
+    print(json.dumps({
+        "notes": args.notes,
+        "dim": index.dim,
+        "vector_file_mib": round(os.path.getsize(index.path) / 2 ** 20, 1),
+        "embed_all_seconds": round(build_seconds, 1),
+        "embedded": embedded,
+        "search_by_query": percentiles(by_query),
+        "related_notes": percentiles(related),
+        "incremental_update": {"embedded": reembedded, "ms": round(update_seconds * 1000, 1)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
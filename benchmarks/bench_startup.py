@@ -0,0 +1,125 @@
+"""Startup time of the GUI: import time and time to first paint.
+
+Starts the app in fresh processes under the offscreen Qt platform, each with
+an empty database in a temporary directory, and reports the median and worst
+time spent importing Atmost-Notes.py (PyQt6 and the core package included),
+building the window, and reaching its first paint event. Also lists which
+heavy optional modules were already loaded at that point; none should be.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --runs 1 --imports 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["numpy", "requests", "atmostnotes.semantic", "atmostnotes.importer", "atmostnotes.exporter",
+                 "multiprocessing"]
+
+
+def child():
+    started = time.perf_counter()
+    import importlib.util
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("atmost_notes", os.path.join(ROOT, "Atmost-Notes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+
+    app = QApplication(sys.argv[:1])
+    window = module.AtmostNotes()
+    constructed = time.perf_counter()
+    painted = {}
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Type.Paint and not painted:
+                painted["at"] = time.perf_counter()
+                painted["modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+                painted["ai_panel"] = window.ai_panel is not None
+                QTimer.singleShot(0, window.close)
+            return False
+
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+    app.exec()
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "construct_ms": (constructed - imported) * 1000,
+        "first_paint_ms": (painted["at"] - started) * 1000,
+        "heavy_modules_at_first_paint": painted["modules"],
+        "ai_panel_at_first_paint": painted["ai_panel"],
+    }))
+
+
+def run_child(workdir, python_flags=()):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *python_flags, os.path.abspath(__file__), "--child"], cwd=workdir,
+                            env=env, capture_output=True, text=True, check=True)
+    process_ms = (time.perf_counter() - started) * 1000
+    return json.loads(result.stdout.splitlines()[-1]), process_ms, result.stderr
+
+
+def slowest_imports(stderr, count):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return [{"module": name, "ms": round(ms, 1)} for ms, name in sorted(imports, reverse=True)[:count]]
+
+
+def summarize(samples):
+    return {"median": round(statistics.median(samples), 1), "max": round(max(samples), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--imports", type=int, default=0, help="also list the N slowest top-level imports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    results, process_ms = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="atmost-bench-") as workdir:
+            result, elapsed, _ = run_child(workdir)
+        results.append(result)
+        process_ms.append(elapsed)
+
+    report = {
+        "runs": args.runs,
+        "import_ms": summarize([result["import_ms"] for result in results]),
+        "construct_ms": summarize([result["construct_ms"] for result in results]),
+        "first_paint_ms": summarize([result["first_paint_ms"] for result in results]),
+        "process_ms": summarize(process_ms),
+        "heavy_modules_at_first_paint": results[-1]["heavy_modules_at_first_paint"],
+        "ai_panel_at_first_paint": results[-1]["ai_panel_at_first_paint"],
+    }
+    if args.imports:
+        with tempfile.TemporaryDirectory(prefix="atmost-bench-") as workdir:
+            _, _, stderr = run_child(workdir, ("-X", "importtime"))
+        report["slowest_imports"] = slowest_imports(stderr, args.imports)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Hot paths of the app at scale, on a generated corpus, as comparable JSON.
+
+Fills a temporary database with corpus.py (same schema as the app, notes
+saved through insert_note), opens a real AtmostNotes window on it under the
+offscreen Qt platform, logs in the first user and times:
+
+    search_notes      a query until its results are shown in the note list
+    update_note_list  listing all notes, as after login or clearing a search
+    load_note         opening a note from the list into the editor
+    save_note         saving an edited note (GUI thread), then committing all
+    export_notes      exporting every note to a Markdown zip
+    import_notes      importing a tree of generated HTML, Markdown and text files
+
+Each reports latency percentiles and throughput; peak RSS is recorded after
+each phase (worker processes separately). Write the JSON with --output and
+compare a later run against it with --compare:
+
+    python benchmarks/bench_suite.py --notes 20000 --output before.json
+    python benchmarks/bench_suite.py --notes 20000 --compare before.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("search_notes", "update_note_list", "load_note", "save_note", "export_notes", "import_notes")
+
+
+def load_app():
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("atmost_notes", os.path.join(ROOT, "Atmost-Notes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; the children figure is the largest worker process
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def latency_stats(samples, items=None):
+    """Percentiles of samples (seconds) in ms, and throughput in operations or items per second."""
+    ordered = sorted(samples)
+    total = sum(samples)
+    stats = {"count": len(samples)}
+    stats.update({f"p{int(fraction * 100)}_ms": round(percentile(ordered, fraction) * 1000, 2)
+                  for fraction in (0.5, 0.9, 0.99)})
+    stats["max_ms"] = round(ordered[-1] * 1000, 2)
+    stats["per_second"] = round((items or len(samples)) / total, 1) if total else None
+    return stats
+
+
+def spin(app, until, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while not until() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def compare(report, baseline):
+    changes = {}
+    for name, stats in report["operations"].items():
+        before = baseline.get("operations", {}).get(name)
+        if before and before.get("p50_ms") and before.get("p90_ms"):
+            changes[name] = {"p50_ratio": round(stats["p50_ms"] / before["p50_ms"], 2),
+                             "p90_ratio": round(stats["p90_ms"] / before["p90_ms"], 2)}
+    return {"baseline_commit": baseline.get("commit"), "operations": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=20000, help="notes of the user the GUI logs in as")
+    parser.add_argument("--users", type=int, default=2, help="users in the database, all with --notes notes")
+    parser.add_argument("--median-words", type=int, default=corpus.MEDIAN_WORDS)
+    parser.add_argument("--sigma", type=float, default=corpus.WORDS_SIGMA)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samples", type=int, default=100, help="timed runs of each GUI operation")
+    parser.add_argument("--export-runs", type=int, default=3)
+    parser.add_argument("--import-files", type=int, default=2000)
+    parser.add_argument("--only", help="comma-separated operations to run: " + ", ".join(OPERATIONS))
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+    selected = args.only.split(",") if args.only else OPERATIONS
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    os.chdir(workdir)
+    module = load_app()
+    from PyQt6.QtGui import QTextCursor
+    from PyQt6.QtWidgets import QApplication
+    from atmostnotes.exporter import export_notes
+    from atmostnotes.importer import import_notes
+
+    app = QApplication(sys.argv[:1])
+    window = module.AtmostNotes()
+    store = window.store
+    # The semantic index has its own benchmark; keep its background embedding out of these timings
+    window.semantic_loaded = True
+    rng = random.Random(args.seed)
+    report = {"commit": None, "python": platform.python_version(), "platform": platform.platform(),
+              "parameters": vars(args), "corpus": None, "operations": {}, "peak_rss_mb": {}}
+
+    started = time.perf_counter()
+    user_ids, html_bytes = corpus.populate(store, args.users, args.notes, args.seed, args.median_words, args.sigma)
+    elapsed = time.perf_counter() - started
+    report["corpus"] = {"notes": args.users * args.notes, "html_mb": round(html_bytes / 2 ** 20, 1),
+                        "generate_and_insert_seconds": round(elapsed, 2),
+                        "notes_per_second": round(args.users * args.notes / elapsed, 1)}
+    report["peak_rss_mb"]["corpus"] = peak_rss_mb()
+
+    user_id = user_ids["user0"]
+    window.current_user = user_id
+    window.show()
+    window.update_note_list()
+    spin(app, lambda: False, 0.5)
+    note_ids = [row[0] for row in store.reader().execute('SELECT id FROM notes WHERE user_id = ?', (user_id,))]
+    words, cum_weights = corpus.vocabulary(random.Random(args.seed * 1000))
+    operations = report["operations"]
+
+    if "search_notes" in selected:
+        shown = []
+        window.search_worker.results_ready.connect(lambda generation, query, ids: shown.append(generation))
+        samples = []
+        for _ in range(args.samples):
+            # One to three words from the whole frequency range, so some match most notes and some almost none
+            query = " ".join(rng.choices(words[:2000], k=rng.randint(1, 3)))
+            window.last_search = None
+            started = time.perf_counter()
+            window.search_notes(query)
+            generation = window.search_generation
+            spin(app, lambda: generation in shown)
+            samples.append(time.perf_counter() - started)
+        operations["search_notes"] = latency_stats(samples)
+        report["peak_rss_mb"]["search_notes"] = peak_rss_mb()
+
+    if "update_note_list" in selected:
+        facets = []
+        window.search_worker.facets_ready.connect(lambda generation, rows: facets.append(generation))
+        samples = []
+        for _ in range(args.samples):
+            started = time.perf_counter()
+            window.update_note_list()
+            samples.append(time.perf_counter() - started)
+            # Let the tag counts it requested finish before the next run
+            generation = window.search_generation
+            spin(app, lambda: generation in facets)
+        operations["update_note_list"] = latency_stats(samples)
+        report["peak_rss_mb"]["update_note_list"] = peak_rss_mb()
+
+    sample_ids = rng.sample(note_ids, min(args.samples, len(note_ids)))
+    window.note_model.show_search(user_id, sample_ids)
+    while window.note_model.canFetchMore():
+        window.note_model.fetchMore()
+
+    if "load_note" in selected:
+        samples = []
+        for row in range(len(sample_ids)):
+            index = window.note_model.index(row)
+            started = time.perf_counter()
+            window.load_note(index)
+            samples.append(time.perf_counter() - started)
+        operations["load_note"] = latency_stats(samples)
+        report["peak_rss_mb"]["load_note"] = peak_rss_mb()
+
+    if "save_note" in selected:
+        samples = []
+        committed = 0.0
+        for row in range(len(sample_ids)):
+            window.load_note(window.note_model.index(row))
+            cursor = window.content_edit.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(" " + " ".join(rng.choices(words, cum_weights=cum_weights, k=20)))
+            started = time.perf_counter()
+            window.persist_note()
+            samples.append(time.perf_counter() - started)
+            store.sync()
+            committed += time.perf_counter() - started
+        operations["save_note"] = latency_stats(samples)
+        operations["save_note"]["committed_per_second"] = round(len(samples) / committed, 1)
+        report["peak_rss_mb"]["save_note"] = peak_rss_mb()
+
+    if "export_notes" in selected:
+        samples = []
+        for run in range(args.export_runs):
+            path = os.path.join(workdir, f"export{run}.zip")
+            started = time.perf_counter()
+            exported = export_notes(store, user_id, path, "zip", "markdown")
+            samples.append(time.perf_counter() - started)
+            os.remove(path)
+        operations["export_notes"] = latency_stats(samples, exported * len(samples))
+        report["peak_rss_mb"]["export_notes"] = peak_rss_mb()
+
+    if "import_notes" in selected:
+        directory = os.path.join(workdir, "import")
+        corpus.write_note_files(directory, args.import_files, args.seed + 1, args.median_words, args.sigma)
+        importer_id = store.write("INSERT INTO users (username, password) VALUES ('importer', '')").result()
+        started = time.perf_counter()
+        imported, duplicates, failed = import_notes(store, importer_id, directory)
+        elapsed = time.perf_counter() - started
+        operations["import_notes"] = latency_stats([elapsed], args.import_files)
+        operations["import_notes"].update(imported=imported, duplicates=duplicates, failed=failed)
+        report["peak_rss_mb"]["import_notes"] = peak_rss_mb()
+
+    window.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    # Only now, so that git is not counted in the workers' peak RSS
+    report["commit"] = git_commit()
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            report["compare"] = compare(report, json.load(baseline_file))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
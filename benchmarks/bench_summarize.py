@@ -0,0 +1,84 @@
+"""Model calls and wall time of map-reduce summarization of a very long note.
+
+Summarizes a generated meeting transcript with a stand-in model that takes
+a fixed time per call, first from scratch, then again after one paragraph
+is edited and after a paragraph is inserted, with chunk summaries cached
+in between. Reports the calls made and the largest prompt sent next to the
+size of the whole note.
+
+    python benchmarks/bench_summarize.py --paragraphs 5000 --latency 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("meeting project plan budget review design draft client report idea travel recipe "
+         "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+
+
+class MemoryCache:
+    """Stands in for AICache."""
+    def __init__(self):
+        self.entries = {}
+
+    @staticmethod
+    def key(template, text):
+        return template + "\0" + text
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, response):
+        self.entries[key] = response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per model call")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.chat import estimate_tokens
+    from atmostnotes.summarize import SUMMARY_CONCURRENCY, split_chunks, summarize_text
+
+    rng = random.Random(0)
+    paragraphs = [f"Speaker {rng.randint(1, 6)}: " + " ".join(rng.choices(WORDS, k=rng.randint(5, 120))) + "."
+                  for _ in range(args.paragraphs)]
+    cache = MemoryCache()
+    concurrency = args.concurrency or SUMMARY_CONCURRENCY
+    lock = threading.Lock()
+    prompts = []
+
+    def generate(prompt):
+        with lock:
+            prompts.append(estimate_tokens(prompt))
+        time.sleep(args.latency)
+        return "Summary: " + " ".join(rng.choices(WORDS, k=80))
+
+    runs = {}
+    for name in ("first", "one_paragraph_edited", "paragraph_inserted"):
+        if name == "one_paragraph_edited":
+            paragraphs[len(paragraphs) // 2] = "Speaker 1: the budget review moved to next sprint."
+        elif name == "paragraph_inserted":
+            paragraphs.insert(len(paragraphs) // 3, "Speaker 2: one more thing about the launch.")
+        text = "\n".join(paragraphs)
+        prompts.clear()
+        started = time.perf_counter()
+        summarize_text(text, generate, cache, concurrency=concurrency)
+        runs[name] = {"chunks": len(split_chunks(text)), "model_calls": len(prompts),
+                      "largest_prompt_tokens": max(prompts), "seconds": round(time.perf_counter() - started, 2)}
+
+    print(json.dumps({"note_tokens": estimate_tokens("\n".join(paragraphs)), "latency_s": args.latency,
+                      "concurrency": concurrency, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
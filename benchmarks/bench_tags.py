@@ -0,0 +1,89 @@
+"""Tag filtering and tag facet counts over a generated note database.
+
+Fills a database with notes carrying one to four Zipf-distributed tags
+each, then times AND and OR tag filters through the normalized tag index
+against the LIKE scan over notes.tags they replace (which also matched
+tags containing the searched one), and facet counts over all notes and
+over a search result.
+
+    python benchmarks/bench_tags.py --notes 100000
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TAGS = ["work", "homework", "personal", "urgent", "ideas", "travel", "recipes", "finance", "reading", "health"]
+
+
+def timed(function, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - started)
+    return result, round(statistics.median(samples) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.search import parse_tag_filter, search_note_ids, tag_facets, tagged_note_ids
+    from atmostnotes.store import NoteStore
+
+    rng = random.Random(0)
+    tags = TAGS + [f"project-{i}" for i in range(500)]
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(tags) + 1)))
+    workdir = tempfile.mkdtemp(prefix="atmost-bench-")
+    store = NoteStore(os.path.join(workdir, "bench.db"))
+    user_id = store.write("INSERT INTO users (username, password) VALUES ('bench', '')").result()
+    started = time.perf_counter()
+    store.write_many('INSERT INTO notes (user_id, title, content, tags, updated_at) VALUES (?, ?, ?, ?, ?)',
+                     ((user_id, f"Note {i}", "<p>meeting plan budget</p>" if i % 10 else "<p>meeting</p>",
+                       ", ".join(rng.choices(tags, cum_weights=cum_weights, k=rng.randint(1, 4))), float(i))
+                      for i in range(args.notes))).result()
+    insert_seconds = time.perf_counter() - started
+    conn = store.reader()
+
+    def like(tag):
+        return [row[0] for row in conn.execute(
+            "SELECT id FROM notes WHERE user_id = ? AND tags LIKE ? ORDER BY updated_at DESC", (user_id, f"%{tag}%"))]
+
+    results = {}
+    for label, text in (("work", "work"), ("project-250", "project-250"), ("work AND urgent", "work, urgent"),
+                        ("travel OR recipes", "travel | recipes"), ("work AND (travel OR recipes)", "work, travel | recipes")):
+        ids, ms = timed(lambda: tagged_note_ids(conn, user_id, parse_tag_filter(text)))
+        results[label] = {"matches": len(ids), "indexed_ms": ms}
+        if "," not in text and "|" not in text:
+            like_ids, like_ms = timed(lambda: like(text))
+            results[label].update(like_scan_matches=len(like_ids), like_scan_ms=like_ms)
+
+    search_ids = search_note_ids(conn, user_id, "budget")
+    facets_all, facets_all_ms = timed(lambda: tag_facets(conn, user_id))
+    _, facets_search_ms = timed(lambda: tag_facets(conn, user_id, search_ids))
+    work_ids = tagged_note_ids(conn, user_id, [["work"]])
+    _, facets_filtered_ms = timed(lambda: tag_facets(conn, user_id, work_ids))
+    store.close()
+
+    print(json.dumps({
+        "notes": args.notes,
+        "insert_seconds": round(insert_seconds, 2),
+        "filters": results,
+        "facets_ms": {"all_notes": facets_all_ms, f"search_result_{len(search_ids)}": facets_search_ms,
+                      f"tag_filter_{len(work_ids)}": facets_filtered_ms},
+        "top_facets": facets_all[:5],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
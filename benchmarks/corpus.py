@@ -0,0 +1,156 @@
+"""Deterministic synthetic users and notes for the benchmarks.
+
+Notes are rich text as QTextEdit.toHtml() writes it: paragraphs with
+occasional bold and italic spans and bullet lists, words drawn from a Zipf
+distribution and body lengths from a log-normal one. Tags are Zipf
+distributed too. A given seed always yields the same corpus, so results from
+different commits are comparable.
+
+Run on its own, it writes a database the GUI can open; every generated
+user's password is "password":
+
+    python benchmarks/corpus.py --db corpus.db --users 5 --notes 20000
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "password"
+MEDIAN_WORDS = 150
+WORDS_SIGMA = 1.0
+BASE_TIME = 1700000000.0
+QT_HTML_HEAD = (
+    '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0//EN" "http://www.w3.org/TR/REC-html40/strict.dtd">\n'
+    '<html><head><meta name="qrichtext" content="1" /><meta charset="utf-8" /><style type="text/css">\n'
+    'p, li { white-space: pre-wrap; }\n'
+    'hr { height: 1px; border-width: 0; }\n'
+    'li.unchecked::marker { content: "\\2610"; }\n'
+    'li.checked::marker { content: "\\2612"; }\n'
+    "</style></head><body style=\" font-family:'Sans Serif'; font-size:9pt; font-weight:400; font-style:normal;\">\n"
+)
+QT_BLOCK_STYLE = 'margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;'
+
+
+def vocabulary(rng, size=20000):
+    """Return (words, cum_weights) for rng.choices: made-up words with Zipf-distributed frequencies."""
+    syllables = "ka lo mi ne ru ta se vo pi da ge hu zo ber lin tor mas kel an re".split()
+    common = ("meeting project plan budget review design draft client report idea travel recipe "
+              "invoice schedule research summary todo agenda notes launch roadmap feedback sprint").split()
+    words = list(dict.fromkeys(common + ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                                         for _ in range(size)]))
+    return words, list(itertools.accumulate(1.0 / rank for rank in range(1, len(words) + 1)))
+
+
+def tag_vocabulary(size=300):
+    tags = ["work", "personal", "urgent", "ideas", "travel", "recipes", "finance", "reading", "health", "home"]
+    tags += [f"project-{i}" for i in range(size - len(tags))]
+    return tags, list(itertools.accumulate(1.0 / rank for rank in range(1, len(tags) + 1)))
+
+
+def qt_html(rng, words, cum_weights, count):
+    """Return a Qt rich text document of about count words."""
+    blocks = []
+    while count > 0:
+        length = min(count, rng.randint(10, 80))
+        count -= length
+        text = rng.choices(words, cum_weights=cum_weights, k=length)
+        if rng.random() < 0.3:
+            start = rng.randrange(length)
+            style = " font-weight:700;" if rng.random() < 0.6 else " font-style:italic;"
+            text[start] = f'<span style="{style}">{text[start]}</span>'
+        if rng.random() < 0.1:
+            items = "".join(f'<li style=" {QT_BLOCK_STYLE}">{word}</li>' for word in text[:rng.randint(2, 6)])
+            blocks.append(f'<ul style="margin-top: 0px; margin-bottom: 0px; margin-left: 0px; margin-right: 0px; '
+                          f'-qt-list-indent: 1;">{items}</ul>')
+        else:
+            blocks.append(f'<p style=" {QT_BLOCK_STYLE}">{" ".join(text)}</p>')
+    return QT_HTML_HEAD + "\n".join(blocks) + "</body></html>"
+
+
+def generate_notes(seed, count, median_words=MEDIAN_WORDS, sigma=WORDS_SIGMA):
+    """Yield count (title, html, tags, updated_at) tuples, the same ones for the same arguments."""
+    rng = random.Random(seed)
+    words, cum_weights = vocabulary(rng)
+    tags, tag_weights = tag_vocabulary()
+    for i in range(count):
+        title = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 5))).capitalize()
+        length = max(1, int(rng.lognormvariate(math.log(median_words), sigma)))
+        note_tags = dict.fromkeys(rng.choices(tags, cum_weights=tag_weights, k=rng.choice((0, 1, 1, 2, 2, 3, 4))))
+        yield title, qt_html(rng, words, cum_weights, length), ", ".join(note_tags), BASE_TIME + i * 60.0
+
+
+def insert_notes(conn, user_id, notes):
+    from atmostnotes.store import insert_note
+    for title, html, tags, updated_at in notes:
+        insert_note(conn, user_id, title, html, tags, now=updated_at)
+    return len(notes)
+
+
+def populate(store, users=1, notes=10000, seed=0, median_words=MEDIAN_WORDS, sigma=WORDS_SIGMA, batch_size=1000):
+    """Add users with notes each to a NoteStore through insert_note, as the app saves them.
+
+    Users are named user0, user1 and so on. Returns {username: user_id} and the
+    total size of the generated HTML in bytes.
+    """
+    user_ids, total_bytes = {}, 0
+    password = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    for index in range(users):
+        username = f"user{index}"
+        user_ids[username] = store.write('INSERT INTO users (username, password) VALUES (?, ?)',
+                                         (username, password)).result()
+        generated = generate_notes(seed * 1000 + index, notes, median_words, sigma)
+        while batch := list(itertools.islice(generated, batch_size)):
+            total_bytes += sum(len(html) for _, html, _, _ in batch)
+            store.submit(insert_notes, user_ids[username], batch)
+    store.sync()
+    return user_ids, total_bytes
+
+
+def write_note_files(root, count, seed=0, median_words=MEDIAN_WORDS, sigma=WORDS_SIGMA):
+    """Write count notes under root as a nested tree of HTML, Markdown and text files, for import."""
+    for i, (title, html, _, _) in enumerate(generate_notes(seed, count, median_words, sigma)):
+        directory = os.path.join(root, f"folder{i % 10}", f"sub{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        kind = i % 3
+        if kind == 0:
+            body, extension = html, ".html"
+        else:
+            paragraphs = [p.split(">", 1)[1] for p in html.split("</p>") if "<p " in p]
+            text = "\n\n".join(paragraphs).replace('<span style=" font-weight:700;">', "**")
+            text = text.replace('<span style=" font-style:italic;">', "*").replace("</span>", "")
+            body, extension = (f"# {title}\n\n{text}", ".md") if kind == 1 else (f"{title}\n\n{text}", ".txt")
+        with open(os.path.join(directory, f"note{i}{extension}"), "w", encoding="utf-8") as note_file:
+            note_file.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="database to create or add to")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--notes", type=int, default=10000, help="notes per user")
+    parser.add_argument("--median-words", type=int, default=MEDIAN_WORDS)
+    parser.add_argument("--sigma", type=float, default=WORDS_SIGMA, help="spread of the log-normal note length")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from atmostnotes.store import NoteStore
+
+    store = NoteStore(args.db)
+    started = time.perf_counter()
+    user_ids, total_bytes = populate(store, args.users, args.notes, args.seed, args.median_words, args.sigma)
+    store.close()
+    print(json.dumps({"users": user_ids, "notes": args.users * args.notes, "html_mb": round(total_bytes / 2 ** 20, 1),
+                      "seconds": round(time.perf_counter() - started, 2)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
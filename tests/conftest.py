@@ -0,0 +1,99 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def load_app():
+    """Import Atmost-Notes.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location("atmost_notes", os.path.join(ROOT, "Atmost-Notes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    from PyQt6.QtWidgets import QApplication
+    # The application must outlive every window and engine the tests create
+    app = QApplication.instance() or QApplication([])
+    yield load_app()
+    app.closeAllWindows()
+    app.processEvents()
+
+
+class GeminiStub:
+    """Local stand-in for the Gemini API.
+
+    Every request waits delay seconds, then gets the next scripted
+    (status, headers) from fail(), or once those run out a 200 answer with
+    the text "ok". Arrival times and the most requests ever in flight at once
+    are recorded.
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.scripted = []
+        self.arrivals = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub.lock:
+                    stub.arrivals.append(time.monotonic())
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status, headers = stub.scripted.pop(0) if stub.scripted else (200, {})
+                time.sleep(stub.delay)
+                if status == 200:
+                    body = {"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}
+                else:
+                    body = {"error": {"message": f"stub status {status}"}}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with stub.lock:
+                    stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1beta/models/stub:generateContent"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def fail(self, status, count=1, headers=None):
+        with self.lock:
+            self.scripted += [(status, headers or {})] * count
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def gemini_stub():
+    stub = GeminiStub()
+    yield stub
+    stub.close()
@@ -0,0 +1,76 @@
+"""AIRequestEngine runs requests against a slow server concurrently, up to its limit."""
+import time
+from types import SimpleNamespace
+
+from atmostnotes.ai import AI_MAX_CONCURRENT_REQUESTS, GeminiClient
+
+
+def run_requests(app_module, client, count, **engine_args):
+    from PyQt6.QtWidgets import QApplication
+    # The GUI's own fetch function, bound to just the client it uses
+    fetch = app_module.AtmostNotes.get_ai_response.__get__(SimpleNamespace(gemini=client))
+    engine = app_module.AIRequestEngine(fetch, **engine_args)
+    responses = {}
+    engine.response_ready.connect(lambda request_id, channel, text: responses.setdefault(channel, text))
+    started = time.monotonic()
+    for i in range(count):
+        engine.submit(f"channel{i}", f"prompt {i}")
+    deadline = started + 30
+    while len(responses) < count and time.monotonic() < deadline:
+        QApplication.processEvents()
+        time.sleep(0.005)
+    engine.pool.waitForDone()
+    return responses, time.monotonic() - started
+
+
+def test_requests_run_concurrently_up_to_the_limit(app_module, gemini_stub):
+    gemini_stub.delay = 0.3
+    client = GeminiClient(api_key="test", api_url=gemini_stub.url, stream_url=gemini_stub.url,
+                          requests_per_minute=60000)
+    count = AI_MAX_CONCURRENT_REQUESTS * 3
+    # Non-streaming, so each request is a single round trip of known length
+    app_module.AI_STREAMING = False
+    try:
+        responses, elapsed = run_requests(app_module, client, count)
+    finally:
+        app_module.AI_STREAMING = True
+        client.close()
+    assert sorted(responses.values()) == ["ok"] * count
+    assert gemini_stub.max_in_flight == AI_MAX_CONCURRENT_REQUESTS
+    # Three waves of concurrent requests, far from the time of running them one by one
+    assert elapsed < count * gemini_stub.delay / 2
+
+
+def test_engine_limit_is_configurable(app_module, gemini_stub):
+    gemini_stub.delay = 0.2
+    client = GeminiClient(api_key="test", api_url=gemini_stub.url, stream_url=gemini_stub.url,
+                          requests_per_minute=60000)
+    app_module.AI_STREAMING = False
+    try:
+        responses, _ = run_requests(app_module, client, 6, max_concurrent=2)
+    finally:
+        app_module.AI_STREAMING = True
+        client.close()
+    assert len(responses) == 6
+    assert gemini_stub.max_in_flight == 2
+
+
+def test_cancelled_history_fold_gives_the_turns_back(app_module):
+    from atmostnotes.chat import ChatSession
+    engine = app_module.AIRequestEngine(lambda prompt, timeout, on_chunk, cancelled: cancelled.wait(5) and "")
+    chat = ChatSession(None, 1, history_tokens=40)
+    for i in range(4):
+        chat.record(f"question {i} " * 5, f"answer {i} " * 5, {})
+    turns = list(chat.turns)
+    window = SimpleNamespace(chat_turns={}, ai_streams={})
+    drop = app_module.AtmostNotes.drop_ai_request.__get__(window)
+    engine.request_cancelled.connect(lambda request_id, channel: drop(request_id, channel))
+    request_id = engine.submit("chat_history", chat.fold_prompt())
+    window.chat_turns[request_id] = (chat, None, None)
+    assert chat.fold_prompt() is None
+    # As toggle_ai does when AI is turned off
+    engine.cancel_all()
+    engine.pool.waitForDone()
+    assert window.chat_turns == {}
+    assert chat.turns == turns and chat.folding == []
+    assert chat.fold_prompt() is not None
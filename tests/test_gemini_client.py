@@ -0,0 +1,109 @@
+"""GeminiClient pacing and retries against a local stub server."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from atmostnotes import ai
+from atmostnotes.ai import AIRequestCancelled, GeminiClient, GeminiError, TokenBucket
+
+
+def stub_client(stub, **kwargs):
+    kwargs.setdefault("requests_per_minute", 60000)
+    return GeminiClient(api_key="test", api_url=stub.url, stream_url=stub.url, **kwargs)
+
+
+def test_token_bucket_enforces_its_rate(gemini_stub):
+    # 10 requests a second with a burst of 2: the 12 requests need at least one second
+    client = stub_client(gemini_stub, requests_per_minute=600, pool_size=2)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(lambda i: client.generate(f"prompt {i}"), range(12))) == ["ok"] * 12
+    client.close()
+    assert time.monotonic() - started >= 0.95
+    arrivals = [arrival - gemini_stub.arrivals[0] for arrival in sorted(gemini_stub.arrivals)]
+    for count, arrival in enumerate(arrivals, start=1):
+        # No more than the burst plus what the rate allows by then
+        assert count <= 2 + arrival * 10 + 0.5
+
+
+def test_token_bucket_wait_can_be_cancelled():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    assert bucket.acquire()
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    started = time.monotonic()
+    assert bucket.acquire(cancelled) is False
+    assert time.monotonic() - started < 2
+
+
+def test_retry_after_is_honoured_on_429(gemini_stub):
+    gemini_stub.fail(429, headers={"Retry-After": "1"})
+    # Backoff alone would wait milliseconds; only Retry-After makes it wait a second
+    client = stub_client(gemini_stub, backoff_base=0.001)
+    assert client.generate("prompt") == "ok"
+    client.close()
+    assert len(gemini_stub.arrivals) == 2
+    assert gemini_stub.arrivals[1] - gemini_stub.arrivals[0] >= 0.95
+
+
+def test_retry_after_is_capped_at_backoff_max(gemini_stub):
+    gemini_stub.fail(429, headers={"Retry-After": "120"})
+    client = stub_client(gemini_stub, backoff_max=0.2)
+    started = time.monotonic()
+    assert client.generate("prompt") == "ok"
+    client.close()
+    assert time.monotonic() - started < 5
+
+
+def test_backoff_is_exponential_with_full_jitter(gemini_stub, monkeypatch):
+    gemini_stub.fail(503, count=3)
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(ai.random, "uniform", uniform)
+    client = stub_client(gemini_stub, backoff_base=0.05, backoff_max=0.15)
+    assert client.generate("prompt") == "ok"
+    client.close()
+    # Each delay is drawn from [0, base * 2 ** attempt], capped at backoff_max
+    assert bounds == [(0, 0.05), (0, 0.1), (0, 0.15)]
+    gaps = [later - earlier for earlier, later in zip(gemini_stub.arrivals, gemini_stub.arrivals[1:])]
+    assert len(gaps) == 3 and all(gap >= high * 0.9 for gap, (_, high) in zip(gaps, bounds))
+
+
+def test_retries_give_up_after_max_retries(gemini_stub):
+    gemini_stub.fail(503, count=10)
+    client = stub_client(gemini_stub, max_retries=2, backoff_base=0.01)
+    with pytest.raises(GeminiError) as error:
+        client.generate("prompt")
+    client.close()
+    assert error.value.status == 503
+    assert "after 2 retries" in str(error.value)
+    assert len(gemini_stub.arrivals) == 3
+
+
+def test_client_errors_are_not_retried(gemini_stub):
+    gemini_stub.fail(400)
+    client = stub_client(gemini_stub, backoff_base=0.01)
+    with pytest.raises(GeminiError) as error:
+        client.generate("prompt")
+    client.close()
+    assert error.value.status == 400
+    assert len(gemini_stub.arrivals) == 1
+
+
+def test_cancellation_stops_retries(gemini_stub):
+    gemini_stub.fail(429, count=10, headers={"Retry-After": "5"})
+    client = stub_client(gemini_stub)
+    cancelled = threading.Event()
+    threading.Timer(0.2, cancelled.set).start()
+    started = time.monotonic()
+    with pytest.raises(AIRequestCancelled):
+        client.generate("prompt", cancelled=cancelled)
+    client.close()
+    assert time.monotonic() - started < 2
+    assert len(gemini_stub.arrivals) == 1
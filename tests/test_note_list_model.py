@@ -0,0 +1,48 @@
+"""NoteListModel keeps row_of() in step with its rows through paging, saves and resets."""
+import random
+
+import pytest
+
+from atmostnotes.store import NoteStore, insert_note
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    for i in range(120):
+        store.submit(insert_note, 1, f"Note {i}", "<p>body</p>", "", float(i))
+    store.sync()
+    yield store
+    store.close()
+
+
+def assert_rows_found(model):
+    for row, (note_id, _) in enumerate(model.rows):
+        assert model.row_of(note_id) == row
+    assert len(model.slots) == len(model.rows)
+
+
+def test_row_of_follows_pages_saves_and_resets(app_module, store):
+    model = app_module.NoteListModel(store, page_size=25)
+    model.show_all(1)
+    assert_rows_found(model)
+    rng = random.Random(7)
+    next_id = 1000
+    for step in range(200):
+        if model.canFetchMore() and step % 20 == 0:
+            model.fetchMore()
+        elif rng.random() < 0.3:
+            next_id += 1
+            model.note_saved(next_id, f"New {next_id}")
+        else:
+            note_id = rng.choice(model.rows)[0]
+            model.note_saved(note_id, f"Saved {step}")
+            assert model.rows[0] == (note_id, f"Saved {step}")
+        assert_rows_found(model)
+    assert model.row_of(-5) == -1
+    model.show_search(1, [3, 1, 2])
+    assert [model.row_of(note_id) for note_id in (1, 2, 3, 4)] == [1, 2, 0, -1]
+    model.note_saved(2, "Renamed")
+    assert model.rows[2] == (2, "Renamed")
+    model.clear()
+    assert model.row_of(1) == -1
@@ -0,0 +1,97 @@
+"""The hot lookups search an index instead of scanning notes or users.
+
+The statements are captured from the real code paths with a trace callback,
+so the test follows the queries as they change, and each one is checked
+with EXPLAIN QUERY PLAN.
+"""
+import hashlib
+import re
+
+import pytest
+
+from atmostnotes.exporter import export_notes
+from atmostnotes.store import insert_note
+
+FULL_SCAN = re.compile(r"^SCAN (notes|users)\b")
+
+
+@pytest.fixture
+def window(app_module, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    window = app_module.AtmostNotes()
+    # Semantic search has its own index and is not part of these lookups
+    window.semantic_loaded = True
+    password = hashlib.sha256(b"secret").hexdigest()
+    for name in ("alice", "bob"):
+        user_id = window.store.write('INSERT INTO users (username, password) VALUES (?, ?)', (name, password)).result()
+        for i in range(300):
+            window.store.submit(insert_note, user_id, f"{name} note {i}", f"<p>body {i}</p>", "work", float(i))
+    window.store.sync()
+    yield window
+    window.close()
+
+
+def selects(conn, run):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        run()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def full_scans(conn, statements):
+    assert statements
+    scans = []
+    for sql in statements:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+            if FULL_SCAN.match(row[3]):
+                scans.append((row[3], " ".join(sql.split())))
+    return scans
+
+
+def answer_dialogs(app_module, monkeypatch, *answers):
+    replies = iter(answers)
+    monkeypatch.setattr(app_module.QInputDialog, "getText", lambda *args, **kwargs: (next(replies), True))
+    monkeypatch.setattr(app_module.QMessageBox, "warning", lambda *args, **kwargs: None)
+
+
+def test_login_and_note_list(app_module, window, monkeypatch):
+    answer_dialogs(app_module, monkeypatch, "alice", "secret")
+    conn = window.store.reader()
+    statements = selects(conn, window.login)
+    assert window.current_user is not None
+    assert any("FROM users" in sql for sql in statements)
+    assert any("FROM notes" in sql for sql in statements)
+    assert full_scans(conn, statements) == []
+
+
+def test_note_list_next_page(window):
+    window.current_user = 1
+    window.update_note_list()
+    conn = window.store.reader()
+    statements = selects(conn, window.note_model.fetchMore)
+    assert window.note_model.rowCount() > window.note_model.page_size
+    assert full_scans(conn, statements) == []
+
+
+def test_register_lookup(app_module, window, monkeypatch):
+    answer_dialogs(app_module, monkeypatch, "bob")
+    conn = window.store.reader()
+    assert full_scans(conn, selects(conn, window.register)) == []
+
+
+def test_load_note(window):
+    window.current_user = 1
+    window.update_note_list()
+    conn = window.store.reader()
+    statements = selects(conn, lambda: window.load_note(window.note_model.index(5)))
+    assert window.title_edit.text()
+    assert full_scans(conn, statements) == []
+
+
+def test_export_cursor(window, tmp_path):
+    conn = window.store.reader()
+    statements = selects(conn, lambda: export_notes(window.store, 1, str(tmp_path / "notes.zip"), "zip", "html", 1))
+    assert full_scans(conn, statements) == []
@@ -0,0 +1,40 @@
+"""SearchWorker drops requests that reach it after the store is closed."""
+import pytest
+
+from atmostnotes.store import NoteStore, insert_note
+
+
+@pytest.fixture
+def worker(app_module, tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    for i in range(3):
+        store.submit(insert_note, 1, f"Note {i}", "<p>body</p>", "work", float(i))
+    store.sync()
+    worker = app_module.SearchWorker(store)
+    answers = []
+    worker.results_ready.connect(lambda *args: answers.append(args))
+    worker.facets_ready.connect(lambda *args: answers.append(args))
+    worker.answers = answers
+    yield worker
+    worker.close()
+    store.close()
+
+
+def test_requests_after_close_are_dropped(worker):
+    worker.supersede(1)
+    worker.facets(1, 1, None)
+    assert worker.answers == [(1, [("work", 3)])]
+    # As in closeEvent: the thread finishes, closing the worker's connection, then the store closes
+    worker.close()
+    worker.store.close()
+    worker.facets(1, 1, None)
+    worker.search(1, 1, "note", 10, [])
+    assert len(worker.answers) == 1
+
+
+def test_connection_closed_under_a_request_is_not_an_error(worker):
+    worker.supersede(1)
+    worker.connection().close()
+    worker.facets(1, 1, None)
+    worker.search(1, 1, "note", 10, [])
+    assert worker.answers == []
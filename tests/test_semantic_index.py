@@ -0,0 +1,101 @@
+"""SemanticIndex refreshes only what changed and frees the rows of deleted notes."""
+import re
+
+import pytest
+
+from atmostnotes import semantic
+from atmostnotes.store import NoteStore, insert_note, update_note
+
+if semantic.numpy is None:
+    pytest.skip("numpy is not installed", allow_module_level=True)
+
+
+class CountingEmbedder(semantic.HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    yield store
+    store.close()
+
+
+def add_notes(store, user_id, count, now=None):
+    def insert(conn):
+        return [insert_note(conn, user_id, f"Note {i}", f"<p>words {i} about topic {i % 7}</p>", "", now=now)
+                for i in range(count)]
+    return store.submit(insert).result()
+
+
+def walks_of_user_notes(conn, run):
+    """Plan steps of the note text queries that visit every note of the user, or every note."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        run()
+    finally:
+        conn.set_trace_callback(None)
+    walks = []
+    for sql in statements:
+        if "html_to_text" in sql:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            walks += [row[3] for row in plan
+                      if re.match(r"SCAN (n|notes)\b|SEARCH (n|notes) USING .*\(user_id=\?\)$", row[3])]
+    return walks
+
+
+def test_later_refreshes_only_read_new_and_updated_notes(store):
+    embedder = CountingEmbedder()
+    index = semantic.SemanticIndex(store, embedder)
+    note_ids = add_notes(store, 1, 200)
+    add_notes(store, 2, 50)
+    assert index.refresh(1) == 200
+    store.submit(update_note, note_ids[5], 1, "Changed", "<p>something else</p>", "").result()
+    # Imported notes keep an old updated_at, but are still new
+    imported = add_notes(store, 1, 3, now=1.0)
+    embedded = []
+    assert walks_of_user_notes(store.reader(), lambda: embedded.append(index.refresh(1))) == []
+    assert embedded == [4]
+    assert embedder.embedded == 204
+    assert index.refresh(1) == 0
+    assert set(imported) <= set(index.rows)
+    index.close()
+
+
+def test_deleted_notes_are_dropped_and_their_rows_reused(store):
+    index = semantic.SemanticIndex(store, CountingEmbedder())
+    note_ids = add_notes(store, 1, 20)
+    index.refresh(1)
+    deleted = note_ids[3]
+    row = index.rows[deleted]
+    store.write('DELETE FROM notes WHERE id = ?', (deleted,)).result()
+    [added] = add_notes(store, 1, 1)
+    assert index.refresh(1) == 1
+    assert deleted not in index.rows
+    assert index.rows[added] == row
+    assert index.count == 20
+    assert deleted not in index.search(1, "words 3 about topic 3")
+    assert store.reader().execute('SELECT count(*) FROM deleted_embeddings').fetchone()[0] == 0
+    index.close()
+
+
+def test_rows_deleted_while_closed_are_reused(store):
+    index = semantic.SemanticIndex(store, CountingEmbedder())
+    note_ids = add_notes(store, 1, 10)
+    index.refresh(1)
+    index.close()
+    store.write('DELETE FROM notes WHERE id IN (?, ?)', (note_ids[0], note_ids[9])).result()
+    index = semantic.SemanticIndex(store, CountingEmbedder())
+    assert len(index.rows) == 8
+    add_notes(store, 1, 2)
+    assert index.refresh(1) == 2
+    assert index.count == 10
+    assert sorted(index.rows.values()) == list(range(10))
+    index.close()
@@ -0,0 +1,75 @@
+"""Maintenance writes yield to other writes, and revision compaction only revisits notes that need it."""
+import threading
+
+import pytest
+
+from atmostnotes.store import NoteStore, compact_revisions, insert_note, notes_to_compact, update_note
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    yield store
+    store.close()
+
+
+def test_writes_run_before_queued_maintenance(store):
+    gate = threading.Event()
+    order = []
+    # Holds the writer while the rest is queued
+    store.submit(lambda conn: gate.wait(5))
+    maintenance = [store.submit_maintenance(lambda conn, i=i: order.append(f"maintenance {i}")) for i in range(3)]
+    writes = [store.submit(lambda conn, i=i: order.append(f"write {i}")) for i in range(2)]
+    gate.set()
+    assert store.sync(5)
+    for future in writes + maintenance:
+        future.result(5)
+    assert order == ["write 0", "write 1", "maintenance 0", "maintenance 1", "maintenance 2"]
+
+
+def test_sync_does_not_wait_for_maintenance(store):
+    release = threading.Event()
+    running = threading.Event()
+
+    def slow(conn):
+        running.set()
+        release.wait(5)
+
+    store.submit_maintenance(slow)
+    assert running.wait(5)
+    pending = store.submit_maintenance(lambda conn: None)
+    # Nothing but maintenance is queued, so there is nothing to wait for
+    assert store.sync(0.5)
+    release.set()
+    pending.result(5)
+
+
+def test_maintenance_left_at_close_is_cancelled(tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    gate = threading.Event()
+    store.submit(lambda conn: gate.wait(5))
+    pending = store.submit_maintenance(lambda conn: None)
+    write = store.submit(lambda conn: "written")
+    threading.Timer(0.1, gate.set).start()
+    store.close()
+    assert write.result() == "written"
+    assert pending.cancelled()
+
+
+def test_compacted_notes_are_not_selected_again(store):
+    day = 24 * 3600
+    now = 100 * day
+
+    def history(conn):
+        edited = insert_note(conn, 1, "Edited", "<p>v0</p>", "", now=0)
+        recent = insert_note(conn, 1, "Recent", "<p>v0</p>", "", now=0)
+        for i in range(1, 200):
+            # Ten saves a day, all old
+            update_note(conn, edited, 1, "Edited", f"<p>v{i}</p>", "", now=i * day / 10)
+            update_note(conn, recent, 1, "Recent", f"<p>v{i}</p>", "", now=now - i)
+        return edited
+
+    edited = store.submit(history).result()
+    assert store.submit(notes_to_compact, now).result() == [edited]
+    assert store.submit(compact_revisions, edited, now).result() > 0
+    assert store.submit(notes_to_compact, now).result() == []
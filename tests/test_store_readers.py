@@ -0,0 +1,107 @@
+"""NoteStore.reader() keeps one connection per thread, across Qt slot calls and pool tasks."""
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QCoreApplication, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+
+from atmostnotes.store import NoteStore
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NoteStore(str(tmp_path / "notes.db"))
+    yield store
+    store.close()
+
+
+class Worker(QObject):
+    answered = pyqtSignal(int, object)
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.conn = None
+
+    def query(self, call):
+        # Holds on to the first reader, like code that keeps a connection between calls
+        if self.conn is None:
+            self.conn = self.store.reader()
+        try:
+            self.conn.execute('SELECT count(*) FROM notes').fetchone()
+            self.answered.emit(call, self.store.reader())
+        except sqlite3.Error as error:
+            self.answered.emit(call, error)
+
+
+class Caller(QObject):
+    call = pyqtSignal(int)
+
+
+def test_qthread_slot_keeps_its_reader_between_calls(app, store):
+    thread = QThread()
+    worker = Worker(store)
+    worker.moveToThread(thread)
+    caller = Caller()
+    caller.call.connect(worker.query)
+    answers = {}
+    worker.answered.connect(lambda call, answer: answers.setdefault(call, answer))
+    thread.start()
+    try:
+        for call in range(4):
+            caller.call.emit(call)
+            deadline = time.monotonic() + 5
+            while call not in answers and time.monotonic() < deadline:
+                app.processEvents()
+                time.sleep(0.005)
+    finally:
+        thread.quit()
+        thread.wait()
+    assert sorted(answers) == [0, 1, 2, 3]
+    assert all(answer is worker.conn for answer in answers.values())
+
+
+def test_pool_tasks_share_their_thread_reader(app, store):
+    pool = QThreadPool()
+    pool.setMaxThreadCount(1)
+    pool.setExpiryTimeout(-1)
+    connections = []
+
+    class Task(QRunnable):
+        def run(self):
+            conn = store.reader()
+            conn.execute('SELECT 1').fetchone()
+            connections.append(conn)
+
+    for _ in range(5):
+        pool.start(Task())
+        # Not waitForDone(), which ends the pool's threads
+        deadline = time.monotonic() + 5
+        while pool.activeThreadCount() and time.monotonic() < deadline:
+            time.sleep(0.005)
+    assert len(connections) == 5
+    assert all(conn is connections[0] for conn in connections)
+    pool.waitForDone()
+
+
+def test_readers_of_ended_python_threads_are_closed(store):
+    connections = []
+    for _ in range(5):
+        thread = threading.Thread(target=lambda: connections.append(store.reader()))
+        thread.start()
+        thread.join()
+    store.reader()
+    assert len(store.readers) == 1
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
@@ -0,0 +1,86 @@
+"""Logging in as another user leaves nothing of the previous user's note in the editor or the list."""
+import hashlib
+import time
+
+import pytest
+
+from atmostnotes.store import insert_note
+
+
+@pytest.fixture
+def window(app_module, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    window = app_module.AtmostNotes()
+    window.semantic_loaded = True
+    password = hashlib.sha256(b"secret").hexdigest()
+    for name in ("alice", "bob"):
+        user_id = window.store.write('INSERT INTO users (username, password) VALUES (?, ?)', (name, password)).result()
+        for i in range(5):
+            window.store.submit(insert_note, user_id, f"{name} note {i}", f"<p>body {i}</p>", "", float(i))
+    window.store.sync()
+    monkeypatch.setattr(app_module.QMessageBox, "warning", lambda *args, **kwargs: None)
+    yield window
+    window.close()
+
+
+def login(app_module, window, monkeypatch, username):
+    replies = iter((username, "secret"))
+    monkeypatch.setattr(app_module.QInputDialog, "getText", lambda *args, **kwargs: (next(replies), True))
+    window.login()
+
+
+def settle(window):
+    from PyQt6.QtWidgets import QApplication
+    # Lets note_updated, emitted from the writer thread, reach the window
+    window.store.sync()
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        QApplication.processEvents()
+        time.sleep(0.01)
+
+
+def titles(window):
+    return [title for _, title in window.note_model.rows]
+
+
+def test_login_clears_the_editor(app_module, window, monkeypatch):
+    login(app_module, window, monkeypatch, "alice")
+    window.load_note(window.note_model.index(0))
+    alice_note = window.current_note_id
+    window.title_edit.setText("alice edited")
+    window.mark_note_dirty()
+
+    login(app_module, window, monkeypatch, "bob")
+    settle(window)
+    assert window.current_note_id is None
+    assert (window.title_edit.text(), window.content_edit.toPlainText()) == ("", "")
+    assert not window.note_dirty and not window.autosave_timer.isActive()
+    assert "alice edited" not in titles(window)
+    # The pending edit went to alice's note before the switch
+    assert window.store.reader().execute('SELECT title FROM notes WHERE id = ?', (alice_note,)).fetchone() == ("alice edited",)
+
+    window.title_edit.setText("bob's own")
+    window.mark_note_dirty()
+    window.flush_autosave()
+    settle(window)
+    assert window.current_note_id != alice_note
+    assert titles(window)[0] == "bob's own"
+
+
+def test_unchanged_save_keeps_the_list_order(app_module, window, monkeypatch):
+    login(app_module, window, monkeypatch, "alice")
+    # Saved once through the editor, so the stored HTML is what Qt writes
+    for row in (3, 4):
+        window.load_note(window.note_model.index(row))
+        window.persist_note()
+        settle(window)
+    window.load_note(window.note_model.index(1))
+    before = titles(window)
+    window.persist_note()
+    settle(window)
+    assert titles(window) == before
+
+    window.title_edit.setText("renamed")
+    window.persist_note()
+    settle(window)
+    assert titles(window)[0] == "renamed"